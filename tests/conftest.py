@@ -1,14 +1,31 @@
 import json
+import os
+import subprocess
 from pathlib import Path
 from typing import Callable, Optional, Protocol
 
 import pytest
 
 from universal_test_runner.context import Context
+from universal_test_runner.jobserver import find_jobserver
 
 OptionalStrList = Optional[list[str]]
 
 
+@pytest.fixture(autouse=True)
+def isolated_environment(tmp_path_factory, monkeypatch):
+    """
+    make sure a developer's own `UTR_*` settings don't leak into tests, and that nothing writes to the real cache
+    """
+    for name in os.environ:
+        if name.startswith("UTR_"):
+            monkeypatch.delenv(name)
+    monkeypatch.setenv("UTR_CACHE_DIR", str(tmp_path_factory.mktemp("utr-cache")))
+    # or a jobserver, if the tests themselves are run by `make`
+    monkeypatch.delenv("MAKEFLAGS", raising=False)
+    find_jobserver.cache_clear()
+
+
 @pytest.fixture
 def touch_files(tmp_path: Path):
     def _touch(files: list[str]):
@@ -111,3 +128,28 @@ def justfile_json() -> Callable[[str], str]:
         )
 
     return _justfile
+
+
+class GitCommitFunc(Protocol):
+    def __call__(self) -> None: ...
+
+
+@pytest.fixture
+def git_commit(tmp_path: Path) -> GitCommitFunc:
+    """
+    turns `tmp_path` into a git repo; call the result to commit everything in it
+    """
+
+    def _git(*args: str):
+        subprocess.run(["git", *args], cwd=tmp_path, check=True, capture_output=True)
+
+    _git("init", "-q")
+    _git("config", "user.email", "test@example.com")
+    _git("config", "user.name", "test")
+    _git("config", "commit.gpgsign", "false")
+
+    def _commit():
+        _git("add", "-A")
+        _git("commit", "-q", "--allow-empty", "-m", "commit")
+
+    return _commit
@@ -0,0 +1,529 @@
+import json
+import os
+from pathlib import Path
+from typing import Optional
+from unittest.mock import Mock, patch
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc, GitCommitFunc
+from universal_test_runner.affected import (
+    _module_index,
+    _owner,
+    _parse_imports,
+    _parse_json_stream,
+    _reverse_closure,
+    affected_test_command,
+    cargo_crates,
+    go_packages,
+    python_imports,
+    select_cargo,
+    select_go,
+    select_pytest,
+)
+from universal_test_runner.cache import mtime_key, write_cache
+
+
+def test_reverse_closure():
+    graph = {"app": {"api"}, "api": {"util"}, "util": set(), "other": {"x"}}
+
+    assert _reverse_closure(graph, {"util"}) == {"util", "api", "app"}
+    assert _reverse_closure(graph, {"app"}) == {"app"}
+    assert _reverse_closure(graph, set()) == set()
+
+
+@pytest.mark.parametrize(
+    ["path", "expected"],
+    [
+        ("main.go", "root"),
+        ("api/handler.go", "api"),
+        ("api/v2/handler.go", "api/v2"),
+        ("api/testdata/fixture.json", "api"),
+        ("docs/readme.md", "root"),
+    ],
+)
+def test_owner(path: str, expected: str):
+    assert _owner(path, {"": "root", "api": "api", "api/v2": "api/v2"}) == expected
+
+
+def test_owner_no_root():
+    assert _owner("docs/readme.md", {"api": "api"}) is None
+
+
+def test_parse_json_stream():
+    assert _parse_json_stream('{"a": 1}\n{\n  "b": [2]\n}\n') == [{"a": 1}, {"b": [2]}]
+    assert _parse_json_stream("") == []
+
+
+def _go_package(cwd: Path, path: str, **fields) -> dict:
+    return {
+        "ImportPath": f"example.com/m{'/' + path if path else ''}",
+        "Dir": str(cwd / path),
+        "Module": {"Path": "example.com/m", "Main": True},
+        **fields,
+    }
+
+
+@pytest.fixture
+def go_list(tmp_path: Path):
+    """
+    a module where `cmd` -> `api` -> `util`, and `e2e`'s tests import `api`
+    """
+    packages = [
+        {"ImportPath": "fmt", "Dir": "/usr/lib/go/src/fmt", "Standard": True},
+        {
+            "ImportPath": "github.com/dep/lib",
+            "Dir": "/go/pkg/mod/github.com/dep/lib",
+            "Module": {"Path": "github.com/dep/lib"},
+        },
+        _go_package(tmp_path, "util", Imports=["fmt"], TestGoFiles=["util_test.go"]),
+        _go_package(
+            tmp_path,
+            "api",
+            Imports=["example.com/m/util", "github.com/dep/lib"],
+            XTestGoFiles=["api_test.go"],
+            XTestImports=["example.com/m/api"],
+        ),
+        _go_package(tmp_path, "cmd", Imports=["example.com/m/api"]),
+        _go_package(
+            tmp_path,
+            "e2e",
+            TestGoFiles=["e2e_test.go"],
+            TestImports=["example.com/m/api"],
+        ),
+        _go_package(tmp_path, "", TestGoFiles=["main_test.go"]),
+    ]
+    return "\n".join(json.dumps(p, indent=2) for p in packages)
+
+
+@patch("subprocess.run")
+def test_go_packages(mock_run: Mock, go_list: str, build_context: ContextBuilderFunc):
+    mock_run.return_value.stdout = go_list
+    c = build_context(["go.mod"])
+
+    packages = go_packages(c)
+
+    assert packages is not None
+    assert sorted(packages) == [
+        "example.com/m",
+        "example.com/m/api",
+        "example.com/m/cmd",
+        "example.com/m/e2e",
+        "example.com/m/util",
+    ]
+    assert packages["example.com/m"]["dir"] == ""
+    assert packages["example.com/m/api"] == {
+        "dir": "api",
+        "has_tests": True,
+        "imports": ["example.com/m/util", "github.com/dep/lib"],
+        "test_imports": ["example.com/m/api"],
+    }
+    mock_run.assert_called_once()
+    assert mock_run.call_args.args[0] == ["go", "list", "-deps", "-json", "./..."]
+
+
+@patch("subprocess.run")
+def test_go_packages_cached(
+    mock_run: Mock, go_list: str, build_context: ContextBuilderFunc, tmp_path: Path
+):
+    mock_run.return_value.stdout = go_list
+    (tmp_path / "util").mkdir()
+    (util := tmp_path / "util" / "util.go").write_text("package util")
+
+    # touching a file changes its mtime, so only do it once
+    c = build_context(["go.mod"])
+
+    first = go_packages(c)
+    assert go_packages(c) == first
+    assert mock_run.call_count == 1
+
+    # editing a go file rebuilds the graph
+    util.write_text('package util\n\nimport "os"')
+    go_packages(c)
+    assert mock_run.call_count == 2
+
+
+@patch("subprocess.run")
+def test_go_packages_go_missing(mock_run: Mock, build_context: ContextBuilderFunc):
+    mock_run.side_effect = FileNotFoundError
+    assert go_packages(build_context(["go.mod"])) is None
+
+
+@pytest.mark.parametrize(
+    ["changed", "expected"],
+    [
+        # changes flow up through importers, but only packages with tests are run
+        (
+            ["util/strings.go"],
+            ["example.com/m/api", "example.com/m/e2e", "example.com/m/util"],
+        ),
+        (["api/server.go"], ["example.com/m/api", "example.com/m/e2e"]),
+        (["e2e/e2e_test.go"], ["example.com/m/e2e"]),
+        # nothing imports the root package
+        (["main_test.go"], ["example.com/m"]),
+        # `cmd` has no tests of its own
+        (["cmd/main.go"], []),
+        ([], []),
+    ],
+)
+@patch("subprocess.run")
+def test_select_go(
+    mock_run: Mock,
+    changed: list[str],
+    expected: list[str],
+    go_list: str,
+    build_context: ContextBuilderFunc,
+):
+    mock_run.return_value.stdout = go_list
+    c = build_context(["go.mod"])
+
+    assert select_go(commands.go_multi, c, changed) == (
+        ["go", "test", *expected] if expected else []
+    )
+
+
+@pytest.mark.parametrize("manifest", ["go.mod", "go.sum"])
+@patch("subprocess.run")
+def test_select_go_manifest_changed(
+    mock_run: Mock, manifest: str, build_context: ContextBuilderFunc
+):
+    assert (
+        select_go(commands.go_multi, build_context(["go.mod"]), ["util/a.go", manifest])
+        is None
+    )
+    mock_run.assert_not_called()
+
+
+def test_affected_test_command_unsupported(build_context: ContextBuilderFunc):
+    assert affected_test_command(commands.clojure, build_context(), "HEAD") is None
+
+
+def test_affected_test_command_not_a_repo(build_context: ContextBuilderFunc):
+    assert affected_test_command(commands.go_multi, build_context(), "HEAD") is None
+
+
+@patch("universal_test_runner.affected.go_packages")
+def test_affected_test_command(
+    mock_packages: Mock,
+    build_context: ContextBuilderFunc,
+    git_commit: GitCommitFunc,
+    tmp_path: Path,
+):
+    mock_packages.return_value = {
+        "example.com/m": {
+            "dir": "",
+            "has_tests": True,
+            "imports": [],
+            "test_imports": [],
+        }
+    }
+    (tmp_path / "go.mod").write_text("module example.com/m")
+    git_commit()
+    c = build_context()
+
+    assert affected_test_command(commands.go_multi, c, "HEAD") == []
+
+    (tmp_path / "main.go").write_text("package main")
+    assert affected_test_command(commands.go_multi, c, "HEAD") == [
+        "go",
+        "test",
+        "example.com/m",
+    ]
+
+
+@pytest.mark.parametrize(
+    ["source", "module", "is_package", "expected"],
+    [
+        ("import os, a.b.c", "m", False, ["a", "a.b", "a.b.c", "os"]),
+        ("from a.b import c, d as e", "m", False, ["a", "a.b", "a.b.c", "a.b.d"]),
+        ("from . import x", "pkg.sub.mod", False, ["pkg", "pkg.sub", "pkg.sub.x"]),
+        (
+            "from .x import y",
+            "pkg.sub",
+            True,
+            ["pkg", "pkg.sub", "pkg.sub.x", "pkg.sub.x.y"],
+        ),
+        ("from ..core import *", "pkg.sub.mod", False, ["pkg", "pkg.core"]),
+        # beyond the top-level package
+        ("from ... import x", "pkg.mod", False, []),
+        ("def f():\n    import lazy", "m", False, ["lazy"]),
+        ("this isn't python", "m", False, []),
+    ],
+)
+def test_parse_imports(source: str, module: str, is_package: bool, expected):
+    assert _parse_imports(source.encode(), module, is_package) == expected
+
+
+def test_module_index():
+    index = _module_index(
+        [
+            "src/pkg/__init__.py",
+            "src/pkg/core.py",
+            "tests/helpers.py",
+            "tests/test_core.py",
+        ]
+    )
+
+    assert index["pkg"] == {"src/pkg/__init__.py"}
+    assert index["pkg.core"] == {"src/pkg/core.py"}
+    assert index["src.pkg.core"] == {"src/pkg/core.py"}
+    # test directories are on the path
+    assert index["helpers"] == {"tests/helpers.py"}
+    assert index["tests.helpers"] == {"tests/helpers.py"}
+    # but packages aren't
+    assert "core" not in index
+
+
+@pytest.fixture
+def python_project(tmp_path: Path, git_commit: GitCommitFunc):
+    files = {
+        "pyproject.toml": "[tool.pytest.ini_options]",
+        "README.md": "hi",
+        "src/pkg/__init__.py": "",
+        "src/pkg/core.py": "def f(): ...",
+        "src/pkg/api.py": "from .core import f",
+        "src/pkg/other.py": "",
+        "tests/conftest.py": "",
+        "tests/helpers.py": "",
+        "tests/test_api.py": "from pkg.api import f",
+        "tests/test_other.py": "import pkg.other",
+        "tests/test_uses_helpers.py": "import helpers",
+    }
+    for name, text in files.items():
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text(text)
+    git_commit()
+
+
+@pytest.mark.parametrize(
+    ["changed", "expected"],
+    [
+        (["src/pkg/core.py"], ["tests/test_api.py"]),
+        (["src/pkg/__init__.py"], ["tests/test_api.py", "tests/test_other.py"]),
+        (["tests/helpers.py"], ["tests/test_uses_helpers.py"]),
+        (["tests/test_other.py"], ["tests/test_other.py"]),
+        (["README.md"], []),
+        # other files belong to the modules next to them
+        (
+            ["tests/data/cases.json"],
+            [
+                "tests/test_api.py",
+                "tests/test_other.py",
+                "tests/test_uses_helpers.py",
+            ],
+        ),
+        (["src/pkg/schema.json"], ["tests/test_api.py", "tests/test_other.py"]),
+    ],
+)
+@pytest.mark.usefixtures("python_project")
+def test_select_pytest(
+    changed: list[str], expected: list[str], build_context: ContextBuilderFunc
+):
+    c = build_context(args=["-x"])
+    result = select_pytest(commands.uv_pytest, c, changed)
+
+    assert result == (["uv", "run", "pytest", "-x", *expected] if expected else [])
+
+
+@pytest.mark.parametrize(
+    "changed",
+    [
+        ["tests/conftest.py"],
+        ["pyproject.toml"],
+        ["uv.lock"],
+        # a deleted module
+        ["src/pkg/gone.py"],
+    ],
+)
+@pytest.mark.usefixtures("python_project")
+def test_select_pytest_full_run(changed: list[str], build_context: ContextBuilderFunc):
+    assert select_pytest(commands.pytest, build_context(), changed) is None
+
+
+@pytest.mark.usefixtures("python_project")
+def test_python_imports_cache(build_context: ContextBuilderFunc, tmp_path: Path):
+    c = build_context()
+    first = python_imports(c)
+    assert first["tests/test_api.py"] == ["pkg", "pkg.api", "pkg.api.f"]
+
+    with patch("universal_test_runner.affected._parse_imports") as mock_parse:
+        assert python_imports(c) == first
+        # touched files are re-hashed, but not re-parsed
+        os.utime(tmp_path / "tests/test_api.py", ns=(0, 0))
+        assert python_imports(c) == first
+        mock_parse.assert_not_called()
+
+    (tmp_path / "tests/test_api.py").write_text("import pkg.core")
+    assert python_imports(c)["tests/test_api.py"] == ["pkg", "pkg.core"]
+
+
+@pytest.mark.usefixtures("python_project")
+def test_python_imports_unreadable_files(
+    build_context: ContextBuilderFunc, tmp_path: Path
+):
+    (tmp_path / "tests/test_broken.py").symlink_to(tmp_path / "nowhere.py")
+    (unreadable := tmp_path / "tests/test_secret.py").write_text("import pkg")
+    unreadable.chmod(0)
+
+    try:
+        imports = python_imports(build_context())
+    finally:
+        unreadable.chmod(0o644)
+
+    assert "tests/test_broken.py" not in imports
+    if os.geteuid() != 0:
+        # root can read it anyway
+        assert "tests/test_secret.py" not in imports
+    assert imports["tests/test_api.py"] == ["pkg", "pkg.api", "pkg.api.f"]
+
+
+@pytest.mark.usefixtures("python_project")
+def test_affected_test_command_pytest(
+    build_context: ContextBuilderFunc, tmp_path: Path
+):
+    (tmp_path / "src/pkg/other.py").write_text("x = 1")
+
+    assert affected_test_command(commands.pytest, build_context(), "HEAD") == [
+        "pytest",
+        "tests/test_other.py",
+    ]
+
+
+@pytest.fixture
+def cargo_metadata(tmp_path: Path) -> str:
+    """
+    a workspace where `api` depends on `core` and `cli` dev-depends on `api`
+    """
+
+    def _package(name: str, path: str, *deps: tuple[str, Optional[str]]) -> dict:
+        return {
+            "name": name,
+            "id": f"path+file://{tmp_path / path}#{name}@0.1.0",
+            "manifest_path": str(tmp_path / path / "Cargo.toml"),
+            "dependencies": [
+                {"name": dep, "path": str(tmp_path / dep), "kind": kind}
+                for dep, kind in deps
+            ],
+        }
+
+    packages = [
+        _package("core", "core"),
+        _package("api", "api", ("core", None), ("serde", None)),
+        _package("cli", "cli", ("api", "dev")),
+        _package("root", ""),
+    ]
+    # serde isn't a path dependency
+    packages[1]["dependencies"][1].pop("path")
+    return json.dumps(
+        {
+            "packages": packages,
+            "workspace_members": [p["id"] for p in packages],
+        }
+    )
+
+
+@patch("subprocess.run")
+def test_cargo_crates(
+    mock_run: Mock, cargo_metadata: str, build_context: ContextBuilderFunc
+):
+    mock_run.return_value.stdout = cargo_metadata
+    c = build_context(["Cargo.toml"])
+
+    assert cargo_crates(c) == {
+        "core": {"dir": "core", "dependencies": [], "dev_dependencies": []},
+        "api": {"dir": "api", "dependencies": ["core"], "dev_dependencies": []},
+        "cli": {"dir": "cli", "dependencies": [], "dev_dependencies": ["api"]},
+        "root": {"dir": "", "dependencies": [], "dev_dependencies": []},
+    }
+    assert mock_run.call_args.args[0] == [
+        "cargo",
+        "metadata",
+        "--format-version",
+        "1",
+        "--no-deps",
+    ]
+
+    # cached
+    cargo_crates(c)
+    assert mock_run.call_count == 1
+
+
+@patch("subprocess.run")
+def test_cargo_crates_member_changed(
+    mock_run: Mock,
+    cargo_metadata: str,
+    build_context: ContextBuilderFunc,
+    tmp_path: Path,
+):
+    mock_run.return_value.stdout = cargo_metadata
+    (tmp_path / "api").mkdir()
+    (manifest := tmp_path / "api" / "Cargo.toml").write_text("[package]")
+    c = build_context(["Cargo.toml"])
+
+    cargo_crates(c)
+    os.utime(manifest, ns=(0, 0))
+    cargo_crates(c)
+    assert mock_run.call_count == 2
+
+
+@pytest.mark.parametrize(
+    "cached",
+    [
+        {"crates": {}},
+        {"crates": {"core": {}}, "members_key": "x"},
+        {"crates": ["core"]},
+        ["core"],
+    ],
+)
+@patch("subprocess.run")
+def test_cargo_crates_unexpected_cache(
+    mock_run: Mock, cached, cargo_metadata: str, build_context: ContextBuilderFunc
+):
+    # e.g. written by an older version
+    mock_run.return_value.stdout = cargo_metadata
+    c = build_context(["Cargo.toml"])
+    write_cache(
+        "cargo-crates", c.cwd, mtime_key(c.cwd, ["Cargo.toml", "Cargo.lock"]), cached
+    )
+
+    assert "core" in (cargo_crates(c) or {})
+    mock_run.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    ["changed", "expected"],
+    [
+        (["core/src/lib.rs"], ["api", "cli", "core"]),
+        (["api/src/lib.rs"], ["api", "cli"]),
+        (["api/Cargo.toml"], ["api", "cli"]),
+        (["cli/tests/it.rs"], ["cli"]),
+        (["src/main.rs"], ["root"]),
+        ([], []),
+    ],
+)
+@patch("subprocess.run")
+def test_select_cargo(
+    mock_run: Mock,
+    changed: list[str],
+    expected: list[str],
+    cargo_metadata: str,
+    build_context: ContextBuilderFunc,
+):
+    mock_run.return_value.stdout = cargo_metadata
+    c = build_context(["Cargo.toml"], ["--", "--nocapture"])
+
+    packages = [arg for name in expected for arg in ("-p", name)]
+    assert select_cargo(commands.rust, c, changed) == (
+        ["cargo", "test", *packages, "--", "--nocapture"] if expected else []
+    )
+
+
+@pytest.mark.parametrize("manifest", ["Cargo.toml", "Cargo.lock"])
+@patch("subprocess.run")
+def test_select_cargo_manifest_changed(
+    mock_run: Mock, manifest: str, build_context: ContextBuilderFunc
+):
+    c = build_context(["Cargo.toml"])
+    assert select_cargo(commands.rust, c, ["core/src/lib.rs", manifest]) is None
+    mock_run.assert_not_called()
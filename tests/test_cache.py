@@ -0,0 +1,109 @@
+import os
+from pathlib import Path
+
+from universal_test_runner.cache import (
+    DirectoryStore,
+    atomic_write,
+    cache_dir,
+    digest,
+    mtime_key,
+    read_cache,
+    write_cache,
+)
+
+
+def test_cache_dir(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("UTR_CACHE_DIR", str(tmp_path))
+    assert cache_dir() == tmp_path
+
+    monkeypatch.delenv("UTR_CACHE_DIR")
+    monkeypatch.setenv("XDG_CACHE_HOME", "/xdg")
+    assert cache_dir() == Path("/xdg/universal-test-runner")
+
+
+def test_digest():
+    assert digest({"a": 1, "b": 2}) == digest({"b": 2, "a": 1})
+    assert digest("a", "b") != digest("ab")
+
+
+def test_mtime_key(tmp_path: Path):
+    (f := tmp_path / "package.json").write_text("{}")
+    key = mtime_key(str(tmp_path), ["package.json", "missing.lock"])
+
+    assert key == mtime_key(str(tmp_path), ["package.json", "missing.lock"])
+
+    os.utime(f, ns=(0, 0))
+    modified = mtime_key(str(tmp_path), ["package.json", "missing.lock"])
+    assert modified != key
+
+    # creating a file changes the key too
+    (tmp_path / "missing.lock").touch()
+    assert mtime_key(str(tmp_path), ["package.json", "missing.lock"]) != modified
+
+
+def test_atomic_write(tmp_path: Path):
+    target = tmp_path / "nested" / "file.json"
+    atomic_write(target, b"one")
+    atomic_write(target, b"two")
+
+    assert target.read_bytes() == b"two"
+    # no temp files are left behind
+    assert os.listdir(target.parent) == ["file.json"]
+
+
+def test_read_write_cache(tmp_path: Path):
+    cwd = str(tmp_path)
+    assert read_cache("thing", cwd, "k1") is None
+
+    write_cache("thing", cwd, "k1", {"some": ["data"]})
+    assert read_cache("thing", cwd, "k1") == {"some": ["data"]}
+    # stale keys miss
+    assert read_cache("thing", cwd, "k2") is None
+    # namespaces and projects are separate
+    assert read_cache("other", cwd, "k1") is None
+    assert read_cache("thing", str(tmp_path / "elsewhere"), "k1") is None
+
+
+def test_write_cache_ignores_errors(monkeypatch, tmp_path: Path):
+    (blocker := tmp_path / "file").touch()
+    # can't make a directory inside a file
+    monkeypatch.setenv("UTR_CACHE_DIR", str(blocker))
+
+    write_cache("thing", str(tmp_path), "k", 1)
+    assert read_cache("thing", str(tmp_path), "k") is None
+
+
+def test_directory_store(tmp_path: Path):
+    store = DirectoryStore(tmp_path / "store", max_bytes=1024)
+
+    assert store.get("abc123") is None
+    store.put("abc123", b"data")
+    assert store.get("abc123") == b"data"
+    assert (tmp_path / "store" / "ab" / "abc123").exists()
+
+
+def test_directory_store_evicts_least_recently_used(tmp_path: Path):
+    store = DirectoryStore(tmp_path, max_bytes=35)
+
+    for i, key in enumerate(["aa1", "bb2", "cc3"]):
+        store.put(key, b"x" * 10)
+        # give each entry a distinct, increasing mtime
+        os.utime(tmp_path / key[:2] / key, (i, i))
+
+    # reading bumps "aa1" to most recently used
+    assert store.get("aa1") == b"x" * 10
+
+    store.put("dd4", b"x" * 10)
+
+    assert store.get("bb2") is None
+    assert store.get("aa1") == b"x" * 10
+    assert store.get("cc3") == b"x" * 10
+    assert store.get("dd4") == b"x" * 10
+
+
+def test_directory_store_ignores_errors(tmp_path: Path):
+    (blocker := tmp_path / "file").touch()
+    store = DirectoryStore(blocker, max_bytes=1024)
+
+    store.put("abc", b"data")
+    assert store.get("abc") is None
@@ -0,0 +1,141 @@
+import gzip
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from universal_test_runner.capture import (
+    MAX_LINE_BYTES,
+    LogWriter,
+    TailBuffer,
+    is_supported,
+    run_captured,
+)
+
+
+def test_tail_buffer():
+    tail = TailBuffer(2)
+    for chunk in [b"one\ntw", b"o\nthree\nfo", b"ur"]:
+        tail.add(chunk)
+
+    assert tail.tail() == [b"two\n", b"three\n", b"four"]
+    assert tail.total == 3
+
+
+def test_tail_buffer_skips_lines_it_wont_keep():
+    tail = TailBuffer(2)
+    tail.add(b"partial")
+    tail.add(b"".join(f"{i}\n".encode() for i in range(1000)))
+
+    assert tail.tail() == [b"998\n", b"999\n"]
+    assert tail.total == 1000
+
+
+def test_tail_buffer_limits_line_length():
+    tail = TailBuffer(2)
+    tail.add(b"x" * MAX_LINE_BYTES)
+    tail.add(b"x" * MAX_LINE_BYTES + b"\n")
+
+    assert tail.tail() == [b"x" * MAX_LINE_BYTES + b"\n"]
+
+
+def test_log_writer(tmp_path: Path):
+    log = tmp_path / "out.log.gz"
+    writer = LogWriter(str(log))
+    writer.add(b"hello ")
+    writer.add(b"world\n")
+    writer.close()
+
+    assert gzip.decompress(log.read_bytes()) == b"hello world\n"
+
+
+@patch("universal_test_runner.capture.MAX_PENDING_CHUNKS", 1)
+def test_log_writer_drops_output_instead_of_waiting(tmp_path: Path, monkeypatch):
+    log = tmp_path / "out.log.gz"
+    writer = LogWriter(str(log))
+
+    # stand in for a slow disk
+    written = threading.Event()
+    unblock = threading.Event()
+    write = writer.file.write
+
+    def _slow_write(chunk: bytes):
+        written.set()
+        unblock.wait()
+        return write(chunk)
+
+    monkeypatch.setattr(writer.file, "write", _slow_write)
+    writer.add(b"first\n")
+    written.wait()
+    writer.add(b"queued\n")
+    writer.add(b"dropped\n")
+    assert writer.dropped == 8
+    unblock.set()
+    writer.close()
+
+    assert gzip.decompress(log.read_bytes()) == b"first\nqueued\n"
+
+
+needs_pty = pytest.mark.skipif(not is_supported(), reason="needs a pty")
+
+
+def _script(code: str) -> list[str]:
+    return [sys.executable, "-c", code]
+
+
+@needs_pty
+def test_run_captured_failure(tmp_path: Path, capsys):
+    log = tmp_path / "out.log.gz"
+    script = "import sys\nfor i in range(100): print(i)\nsys.exit(3)"
+
+    assert run_captured(_script(script), 2, str(log)) == 3
+
+    out, _ = capsys.readouterr()
+    assert "98 line(s) of output were hidden" in out
+    assert out.endswith("98\r\n99\r\n")
+    assert gzip.decompress(log.read_bytes()).splitlines()[-1] == b"99"
+
+
+@needs_pty
+def test_run_captured_success(capsys):
+    assert run_captured(_script("print('hi')"), 5, None) == 0
+
+    out, _ = capsys.readouterr()
+    assert "1 line(s) of output were hidden" in out
+    assert "hi\r\n" not in out
+
+
+@needs_pty
+def test_run_captured_uses_a_terminal(capsys):
+    assert (
+        run_captured(_script("import sys; sys.exit(not sys.stdout.isatty())"), 5, None)
+        == 0
+    )
+
+
+@needs_pty
+def test_run_captured_unwritable_log(tmp_path: Path, capsys):
+    assert run_captured(["true"], 5, str(tmp_path / "missing" / "out.gz")) == 1
+
+    out, _ = capsys.readouterr()
+    assert "can't write a log to" in out
+
+
+@needs_pty
+def test_run_captured_keeps_up_with_output(tmp_path: Path):
+    # a line at a time, the way test runners write, which is the worst case for a reader
+    script = "import sys\nfor i in range(100000):\n    print(i, 'x' * 80, flush=True)"
+    start = time.monotonic()
+    subprocess.run(_script(script), stdout=subprocess.DEVNULL, check=True)
+    uncaptured = time.monotonic() - start
+
+    start = time.monotonic()
+    assert run_captured(_script(script), 5, str(tmp_path / "out.log.gz")) == 0
+    captured = time.monotonic() - start
+
+    # the command should never have to wait on `t`, so capturing only adds the cost of reading
+    assert captured < uncaptured * 4 + 1
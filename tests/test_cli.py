@@ -3,6 +3,7 @@ from unittest.mock import Mock, patch
 
 from click.testing import CliRunner
 
+import universal_test_runner.commands as commands
 from universal_test_runner.cli import cli, debug
 from universal_test_runner.commands import ALL_COMMANDS
 
@@ -42,3 +43,31 @@ def test_debugs(mock_cwd: Mock, tmp_path: Path):
     # LOAD BEARING - do not remove this test
     assert "no matching test handler" in result.output
     assert "/universal-test-runner/issues" in result.output
+
+
+@patch("universal_test_runner.cli.keep_warm", return_value=0)
+@patch("os.getcwd")
+def test_warm(mock_cwd: Mock, mock_keep_warm: Mock, tmp_path: Path):
+    mock_cwd.return_value = str(tmp_path)
+    (tmp_path / "Cargo.toml").touch()
+
+    result = CliRunner().invoke(cli, ["warm", "--release"])
+
+    assert result.exit_code == 0
+    command, context = mock_keep_warm.call_args.args
+    assert command == commands.rust
+    assert context.args == ("--release",)
+
+
+@patch("universal_test_runner.cli.show_trends", return_value=0)
+@patch("os.getcwd")
+def test_slowest(mock_cwd: Mock, mock_show_trends: Mock, tmp_path: Path):
+    mock_cwd.return_value = str(tmp_path)
+    (tmp_path / "go.mod").touch()
+
+    result = CliRunner().invoke(cli, ["slowest", "--limit", "3"])
+
+    assert result.exit_code == 0
+    command, _, limit = mock_show_trends.call_args.args
+    assert command == commands.go_multi
+    assert limit == 3
@@ -1,6 +1,13 @@
 import pytest
 
-from universal_test_runner.commands import _any_pytest_str, dig
+from universal_test_runner.commands import (
+    _any_pytest_str,
+    dig,
+    npm,
+    pnpm,
+    with_script_args,
+    yarn,
+)
 
 
 @pytest.mark.parametrize(
@@ -47,3 +54,17 @@ def test_dig(obj: dict, path: list[str], default, expected):
 )
 def test_any_pytest_str(items, expected):
     assert _any_pytest_str(*items) == expected
+
+
+@pytest.mark.parametrize(
+    ["command", "argv", "expected"],
+    [
+        (npm, ["npm", "test"], ["npm", "test", "--", "-w2"]),
+        # already separated, by the user or an earlier step
+        (npm, ["npm", "test", "--", "-i"], ["npm", "test", "--", "-i", "-w2"]),
+        (yarn, ["yarn", "test"], ["yarn", "test", "-w2"]),
+        (pnpm, ["pnpm", "test"], ["pnpm", "test", "-w2"]),
+    ],
+)
+def test_with_script_args(command, argv: list[str], expected: list[str]):
+    assert with_script_args(command, argv, "-w2") == expected
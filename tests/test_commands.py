@@ -113,6 +113,8 @@ class CommandTestCase:
         CommandTestCase(commands.go_multi, ["go.mod"], args=["whatever"], passes=False),
         CommandTestCase(commands.go_single, ["go.mod"], args=["token"]),
         CommandTestCase(commands.go_single, ["parser_test.go"]),
+        CommandTestCase(commands.go_single, ["parser_test.go.orig"], passes=False),
+        CommandTestCase(commands.go_single, ["parser.go"], passes=False),
         # justfile is empty, so it won't pass
         CommandTestCase(commands.justfile, ["justfile"], passes=False),
         CommandTestCase(commands.exercism, [".exercism"]),
@@ -548,3 +550,83 @@ def test_toml_parsing_fail_to_find(
 
     # these all read as generic python because of the toml file
     assert commands.find_test_command(c) == commands.py.test_command
+
+
+@pytest.mark.parametrize(
+    ["files", "expected"],
+    [
+        ([], []),
+        (["Cargo.toml"], [commands.rust]),
+        # a rust core with js bindings
+        (["Cargo.toml", "bun.lockb"], [commands.rust, commands.bun]),
+        # fallbacks in the same ecosystem are dropped
+        ([".pytest_cache", "pyproject.toml"], [commands.pytest]),
+        ([".pytest_cache", "uv.lock", "manage.py"], [commands.uv_pytest]),
+        (["go.mod", "parser_test.go", "mix.exs"], [commands.go_multi, commands.elixir]),
+        # task runners cover the whole project
+        (["advent", "Cargo.toml", "go.mod"], [commands.advent_of_code]),
+    ],
+)
+@patch("subprocess.run")
+def test_find_all_commands(
+    mock_run: Mock, files: list[str], expected, build_context: ContextBuilderFunc
+):
+    mock_run.side_effect = lambda *_, **__: pytest.fail(
+        "this test shouldn't be shelling out at all"
+    )
+
+    c = build_context(files)
+    assert commands.find_all_commands(c) == expected
+
+
+def test_ecosystems():
+    """
+    alternative ways of running the same tests must share an ecosystem, or polyglot mode will run them all
+    """
+    assert {
+        c.family
+        for c in [
+            commands.uv_pytest,
+            commands.pdm_pytest,
+            commands.poetry_pytest,
+            commands.pytest,
+            commands.django,
+            commands.py,
+        ]
+    } == {commands.PYTHON}
+    assert commands.go_multi.family == commands.go_single.family == commands.GO
+    assert {
+        c.family for c in [commands.npm, commands.yarn, commands.pnpm, commands.bun]
+    } == {commands.JAVASCRIPT}
+    assert commands.rust.family == "rust"
+
+
+def test_pattern_matcher():
+    matcher = commands.PatternMatcher(["*_test.go", "*.go", "*.csproj", "*.go"])
+
+    assert matcher.patterns == ("*_test.go", "*.go", "*.csproj")
+    assert matcher.find([]) == frozenset()
+    assert matcher.find(["README.md", "main.go"]) == {"*.go"}
+    # one filename can match several globs
+    assert matcher.find(["main_test.go", "App.csproj"]) == {
+        "*_test.go",
+        "*.go",
+        "*.csproj",
+    }
+
+
+def test_pattern_matcher_stops_early():
+    matcher = commands.PatternMatcher(["*.sln", "*.csproj"])
+    seen = []
+
+    def _filenames():
+        for name in ["App.sln", "a.txt", "App.csproj", "b.txt", "c.txt"]:
+            seen.append(name)
+            yield name
+
+    assert matcher.find(_filenames()) == {"*.sln", "*.csproj"}
+    assert seen == ["App.sln", "a.txt", "App.csproj"]
+
+
+def test_file_patterns_are_compiled():
+    assert commands.GO_TEST_FILE in commands.FILE_PATTERNS.patterns
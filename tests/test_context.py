@@ -203,3 +203,13 @@ def test_reading_missing_files(build_context: ContextBuilderFunc):
     assert c.read_toml("missing_toml") == {}
     assert c.load_file("empty_str") == ""
     assert c.read_file("empty_lines") == []
+
+
+def test_consulted(build_context: ContextBuilderFunc):
+    c = build_context(["package.json", "yarn.lock"])
+
+    c.has_any_files("Cargo.toml", "go.mod")
+    c.read_json("package.json")
+    c.read_file("tox.ini")
+
+    assert c.consulted == {"Cargo.toml", "go.mod", "package.json", "tox.ini"}
@@ -0,0 +1,142 @@
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+import universal_test_runner.commands as commands
+import universal_test_runner.cpus as cpus
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.cpus import (
+    cgroup_cpu_limit,
+    effective_cpus,
+    parallelism_args,
+)
+
+
+@pytest.fixture
+def cgroup(tmp_path: Path, monkeypatch):
+    """
+    a fake cgroup v2 tree, with this process in `/pods/test`
+    """
+    monkeypatch.setattr(cpus, "CGROUP_ROOT", tmp_path)
+    monkeypatch.setattr(cpus, "_cgroup_path", lambda: "/pods/test")
+    (tmp_path / "pods" / "test").mkdir(parents=True)
+
+    def _set_limit(path: str, value: str):
+        (tmp_path / path / "cpu.max").write_text(f"{value}\n")
+
+    return _set_limit
+
+
+def test_no_cgroup_limit(cgroup):
+    cgroup("", "max 100000")
+    cgroup("pods/test", "max 100000")
+
+    assert cgroup_cpu_limit() is None
+
+
+def test_cgroup_limit(cgroup):
+    cgroup("pods/test", "150000 100000")
+
+    assert cgroup_cpu_limit() == 1.5
+
+
+def test_cgroup_limit_from_ancestor(cgroup):
+    cgroup("pods", "200000 100000")
+    cgroup("pods/test", "400000 100000")
+
+    assert cgroup_cpu_limit() == 2
+
+
+@patch("universal_test_runner.cpus.cgroup_cpu_limit", return_value=2.5)
+@patch("os.sched_getaffinity", create=True, return_value={0, 1, 2, 3, 4, 5})
+def test_effective_cpus_quota(_affinity: Mock, _limit: Mock):
+    assert effective_cpus() == 3
+
+
+@patch("universal_test_runner.cpus.cgroup_cpu_limit", return_value=None)
+@patch("os.sched_getaffinity", create=True, return_value={2, 3})
+def test_effective_cpus_affinity(_affinity: Mock, _limit: Mock):
+    assert effective_cpus() == 2
+
+
+@patch("universal_test_runner.cpus.cgroup_cpu_limit", return_value=None)
+@patch("os.sched_getaffinity", create=True, return_value={0, 1, 2, 3})
+def test_effective_cpus_pinned(_affinity: Mock, _limit: Mock, monkeypatch):
+    monkeypatch.setenv("UTR_CPUS", "2-3")
+    assert effective_cpus() == 2
+
+
+@patch("universal_test_runner.cpus.cgroup_cpu_limit", return_value=0.1)
+@patch("os.sched_getaffinity", create=True, return_value={0})
+def test_effective_cpus_at_least_one(_affinity: Mock, _limit: Mock):
+    assert effective_cpus() == 1
+
+
+@pytest.mark.parametrize(
+    ["command", "args", "expected"],
+    [
+        (commands.go_multi, [], ["-p", "4"]),
+        (commands.go_single, ["-parallel", "2"], ["-parallel", "2", "-p", "4"]),
+        (commands.go_single, ["-p=2"], ["-p=2"]),
+        (commands.rust, [], ["-j", "4", "--", "--test-threads", "4"]),
+        (
+            commands.rust,
+            ["--release", "--", "--nocapture"],
+            ["--release", "-j", "4", "--", "--nocapture", "--test-threads", "4"],
+        ),
+        (
+            commands.rust,
+            ["-j2", "--", "--test-threads=1"],
+            ["-j2", "--", "--test-threads=1"],
+        ),
+        (commands.makefile, [], ["-j4"]),
+        (commands.makefile, ["--jobs=2"], ["--jobs=2"]),
+        (commands.django, ["app"], ["app", "--parallel", "4"]),
+        (commands.django, ["--parallel", "auto"], ["--parallel", "auto"]),
+        (commands.clojure, ["-x"], ["-x"]),
+    ],
+)
+def test_parallelism_args(command, args, expected, build_context: ContextBuilderFunc):
+    assert parallelism_args(command, build_context(args=args), 4) == expected
+
+
+@pytest.mark.parametrize(
+    ["args", "expected"],
+    [
+        ([], ["-n", "4"]),
+        (["-k", "thing"], ["-k", "thing", "-n", "4"]),
+        (["-nauto"], ["-nauto"]),
+        (["--numprocesses=2"], ["--numprocesses=2"]),
+    ],
+)
+def test_parallelism_args_xdist(
+    args, expected, tmp_path: Path, build_context: ContextBuilderFunc
+):
+    (tmp_path / ".venv/lib/python3.12/site-packages/xdist").mkdir(parents=True)
+    c = build_context(args=args)
+
+    assert parallelism_args(commands.uv_pytest, c, 4) == expected
+
+
+def test_parallelism_args_no_xdist(build_context: ContextBuilderFunc):
+    assert parallelism_args(commands.pytest, build_context(), 4) == []
+
+
+@pytest.mark.parametrize(
+    ["command", "script", "args", "expected"],
+    [
+        (commands.npm, "jest", [], ["--", "--maxWorkers=4"]),
+        (commands.npm, "jest --ci", ["--", "-u"], ["--", "-u", "--maxWorkers=4"]),
+        (commands.yarn, "jest", [], ["--maxWorkers=4"]),
+        (commands.yarn, "jest", ["-w", "2"], ["-w", "2"]),
+        (commands.pnpm, "vitest", [], []),
+    ],
+)
+def test_parallelism_args_jest(
+    command, script, args, expected, tmp_path: Path, build_context: ContextBuilderFunc
+):
+    (tmp_path / "package.json").write_text(f'{{"scripts": {{"test": "{script}"}}}}')
+    c = build_context(args=args)
+
+    assert parallelism_args(command, c, 4) == expected
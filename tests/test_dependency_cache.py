@@ -0,0 +1,184 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.dependency_cache import (
+    CACHE_SPECS,
+    SIZE_FILE,
+    USED_FILE,
+    dependency_cache,
+    evict,
+    is_supported,
+    lockfile_hash,
+    remove_entry,
+)
+
+pytestmark = pytest.mark.skipif(not is_supported(), reason="needs fcntl")
+
+
+@pytest.fixture
+def store(tmp_path: Path, monkeypatch) -> Path:
+    root = tmp_path / "store"
+    monkeypatch.setenv("UTR_CI_CACHE_DIR", str(root))
+    return root
+
+
+def _entry(root: Path, name: str, size: int, used: float) -> Path:
+    entry = root / name
+    entry.mkdir(parents=True)
+    (entry / "data").write_bytes(b"x" * size)
+    for marker, text in [(USED_FILE, ""), (SIZE_FILE, str(size))]:
+        (entry / marker).write_text(text)
+        os.utime(entry / marker, (used, used))
+    return entry
+
+
+def test_lockfile_hash(build_context: ContextBuilderFunc, tmp_path: Path):
+    c = build_context()
+    spec = CACHE_SPECS[commands.bun]
+    assert lockfile_hash(spec, c.cwd) is None
+
+    (tmp_path / "bun.lockb").write_bytes(b"binary")
+    binary = lockfile_hash(spec, c.cwd)
+    # the text lockfile is preferred
+    (tmp_path / "bun.lock").write_text("text")
+    assert binary != lockfile_hash(spec, c.cwd)
+
+
+def test_dependency_cache(
+    build_context: ContextBuilderFunc, store: Path, tmp_path: Path, monkeypatch
+):
+    monkeypatch.setenv("GOCACHE", "/mine")
+    monkeypatch.delenv("GOMODCACHE", raising=False)
+    (tmp_path / "go.sum").write_text("example.com/a v1.0.0 h1:abc\n")
+    c = build_context()
+
+    with dependency_cache(commands.go_single, c) as entry:
+        assert entry
+        assert entry.parent == store
+        assert entry.name.startswith("go_single-")
+        assert os.environ["GOCACHE"] == str(entry / "GOCACHE")
+        assert os.environ["GOMODCACHE"] == str(entry / "GOMODCACHE")
+        Path(os.environ["GOCACHE"]).mkdir()
+        (Path(os.environ["GOCACHE"]) / "object").write_bytes(b"x" * 10_000)
+
+    assert os.environ["GOCACHE"] == "/mine"
+    assert "GOMODCACHE" not in os.environ
+    assert (entry / USED_FILE).exists()
+    # measured by the eviction that followed
+    assert int((entry / SIZE_FILE).read_text()) >= 10_000
+
+    # the same lockfile gets the same entry, and a different one doesn't
+    with dependency_cache(commands.go_multi, c) as other:
+        assert other != entry
+    with dependency_cache(commands.go_single, c) as same:
+        assert same == entry
+    (tmp_path / "go.sum").write_text("example.com/a v1.0.1 h1:def\n")
+    with dependency_cache(commands.go_single, c) as changed:
+        assert changed != entry
+
+
+def test_dependency_cache_unsupported_command(
+    build_context: ContextBuilderFunc, store: Path
+):
+    with dependency_cache(commands.makefile, build_context()) as entry:
+        assert entry is None
+    assert not store.exists()
+
+
+def test_evict(store: Path):
+    oldest = _entry(store, "oldest", 1000, 100)
+    in_use = _entry(store, "in-use", 1000, 200)
+    current = _entry(store, "current", 1000, 50)
+    newest = _entry(store, "newest", 1000, 300)
+
+    import fcntl
+
+    with open(store / "in-use.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        evict(store, 2500, current)
+
+    # the entry in use is skipped, so a newer one goes instead
+    assert not oldest.exists()
+    assert in_use.exists()
+    assert current.exists()
+    assert not newest.exists()
+    # evicted entries don't leave their lock files behind
+    assert not (store / "oldest.lock").exists()
+    assert not (store / "newest.lock").exists()
+
+    evict(store, 1500, current)
+    assert not in_use.exists()
+    assert current.exists()
+    assert not (store / "in-use.lock").exists()
+
+
+def test_dependency_cache_relocks_an_evicted_entry(
+    build_context: ContextBuilderFunc, store: Path, tmp_path: Path
+):
+    (tmp_path / "go.sum").write_text("example.com/a v1.0.0 h1:abc\n")
+    c = build_context()
+    with dependency_cache(commands.go_single, c) as entry:
+        assert entry
+    lock_path = entry.with_name(entry.name + ".lock")
+    stale = lock_path.stat().st_ino
+
+    # simulate the eviction finishing between opening the lock file and locking it
+    real_open = open
+
+    def evicting_open(path, *args, **kwargs):
+        f = real_open(path, *args, **kwargs)
+        if Path(path) == lock_path and lock_path.stat().st_ino == stale:
+            lock_path.unlink()
+        return f
+
+    with patch("builtins.open", evicting_open):
+        with dependency_cache(commands.go_single, c) as entry:
+            assert entry
+            assert lock_path.exists()
+            assert lock_path.stat().st_ino != stale
+
+
+def test_dependency_cache_doesnt_measure_every_run(
+    build_context: ContextBuilderFunc, store: Path, tmp_path: Path
+):
+    (tmp_path / "go.sum").write_text("example.com/a v1.0.0 h1:abc\n")
+    c = build_context()
+    with dependency_cache(commands.go_single, c):
+        pass
+
+    with patch("universal_test_runner.dependency_cache.disk_usage") as mock_usage:
+        with dependency_cache(commands.go_single, c) as entry:
+            assert entry
+        mock_usage.assert_not_called()
+    # it was still marked as used
+    assert (entry / USED_FILE).stat().st_mtime >= (entry / SIZE_FILE).stat().st_mtime
+
+
+def test_evict_measures_entries_used_since(store: Path):
+    entry = _entry(store, "entry", 1000, 100)
+    (entry / "more").write_bytes(b"x" * 100_000)
+    os.utime(entry / USED_FILE, (200, 200))
+    untouched = _entry(store, "untouched", 1000, 100)
+
+    evict(store, 10**9, entry)
+
+    assert int((entry / SIZE_FILE).read_text()) >= 100_000
+    assert (untouched / SIZE_FILE).read_text() == "1000"
+
+
+def test_remove_entry_with_read_only_files(tmp_path: Path):
+    # like go's module cache
+    module = tmp_path / "entry" / "GOMODCACHE" / "example.com" / "a@v1.0.0"
+    module.mkdir(parents=True)
+    (module / "a.go").write_text("package a")
+    for path in [module / "a.go", module]:
+        path.chmod(0o444 if path.is_file() else 0o555)
+
+    remove_entry(tmp_path / "entry")
+
+    assert not (tmp_path / "entry").exists()
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import socket
+from typing import Callable
+from unittest.mock import patch
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.distributed import (
+    KEEPALIVE_IDLE,
+    KEEPALIVE_INTERVAL,
+    KEEPALIVE_PROBES,
+    MAX_ATTEMPTS,
+    Coordinator,
+    CoordinatorClient,
+    enable_keepalive,
+    parse_address,
+    run_coordinator,
+)
+from universal_test_runner.parallel import Job, JobResult
+
+
+@pytest.mark.parametrize(
+    ["address", "expected"],
+    [
+        ("localhost:8000", ("localhost", 8000)),
+        ("10.0.0.1:1", ("10.0.0.1", 1)),
+        ("[::1]:8000", ("::1", 8000)),
+        ("localhost", None),
+        (":8000", None),
+        ("localhost:http", None),
+    ],
+)
+def test_parse_address(address, expected):
+    assert parse_address(address) == expected
+
+
+def coordinate(
+    units: list[str], *workers: Callable[[tuple[str, int]], None]
+) -> list[JobResult]:
+    """
+    serve `units` while each worker runs (one after another), then return the results
+    """
+
+    async def _run():
+        # a connection handler that raises is only logged, so it's caught here instead
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context)
+        )
+        coordinator = Coordinator(
+            commands.pytest, [Job(u, ["pytest", u]) for u in units]
+        )
+        server = await asyncio.start_server(coordinator.handle, "127.0.0.1", 0)
+        address = server.sockets[0].getsockname()[:2]
+        async with server:
+            for worker in workers:
+                await asyncio.get_running_loop().run_in_executor(None, worker, address)
+            await asyncio.wait_for(coordinator.drained.wait(), 5)
+        assert not errors
+        return coordinator.ordered_results()
+
+    return asyncio.run(_run())
+
+
+def passing_worker(returncodes: dict[str, int]):
+    def _work(address):
+        with CoordinatorClient(address) as client:
+            result = None
+            while assignment := client.next_unit(result):
+                command, unit = assignment
+                assert command == commands.pytest
+                result = {
+                    "unit": unit,
+                    "returncode": returncodes.get(unit, 0),
+                    "duration": 1.5,
+                }
+
+    return _work
+
+
+def dying_worker(address):
+    # takes a unit and disconnects without reporting back
+    with CoordinatorClient(address) as client:
+        assert client.next_unit()
+
+
+def test_coordinate():
+    results = coordinate(["a.py", "b.py", "c.py"], passing_worker({"b.py": 2}))
+
+    assert [(r.job.label, r.returncode, r.duration) for r in results] == [
+        ("a.py", 0, 1.5),
+        ("b.py", 2, 1.5),
+        ("c.py", 0, 1.5),
+    ]
+
+
+def test_coordinate_requeues_units_from_dead_workers():
+    results = coordinate(["a.py", "b.py"], dying_worker, passing_worker({}))
+
+    assert [(r.job.label, r.returncode) for r in results] == [
+        ("a.py", 0),
+        ("b.py", 0),
+    ]
+
+
+def garbled_worker(*messages: bytes):
+    # takes a unit, then sends something that isn't a valid message
+    def _work(address):
+        with socket.create_connection(address) as sock:
+            stream = sock.makefile("rwb")
+            stream.write(b'{"worker": "garbled"}\n')
+            stream.flush()
+            assert json.loads(stream.readline())["unit"]
+            for message in messages:
+                stream.write(message + b"\n")
+            stream.flush()
+            # the coordinator hangs up
+            assert stream.readline() == b""
+
+    return _work
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        b"[1, 2]",
+        b'"result"',
+        b"3",
+        b'{"result": [0]}',
+        b'{"result": {"returncode": [1]}}',
+    ],
+)
+def test_coordinate_drops_workers_sending_unexpected_messages(message: bytes):
+    results = coordinate(["a.py", "b.py"], garbled_worker(message), passing_worker({}))
+
+    assert [(r.job.label, r.returncode) for r in results] == [
+        ("a.py", 0),
+        ("b.py", 0),
+    ]
+
+
+def test_coordinate_gives_up_on_units_that_kill_workers():
+    results = coordinate(
+        ["a.py", "b.py"], *[dying_worker] * MAX_ATTEMPTS, passing_worker({})
+    )
+
+    assert [(r.job.label, r.returncode) for r in results] == [
+        ("a.py", 1),
+        ("b.py", 0),
+    ]
+
+
+def test_coordinate_nothing_to_do():
+    assert coordinate([]) == []
+
+
+def assert_keepalive(sock: socket.socket):
+    assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE)
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        assert (
+            sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE) == KEEPALIVE_IDLE
+        )
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        assert (
+            sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL)
+            == KEEPALIVE_INTERVAL
+        )
+    if hasattr(socket, "TCP_KEEPCNT"):
+        assert (
+            sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT) == KEEPALIVE_PROBES
+        )
+
+
+def test_enable_keepalive():
+    with socket.socket() as sock:
+        enable_keepalive(sock)
+        assert_keepalive(sock)
+
+
+def test_coordinate_probes_quiet_workers():
+    # so a worker whose machine vanished mid-unit is noticed in about a minute, not hours
+    with patch(
+        "universal_test_runner.distributed.enable_keepalive",
+        side_effect=lambda sock: (enable_keepalive(sock), assert_keepalive(sock)),
+    ) as keepalive:
+        coordinate(["a.py"], passing_worker({}))
+
+    keepalive.assert_called_once()
+
+
+def test_client_coordinator_gone():
+    server = socket.create_server(("127.0.0.1", 0))
+    address = server.getsockname()[:2]
+
+    with CoordinatorClient(address) as client:
+        conn, _ = server.accept()
+        conn.close()
+        with pytest.raises(ConnectionError):
+            client.next_unit()
+    server.close()
+
+
+@pytest.mark.parametrize("command", [None, commands.makefile])
+def test_run_coordinator_unsupported(
+    command, build_context: ContextBuilderFunc, capsys
+):
+    assert run_coordinator(command, build_context(), "127.0.0.1", 0) == 1
+
+    out, _ = capsys.readouterr()
+    assert "can't be split up between workers" in out
@@ -0,0 +1,108 @@
+import json
+import os
+import sys
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.env_sync import is_synced, synced_environment
+
+
+@pytest.fixture
+def venv(tmp_path: Path) -> Path:
+    (tmp_path / "uv.lock").write_text("version = 1\n")
+    (tmp_path / "pyproject.toml").write_text("[project]\nname = 'a'\n")
+    (prefix := tmp_path / ".venv").mkdir()
+    (prefix / "pyvenv.cfg").write_text("version_info = 3.12.1\n")
+    return prefix
+
+
+def _manager(venv: Path, returncode: int = 0) -> Mock:
+    """
+    a fake `subprocess.run` for the package manager: syncing returns `returncode`, and the probe finds `venv`
+    """
+
+    def _run(argv, **kwargs):
+        if "-c" in argv:
+            return Mock(stdout=json.dumps([str(venv), sys.executable]).encode())
+        return Mock(returncode=returncode)
+
+    return Mock(side_effect=_run)
+
+
+def test_syncs_once(build_context: ContextBuilderFunc, venv: Path, capsys):
+    c = build_context()
+    with patch("subprocess.run", _manager(venv)) as subp_run:
+        with synced_environment(commands.uv_pytest, c) as returncode:
+            assert returncode == 0
+            assert os.environ["UV_NO_SYNC"] == "1"
+        assert "UV_NO_SYNC" not in os.environ
+
+        subp_run.assert_any_call(["uv", "sync", "--inexact"], cwd=c.cwd)
+        assert "uv sync --inexact (the environment changed)" in capsys.readouterr().out
+        assert is_synced(commands.uv_pytest, c)
+
+        subp_run.reset_mock()
+        with synced_environment(commands.uv_pytest, c) as returncode:
+            assert returncode == 0
+        subp_run.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda venv: (venv.parent / "uv.lock").write_text("version = 2\n"),
+        lambda venv: (venv.parent / "pyproject.toml").write_text("[project]\n"),
+        lambda venv: (venv.parent / ".python-version").write_text("3.13\n"),
+        # a different interpreter
+        lambda venv: (venv / "pyvenv.cfg").write_text("version_info = 3.13.0\n"),
+        # or the environment was deleted
+        lambda venv: (venv / "pyvenv.cfg").unlink(),
+    ],
+)
+def test_resyncs_after_changes(build_context: ContextBuilderFunc, venv: Path, change):
+    c = build_context()
+    with patch("subprocess.run", _manager(venv)):
+        with synced_environment(commands.uv_pytest, c):
+            pass
+    assert is_synced(commands.uv_pytest, c)
+
+    change(venv)
+
+    assert not is_synced(commands.uv_pytest, c)
+
+
+def test_failed_sync(build_context: ContextBuilderFunc, venv: Path, capsys):
+    c = build_context()
+    with patch("subprocess.run", _manager(venv, returncode=2)):
+        with synced_environment(commands.uv_pytest, c) as returncode:
+            assert returncode == 2
+            assert "UV_NO_SYNC" not in os.environ
+
+    assert "couldn't sync the environment with `uv sync --inexact`" in (
+        capsys.readouterr().out
+    )
+    assert not is_synced(commands.uv_pytest, c)
+
+
+def test_missing_manager(build_context: ContextBuilderFunc, venv: Path, capsys):
+    c = build_context()
+    with patch("subprocess.run", side_effect=FileNotFoundError):
+        with synced_environment(commands.poetry_pytest, c) as returncode:
+            assert returncode == 1
+
+    assert "command not found: poetry" in capsys.readouterr().out
+
+
+def test_unknown_environment(build_context: ContextBuilderFunc, venv: Path):
+    c = build_context()
+    manager = Mock(side_effect=lambda argv, **kwargs: Mock(returncode=0, stdout=b""))
+    with patch("subprocess.run", manager):
+        with synced_environment(commands.pdm_pytest, c) as returncode:
+            assert returncode == 0
+
+    # without knowing where it is, there's nothing to fingerprint
+    assert not is_synced(commands.pdm_pytest, c)
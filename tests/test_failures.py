@@ -0,0 +1,262 @@
+from unittest.mock import patch
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.failures import (
+    MAX_FAILURES,
+    FailureTracker,
+    failure_runs,
+    load_failures,
+    record_failures,
+)
+
+
+def _end(test: str, outcome: str, suite="pkg", **extra):
+    return {
+        "event": "end",
+        "suite": suite,
+        "test": test,
+        "outcome": outcome,
+        "duration": 0.1,
+        **extra,
+    }
+
+
+def test_failure_tracker():
+    tracker = FailureTracker(
+        [
+            {"suite": "pkg", "test": "TestFixed"},
+            {"suite": "pkg", "test": "TestNotRun"},
+            {"suite": "pkg", "test": "TestStillBroken"},
+        ]
+    )
+    for event in [
+        {"event": "start", "suite": "pkg", "test": "TestNew"},
+        _end("TestNew", "failed", file="a_test.go", line=3),
+        _end("TestFixed", "passed"),
+        _end("TestStillBroken", "error"),
+        _end("TestPassing", "passed"),
+    ]:
+        tracker.add(event)
+
+    assert tracker.failures() == [
+        {"suite": "pkg", "test": "TestNotRun"},
+        {"suite": "pkg", "test": "TestStillBroken"},
+        {"suite": "pkg", "test": "TestNew", "file": "a_test.go", "line": 3},
+    ]
+
+
+def test_failure_tracker_is_capped():
+    tracker = FailureTracker([])
+    for i in range(MAX_FAILURES + 10):
+        tracker.add(_end(f"Test{i}", "failed"))
+
+    assert len(tracker.failures()) == MAX_FAILURES
+
+
+def test_record_failures(build_context: ContextBuilderFunc):
+    c = build_context()
+    assert load_failures(commands.go_single, c) == []
+
+    tracker = FailureTracker([])
+    tracker.add(_end("TestA", "failed"))
+    record_failures(commands.go_single, c, tracker)
+
+    assert load_failures(commands.go_single, c) == [{"suite": "pkg", "test": "TestA"}]
+    assert load_failures(commands.rust, c) == []
+
+
+GO_FAILURES = [
+    {"suite": "example.com/a", "test": "TestA/sub.case"},
+    {"suite": "example.com/b", "test": "TestB"},
+]
+
+
+@pytest.mark.parametrize(
+    ["rerun_only", "expected"],
+    [
+        (
+            True,
+            [
+                [
+                    "go",
+                    "test",
+                    "-v",
+                    "-run",
+                    "^(TestA|TestB)$",
+                    "example.com/a",
+                    "example.com/b",
+                ]
+            ],
+        ),
+        (
+            False,
+            [
+                [
+                    "go",
+                    "test",
+                    "-v",
+                    "-run",
+                    "^(TestA|TestB)$",
+                    "example.com/a",
+                    "example.com/b",
+                ],
+                ["go", "test", "./...", "-v", "-skip", "^(TestA|TestB)$"],
+            ],
+        ),
+    ],
+)
+def test_failure_runs_go(rerun_only, expected, build_context: ContextBuilderFunc):
+    c = build_context(args=["-v"])
+
+    assert (
+        failure_runs(
+            commands.go_multi,
+            c,
+            GO_FAILURES,
+            ["go", "test", "./...", "-v"],
+            rerun_only,
+        )
+        == expected
+    )
+
+
+def test_failure_runs_go_selection(build_context: ContextBuilderFunc):
+    c = build_context()
+    # e.g. a shard, which only has one of the failing packages
+    argv = ["go", "test", "example.com/b", "example.com/c"]
+
+    assert failure_runs(commands.go_multi, c, GO_FAILURES, argv, False) == [
+        ["go", "test", "-run", "^(TestA|TestB)$", "example.com/b"],
+        [*argv, "-skip", "^(TestA|TestB)$"],
+    ]
+    # and one that has none of them runs as usual
+    assert failure_runs(
+        commands.go_multi, c, GO_FAILURES, ["go", "test", "example.com/c"], False
+    ) == [["go", "test", "example.com/c"]]
+
+
+def test_failure_runs_cargo_selection(build_context: ContextBuilderFunc):
+    c = build_context()
+    failures = [{"test": "tests::a"}]
+    argv = ["cargo", "test", "-p", "core"]
+
+    assert failure_runs(commands.rust, c, failures, argv, False) == [
+        [*argv, "--", "tests::a", "--exact"],
+        [*argv, "--", "--skip", "tests::a", "--exact"],
+    ]
+
+
+def test_failure_runs_cargo(build_context: ContextBuilderFunc):
+    c = build_context(args=["--release", "--", "--nocapture"])
+    failures = [{"test": "tests::b"}, {"test": "tests::a"}]
+
+    argv = ["cargo", "test", "--release", "--", "--nocapture"]
+
+    assert failure_runs(commands.rust, c, failures, argv, False) == [
+        [
+            "cargo",
+            "test",
+            "--release",
+            "--",
+            "--nocapture",
+            "tests::a",
+            "tests::b",
+            "--exact",
+        ],
+        [
+            "cargo",
+            "test",
+            "--release",
+            "--",
+            "--nocapture",
+            "--skip",
+            "tests::a",
+            "--skip",
+            "tests::b",
+            "--exact",
+        ],
+    ]
+
+
+@patch("universal_test_runner.failures.uses_jest")
+def test_failure_runs_jest(mock_uses_jest, build_context: ContextBuilderFunc):
+    mock_uses_jest.return_value = True
+    c = build_context()
+    failures = [{"suite": "src/a.test.js", "test": "adds (1+1)"}]
+
+    assert failure_runs(commands.npm, c, failures, ["npm", "test"], False) == [
+        [
+            "npm",
+            "test",
+            "--",
+            "src/a.test.js",
+            r"--testNamePattern=^(?:adds \(1\+1\))$",
+        ],
+        ["npm", "test", "--", r"--testNamePattern=^(?!(?:adds \(1\+1\))$)"],
+    ]
+
+
+@patch("universal_test_runner.failures.uses_jest")
+def test_failure_runs_jest_selection(mock_uses_jest, build_context: ContextBuilderFunc):
+    mock_uses_jest.return_value = True
+    c = build_context()
+    failures = [
+        {"suite": "src/a.test.js", "test": "a"},
+        {"suite": "src/c.test.js", "test": "c"},
+    ]
+    argv = ["npm", "test", "--", "src/a.test.js", "src/b.test.js"]
+
+    assert failure_runs(commands.npm, c, failures, argv, False) == [
+        ["npm", "test", "--", "src/a.test.js", "--testNamePattern=^(?:a|c)$"],
+        [*argv, "--testNamePattern=^(?!(?:a|c)$)"],
+    ]
+
+
+@patch("universal_test_runner.failures.uses_jest")
+def test_failure_runs_other_js(mock_uses_jest, build_context: ContextBuilderFunc):
+    mock_uses_jest.return_value = False
+    c = build_context()
+    failures = [{"suite": "src/a.test.ts", "test": "adds"}]
+
+    # without a way to skip tests, the full run repeats the failed files
+    assert failure_runs(commands.yarn, c, failures, ["yarn", "test"], False) == [
+        ["yarn", "test", "src/a.test.ts"],
+        ["yarn", "test"],
+    ]
+
+
+def test_failure_runs_exunit(build_context: ContextBuilderFunc):
+    c = build_context()
+    failures = [
+        {
+            "suite": "MathTest",
+            "test": "test adds",
+            "file": "test/math_test.exs",
+            "line": 4,
+        },
+        {"suite": "MathTest", "test": "test no location"},
+    ]
+
+    assert failure_runs(commands.elixir, c, failures, ["mix", "test"], True) == [
+        ["mix", "test", "test/math_test.exs:4"]
+    ]
+
+
+def test_failure_runs_exunit_selection(build_context: ContextBuilderFunc):
+    c = build_context()
+    failures = [{"test": "test adds", "file": "test/math_test.exs", "line": 4}]
+
+    assert failure_runs(
+        commands.elixir, c, failures, ["mix", "test", "test/other_test.exs"], True
+    ) == [["mix", "test", "test/other_test.exs"]]
+
+
+def test_failure_runs_without_locations(build_context: ContextBuilderFunc):
+    c = build_context()
+
+    assert failure_runs(
+        commands.elixir, c, [{"test": "test adds"}], ["mix", "test"], True
+    ) == [["mix", "test"]]
@@ -0,0 +1,95 @@
+import subprocess
+from pathlib import Path
+
+from tests.conftest import GitCommitFunc
+from universal_test_runner.git import (
+    changed_files,
+    dirty_files,
+    index_entries,
+    repo_root,
+)
+
+
+def test_changed_files(tmp_path: Path, git_commit: GitCommitFunc):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "committed.txt").write_text("a")
+    (tmp_path / "sub" / "nested.txt").write_text("a")
+    (tmp_path / ".gitignore").write_text("ignored.txt\n")
+    git_commit()
+
+    assert changed_files(str(tmp_path), "HEAD") == []
+
+    (tmp_path / "committed.txt").write_text("b")
+    (tmp_path / "sub" / "nested.txt").write_text("b")
+    (tmp_path / "sub" / "new.txt").write_text("b")
+    (tmp_path / "ignored.txt").write_text("b")
+
+    assert changed_files(str(tmp_path), "HEAD") == [
+        "committed.txt",
+        "sub/nested.txt",
+        "sub/new.txt",
+    ]
+    # paths are relative to (and limited to) the directory
+    assert changed_files(str(tmp_path / "sub"), "HEAD") == ["nested.txt", "new.txt"]
+
+
+def test_changed_files_since_older_commit(tmp_path: Path, git_commit: GitCommitFunc):
+    git_commit()
+    (tmp_path / "later.txt").write_text("a")
+    git_commit()
+
+    assert changed_files(str(tmp_path), "HEAD") == []
+    assert changed_files(str(tmp_path), "HEAD~1") == ["later.txt"]
+
+
+def test_changed_files_not_a_repo(tmp_path: Path):
+    assert changed_files(str(tmp_path), "HEAD") is None
+
+
+def test_changed_files_bad_ref(tmp_path: Path, git_commit: GitCommitFunc):
+    git_commit()
+    assert changed_files(str(tmp_path), "not-a-ref") is None
+
+
+def test_repo_root(tmp_path: Path, git_commit: GitCommitFunc):
+    (sub := tmp_path / "sub").mkdir()
+
+    assert repo_root(str(sub)) == str(tmp_path.resolve())
+
+
+def test_repo_root_not_a_repo(tmp_path: Path):
+    assert repo_root(str(tmp_path)) is None
+
+
+def test_index_entries(tmp_path: Path, git_commit: GitCommitFunc):
+    (tmp_path / "a.txt").write_text("a")
+    git_commit()
+
+    entries = index_entries(str(tmp_path))
+    assert entries is not None
+    # mode, blob hash, stage, path
+    assert entries.startswith(
+        "100644 2e65efe2a145dda7ee51d1741299f848e5bf752e 0\ta.txt"
+    )
+
+
+def test_dirty_files(tmp_path: Path, git_commit: GitCommitFunc):
+    for name in ["edited.txt", "deleted.txt", "renamed.txt", "clean.txt"]:
+        (tmp_path / name).write_text(name)
+    git_commit()
+
+    assert dirty_files(str(tmp_path)) == []
+
+    (tmp_path / "edited.txt").write_text("new")
+    (tmp_path / "deleted.txt").unlink()
+    (tmp_path / "new dir").mkdir()
+    (tmp_path / "new dir" / "untracked.txt").write_text("new")
+    subprocess.run(["git", "mv", "renamed.txt", "moved.txt"], cwd=tmp_path, check=True)
+
+    assert dirty_files(str(tmp_path)) == [
+        "deleted.txt",
+        "edited.txt",
+        "moved.txt",
+        "new dir/untracked.txt",
+        "renamed.txt",
+    ]
@@ -0,0 +1,193 @@
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from universal_test_runner.jobserver import (
+    Jobserver,
+    TokenPool,
+    child_fds,
+    connect,
+    find_jobserver,
+    parse_makeflags,
+    start_jobserver,
+)
+from universal_test_runner.parallel import Job, run_jobs
+
+
+@pytest.mark.parametrize(
+    ["makeflags", "expected"],
+    [
+        ("", None),
+        ("-k", None),
+        (" -j8 --jobserver-auth=3,4", "3,4"),
+        ("-j8 --jobserver-auth=fifo:/tmp/GMfifo1", "fifo:/tmp/GMfifo1"),
+        ("-j --jobserver-fds=3,4 -j", "3,4"),
+        ("--jobserver-auth=3,4 --jobserver-auth=5,6", "5,6"),
+    ],
+)
+def test_parse_makeflags(makeflags, expected):
+    assert parse_makeflags(makeflags) == expected
+
+
+@pytest.fixture
+def pipe():
+    read_fd, write_fd = os.pipe()
+    yield read_fd, write_fd
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+def test_connect_pipe(pipe):
+    read_fd, write_fd = pipe
+
+    jobserver = connect(f"{read_fd},{write_fd}")
+
+    assert jobserver
+    assert jobserver.write_fd == write_fd
+    assert jobserver.inherited_fds == (read_fd, write_fd)
+    # the pipe make shares with everyone else is left blocking
+    assert os.get_blocking(read_fd)
+    os.write(write_fd, b"+")
+    assert jobserver.try_acquire(0) == b"+"
+    if jobserver.read_fd != read_fd:
+        os.close(jobserver.read_fd)
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+def test_try_acquire_race(pipe):
+    # two readers both see the one token, but only one of them can have it
+    read_fd, write_fd = pipe
+    readers = [connect(f"{read_fd},{write_fd}") for _ in range(2)]
+    os.write(write_fd, b"+")
+
+    with patch("select.select", side_effect=lambda r, w, x, timeout: (r, w, x)):
+        with ThreadPoolExecutor(2) as executor:
+            tokens = [
+                f.result(timeout=5)
+                for f in [executor.submit(j.try_acquire, 1) for j in readers if j]
+            ]
+
+    assert sorted(tokens, key=bool) == [None, b"+"]
+    for jobserver in readers:
+        assert jobserver
+        os.close(jobserver.read_fd)
+
+
+@pytest.mark.parametrize("auth", ["-2,-2", "nope", "1000,1001", "fifo:/does/not/exist"])
+def test_connect_unusable(auth):
+    assert connect(auth) is None
+
+
+def test_connect_fifo(tmp_path):
+    os.mkfifo(path := tmp_path / "fifo")
+
+    jobserver = connect(f"fifo:{path}")
+
+    assert jobserver
+    assert jobserver.inherited_fds == ()
+    jobserver.release(b"+")
+    assert jobserver.try_acquire(0) == b"+"
+    assert jobserver.try_acquire(0) is None
+    # even when `select` thinks there's a token
+    with patch("select.select", side_effect=lambda r, w, x, timeout: (r, w, x)):
+        assert jobserver.try_acquire(0) is None
+    os.close(jobserver.read_fd)
+    os.close(jobserver.write_fd)
+
+
+def test_start_jobserver(monkeypatch):
+    monkeypatch.setenv("MAKEFLAGS", "-k")
+
+    jobserver = start_jobserver(3)
+
+    assert find_jobserver() == jobserver
+    read_fd, write_fd = jobserver.inherited_fds
+    assert os.environ["MAKEFLAGS"] == f"-k -j3 --jobserver-auth={read_fd},{write_fd}"
+    assert child_fds() == (read_fd, write_fd)
+    # one slot is implicit
+    assert [jobserver.try_acquire(0) for _ in range(3)] == [b"+", b"+", None]
+    for fd in {jobserver.read_fd, read_fd, write_fd}:
+        os.close(fd)
+
+
+def max_concurrency(pool: TokenPool, jobs: int) -> int:
+    running = peak = 0
+
+    async def _job():
+        nonlocal running, peak
+        async with pool.slot():
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.05)
+            running -= 1
+
+    async def _run():
+        await asyncio.gather(*(_job() for _ in range(jobs)))
+
+    asyncio.run(_run())
+    return peak
+
+
+@pytest.mark.parametrize("tokens", [0, 1, 2])
+def test_token_pool(tokens, pipe):
+    read_fd, write_fd = pipe
+    os.write(write_fd, b"+" * tokens)
+
+    assert max_concurrency(TokenPool(Jobserver(read_fd, write_fd, ())), 4) == tokens + 1
+    # every token was given back
+    os.write(write_fd, b"!")
+    assert os.read(read_fd, 10) == b"+" * tokens + b"!"
+
+
+def test_token_pool_gives_back_tokens_of_cancelled_jobs():
+    released = []
+
+    class SlowJobserver:
+        def try_acquire(self, timeout: float):
+            # the token arrives after the job waiting for it was cancelled
+            time.sleep(0.2)
+            return b"+"
+
+        def release(self, token: bytes):
+            released.append(token)
+
+    pool = TokenPool(SlowJobserver())  # type: ignore[arg-type]
+
+    async def _run():
+        async with pool.slot():
+            waiting = asyncio.ensure_future(pool.slot().__aenter__())
+            await asyncio.sleep(0.05)
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+            await asyncio.sleep(0.3)
+
+    asyncio.run(_run())
+    assert released == [b"+"]
+
+
+def test_token_pool_without_jobserver():
+    assert max_concurrency(TokenPool(None), 4) == 4
+
+
+def test_run_jobs_shares_jobserver(monkeypatch):
+    monkeypatch.setenv("MAKEFLAGS", "")
+    jobserver = start_jobserver(2)
+    read_fd, write_fd = jobserver.inherited_fds
+    # children can see (and use) the jobserver
+    script = "import os; print(os.environ['MAKEFLAGS'].split('=')[-1]); os.fstat({})"
+
+    results = run_jobs(
+        [Job(str(i), [sys.executable, "-c", script.format(read_fd)]) for i in range(3)],
+        echo=False,
+    )
+
+    assert [r.returncode for r in results] == [0, 0, 0]
+    assert results[0].output.decode().strip() == f"{read_fd},{write_fd}"
+    for fd in {jobserver.read_fd, read_fd, write_fd}:
+        os.close(fd)
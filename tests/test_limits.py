@@ -0,0 +1,143 @@
+import os
+import platform
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from universal_test_runner.limits import (
+    Limits,
+    limits_from_env,
+    parse_cpu_list,
+    preexec,
+    report_limits,
+)
+
+
+@pytest.mark.parametrize(
+    ["value", "expected"],
+    [
+        ("0", {0}),
+        ("0-3,8", {0, 1, 2, 3, 8}),
+        (" 2 , 4-5 ", {2, 4, 5}),
+        ("", None),
+        ("a-b", None),
+        ("-1", None),
+    ],
+)
+def test_parse_cpu_list(value, expected):
+    assert parse_cpu_list(value) == (frozenset(expected) if expected else None)
+
+
+def test_limits_from_env(monkeypatch):
+    assert not limits_from_env()
+
+    monkeypatch.setenv("UTR_MAX_RSS", "4G")
+    monkeypatch.setenv("UTR_NICE", "10")
+    monkeypatch.setenv("UTR_IO_CLASS", "best-effort:7")
+
+    limits = limits_from_env()
+    if platform.machine() != "x86_64":
+        pytest.skip("ioprio_set's syscall number is only known for some machines")
+    assert limits == Limits(max_rss=4 * 1024**3, nice=10, io_priority=2 << 13 | 7)
+
+
+@pytest.mark.parametrize(
+    ["name", "value", "message"],
+    [
+        ("UTR_CPUS", "0-", "invalid UTR_CPUS value: '0-'"),
+        ("UTR_CPUS", "100000", "UTR_CPUS includes CPUs that aren't available here"),
+        ("UTR_MAX_RSS", "lots", "invalid UTR_MAX_RSS value: 'lots'"),
+        ("UTR_NICE", "-5", "invalid UTR_NICE value: '-5'"),
+        ("UTR_NICE", "20", "invalid UTR_NICE value: '20'"),
+        ("UTR_IO_CLASS", "realtime", "invalid UTR_IO_CLASS value: 'realtime'"),
+        ("UTR_IO_CLASS", "idle:9", "invalid UTR_IO_CLASS value: 'idle:9'"),
+    ],
+)
+def test_limits_from_env_errors(name, value, message, monkeypatch):
+    if name == "UTR_CPUS" and not hasattr(os, "sched_setaffinity"):
+        pytest.skip("needs sched_setaffinity")
+    monkeypatch.setenv(name, value)
+
+    limits = limits_from_env()
+
+    assert isinstance(limits, str)
+    assert message in limits
+
+
+@pytest.mark.skipif(
+    platform.system() != "Linux" or platform.machine() != "x86_64",
+    reason="needs Linux",
+)
+def test_preexec():
+    limits = Limits(
+        cpus=frozenset(os.sched_getaffinity(0)),
+        max_rss=2 * 1024**3,
+        nice=5,
+        io_priority=3 << 13,
+    )
+    script = "import os, resource; print(sorted(os.sched_getaffinity(0)), resource.getrlimit(resource.RLIMIT_DATA)[0], os.nice(0), sep='|')"
+
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        preexec_fn=preexec(limits),
+        capture_output=True,
+        text=True,
+    )
+    io_class = subprocess.run(
+        ["sh", "-c", "ionice -p $$"],
+        preexec_fn=preexec(limits),
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.stdout.strip().split("|") == [
+        str(sorted(limits.cpus or ())),
+        str(2 * 1024**3),
+        str(os.nice(0) + 5),
+    ]
+    assert io_class.stdout.strip() == "idle"
+
+
+def test_preexec_without_limits():
+    assert preexec(Limits()) is None
+
+
+@pytest.mark.skipif(platform.system() != "Linux", reason="needs Linux")
+def test_memory_limit_is_enforced():
+    limits = Limits(max_rss=256 * 1024**2)
+
+    result = subprocess.run(
+        [sys.executable, "-c", "b = bytearray(512 * 1024**2)"],
+        preexec_fn=preexec(limits),
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode == 1
+    assert "MemoryError" in result.stderr
+
+
+@pytest.mark.parametrize(
+    ["returncode", "peak", "message"],
+    [
+        (0, 4 * 1024**3, None),
+        (1, 1024**2, None),
+        (
+            1,
+            3.5 * 1024**3,
+            "a process used 3.5G of memory, near the UTR_MAX_RSS limit of 4G",
+        ),
+        (-signal.SIGKILL, 0, "killed with SIGKILL"),
+        (-signal.SIGABRT, 1024**2, "the tests crashed"),
+    ],
+)
+def test_report_limits(returncode, peak, message, capsys):
+    report_limits(Limits(max_rss=4 * 1024**3), returncode, peak)
+
+    out, _ = capsys.readouterr()
+    if message:
+        assert message in out
+    else:
+        assert not out
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.matrix import environment_dir, matrix_jobs, parse_versions
+
+
+@pytest.mark.parametrize(
+    ["value", "expected"],
+    [
+        ("3.9,3.10", ["3.9", "3.10"]),
+        (" 3.9 , 3.9,,pypy@3.10 ", ["3.9", "pypy@3.10"]),
+        (",", []),
+    ],
+)
+def test_parse_versions(value: str, expected: list[str]):
+    assert parse_versions(value) == expected
+
+
+def test_uv_jobs(build_context: ContextBuilderFunc, monkeypatch):
+    monkeypatch.setenv("UV_NO_SYNC", "1")
+    c = build_context(args=["-x"])
+
+    old, new = matrix_jobs(commands.uv_pytest, c, ["3.9", "3.13"])
+
+    assert old.label == "3.9"
+    assert old.command == ["uv", "run", "--python", "3.9", "pytest", "-x"]
+    assert new.command == ["uv", "run", "--python", "3.13", "pytest", "-x"]
+    assert old.cwd == c.cwd
+    assert old.env and new.env
+    # each version gets its own environment, outside the project
+    assert old.env["UV_PROJECT_ENVIRONMENT"] == environment_dir(c, "3.9")
+    assert new.env["UV_PROJECT_ENVIRONMENT"] == environment_dir(c, "3.13")
+    assert not old.env["UV_PROJECT_ENVIRONMENT"].startswith(c.cwd)
+    assert "UV_NO_SYNC" not in old.env
+    assert os.environ["UV_NO_SYNC"] == "1"
+
+
+def test_go_jobs(build_context: ContextBuilderFunc):
+    c = build_context()
+
+    jobs = matrix_jobs(commands.go_multi, c, ["1.22.0", "go1.21.0", "local"])
+
+    assert [job.command for job in jobs] == [["go", "test", "./..."]] * 3
+    assert [job.env and job.env["GOTOOLCHAIN"] for job in jobs] == [
+        "go1.22.0",
+        "go1.21.0",
+        "local",
+    ]
@@ -0,0 +1,156 @@
+import re
+import sys
+
+from universal_test_runner.parallel import (
+    Job,
+    JobResult,
+    aggregate_returncode,
+    print_summary,
+    run_jobs,
+)
+from universal_test_runner.watchdog import TIMED_OUT
+
+
+def _python(code: str) -> list[str]:
+    return [sys.executable, "-c", code]
+
+
+def test_run_jobs(capsys):
+    results = run_jobs(
+        [
+            # the slow job is first, so it should print last
+            Job("slow", _python("import time; time.sleep(0.3); print('slow done')")),
+            Job("fast", _python("import sys; print('fast done'); sys.exit(3)")),
+        ]
+    )
+
+    assert [r.job.label for r in results] == ["slow", "fast"]
+    assert [r.returncode for r in results] == [0, 3]
+    assert results[0].output.strip() == b"slow done"
+
+    out, _ = capsys.readouterr()
+    assert out.index("fast done") < out.index("slow done")
+    assert "-> [fast]" in out
+
+
+def test_run_jobs_no_echo(capsys):
+    run_jobs([Job("quiet", _python("print('hi')"))], echo=False)
+
+    out, _ = capsys.readouterr()
+    assert out == "hi\n"
+
+
+def test_run_jobs_missing_command():
+    [result] = run_jobs([Job("nope", ["definitely-not-a-real-command"])])
+
+    assert result.returncode == 1
+    assert b"command not found: definitely-not-a-real-command" in result.output
+
+
+def _result(code: int, label="job") -> JobResult:
+    return JobResult(Job(label, ["cmd"]), code, b"", 1.5)
+
+
+def test_aggregate_returncode():
+    assert aggregate_returncode([]) == 0
+    assert aggregate_returncode([_result(0), _result(0)]) == 0
+    assert aggregate_returncode([_result(0), _result(2), _result(1)]) == 2
+
+
+def test_print_summary(capsys):
+    print_summary([_result(0, "rust"), _result(1, "javascript")])
+
+    out, _ = capsys.readouterr()
+    assert "rust        passed" in out
+    assert "javascript  failed (1)" in out
+    assert "1.50s" in out
+
+
+def test_run_jobs_respects_dependencies(tmp_path):
+    log = tmp_path / "log"
+    append = "import sys, time; time.sleep({}); open(sys.argv[1], 'a').write('{}\\n')"
+
+    results = run_jobs(
+        [
+            Job(
+                "app",
+                [*_python(append.format(0, "app")), str(log)],
+                dependencies=("lib",),
+            ),
+            Job("lib", [*_python(append.format(0.3, "lib")), str(log)]),
+            # unknown labels are ignored
+            Job(
+                "docs",
+                [*_python(append.format(0, "docs")), str(log)],
+                dependencies=("nope",),
+            ),
+        ],
+        echo=False,
+    )
+
+    assert [r.returncode for r in results] == [0, 0, 0]
+    order = log.read_text().split()
+    assert order.index("lib") < order.index("app")
+
+
+def test_run_jobs_limit(tmp_path):
+    # each job fails if another one is running at the same time
+    code = (
+        "import os, sys, time\n"
+        "lock = sys.argv[1]\n"
+        "fd = os.open(lock, os.O_CREAT | os.O_EXCL)\n"
+        "time.sleep(0.1)\n"
+        "os.close(fd); os.unlink(lock)\n"
+    )
+    lock = str(tmp_path / "lock")
+    results = run_jobs(
+        [Job(str(i), [*_python(code), lock]) for i in range(3)], echo=False, limit=1
+    )
+
+    assert [r.returncode for r in results] == [0, 0, 0]
+
+
+def test_run_jobs_stream(capsys):
+    results = run_jobs(
+        [
+            Job(
+                "a", _python("import time; print('one'); time.sleep(0.3); print('two')")
+            ),
+            Job("b", _python("print('three', end='')")),
+        ],
+        stream=True,
+    )
+
+    assert results[0].output == b"one\ntwo\n"
+    assert results[1].output == b"three"
+
+    out, _ = capsys.readouterr()
+    lines = re.sub(r"\x1b\[\d+m", "", out).splitlines()
+    assert sorted(lines[:2]) == [
+        f"-> [{r.job.label}] {' '.join(r.job.command)}" for r in results
+    ]
+    # printed as it arrived, rather than once each job finished
+    assert lines[2:] in (
+        ["[a] one", "[b] three", "[a] two"],
+        ["[b] three", "[a] one", "[a] two"],
+    )
+
+
+def test_run_jobs_timeout(monkeypatch):
+    # one job hangs without printing anything, the other finishes
+    monkeypatch.setenv("UTR_IDLE_TIMEOUT", "1")
+    results = run_jobs(
+        [
+            Job(
+                "hung",
+                _python("import time; print('started', flush=True); time.sleep(60)"),
+            ),
+            Job("fine", _python("print('done')")),
+        ],
+        echo=False,
+    )
+
+    assert [r.returncode for r in results] == [TIMED_OUT, 0]
+    assert results[0].duration < 30
+    assert b"started" in results[0].output
+    assert b"it printed nothing for 1s" in results[0].output
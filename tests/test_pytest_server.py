@@ -0,0 +1,151 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.pytest_server import (
+    SERVER_SCRIPT,
+    UNSUPPORTED_SUFFIX,
+    interpreter,
+    run_in_server,
+    socket_path,
+    start_server,
+)
+
+
+@pytest.mark.parametrize(
+    ["command", "expected"],
+    [
+        (commands.uv_pytest, ["uv", "run", "python"]),
+        (commands.poetry_pytest, ["poetry", "run", "python"]),
+        (commands.pdm_pytest, ["pdm", "run", "python"]),
+    ],
+)
+def test_interpreter(command, expected):
+    assert interpreter(command) == expected
+
+
+@pytest.mark.parametrize(
+    ["shebang", "expected"],
+    [
+        ("#!/venv/bin/python\n", ["/venv/bin/python"]),
+        ("#!/usr/bin/env python3\n", ["/usr/bin/env", "python3"]),
+        ("import sys\n", None),
+    ],
+)
+def test_interpreter_from_pytest_script(shebang, expected, tmp_path: Path, monkeypatch):
+    script = tmp_path / "pytest"
+    script.write_text(shebang)
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", str(tmp_path))
+
+    assert interpreter(commands.pytest) == expected
+
+
+def test_interpreter_without_pytest(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+
+    assert interpreter(commands.pytest) is None
+
+
+def test_socket_path(build_context: ContextBuilderFunc, tmp_path: Path):
+    c = build_context()
+
+    path = socket_path(commands.uv_pytest, c)
+    assert path.suffix == ".sock"
+    assert path != socket_path(commands.pytest, c)
+    # unix socket paths have a short limit
+    assert len(path.name) < 24
+
+
+def test_run_in_server_without_server(build_context: ContextBuilderFunc):
+    assert run_in_server(commands.pytest, build_context(), []) is None
+
+
+def _wait_for(path: Path):
+    deadline = time.monotonic() + 30
+    while not path.exists():
+        if time.monotonic() > deadline:
+            pytest.fail("the pytest server never started")
+        time.sleep(0.05)
+
+
+@patch("universal_test_runner.pytest_server.interpreter")
+def test_server(mock_interpreter, build_context: ContextBuilderFunc, capfd):
+    mock_interpreter.return_value = [sys.executable]
+    c = build_context()
+    Path(c.cwd, "helper.py").write_text("VALUE = 1\n")
+    Path(c.cwd, "test_thing.py").write_text(
+        "import os\n"
+        "from helper import VALUE\n"
+        "def test_value(): assert VALUE == 1\n"
+        "def test_env(): assert os.environ['UTR_CACHE_DIR']\n"
+        "def test_rewritten(): assert VALUE == 2\n"
+    )
+
+    assert start_server(commands.pytest, c)
+    _wait_for(socket_path(commands.pytest, c))
+    capfd.readouterr()
+
+    started = []
+    args = ["-q", "-k", "not rewritten"]
+    assert run_in_server(commands.pytest, c, args, lambda: started.append(1)) == 0
+    assert started == [1]
+    out, _ = capfd.readouterr()
+    assert "2 passed" in out
+
+    # the test module is imported by the run's own pytest, so its asserts are rewritten
+    assert run_in_server(commands.pytest, c, ["-q", "-k", "rewritten"]) == 1
+    out, _ = capfd.readouterr()
+    assert "assert 1 == 2" in out
+
+    # each run is a separate fork, so can take different args
+    assert run_in_server(commands.pytest, c, ["-q", "-k", "nope"]) == 5
+
+    # once something it imported changes, the server turns the run down and shuts down
+    helper = Path(c.cwd, "helper.py")
+    helper.write_text("VALUE = 2\n")
+    later = time.time() + 10
+    os.utime(helper, (later, later))
+    assert run_in_server(commands.pytest, c, ["-q"]) is None
+    assert run_in_server(commands.pytest, c, ["-q"]) is None
+
+
+@patch("universal_test_runner.pytest_server.interpreter")
+def test_server_unsupported_interpreter(
+    mock_interpreter, build_context: ContextBuilderFunc
+):
+    mock_interpreter.return_value = [sys.executable]
+    c = build_context()
+    path = socket_path(commands.pytest, c)
+    path.parent.mkdir(parents=True)
+    # like python 3.8, which can't receive the client's terminal
+    script = (
+        "import runpy, socket, sys; del socket.recv_fds; "
+        f"sys.argv = ['', {str(path)!r}, '[]']; "
+        f"runpy.run_path({str(SERVER_SCRIPT)!r}, run_name='__main__')"
+    )
+    subprocess.run(
+        [sys.executable, "-c", script],
+        input=b'{"env": {}, "test_files": []}',
+        check=True,
+    )
+
+    assert not path.exists()
+    assert Path(f"{path}{UNSUPPORTED_SUFFIX}").exists()
+    # so it isn't started again for every run
+    with patch("subprocess.Popen") as mock_popen:
+        assert not start_server(commands.pytest, c)
+        mock_popen.assert_not_called()
+
+        # until the project's environment might have changed
+        later = time.time() + 10
+        Path(c.cwd, "uv.lock").write_text("")
+        os.utime(Path(c.cwd, "uv.lock"), (later, later))
+        assert start_server(commands.pytest, c)
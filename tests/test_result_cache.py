@@ -0,0 +1,135 @@
+from pathlib import Path
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import GitCommitFunc
+from universal_test_runner.result_cache import (
+    describe_result,
+    lookup_result,
+    result_key,
+    result_store,
+    save_result,
+    tree_fingerprint,
+)
+
+
+@pytest.fixture
+def repo(tmp_path: Path, git_commit: GitCommitFunc) -> Path:
+    (tmp_path / ".gitignore").write_text("ignored/\n")
+    (tmp_path / "src.py").write_text("x = 1")
+    git_commit()
+    return tmp_path
+
+
+def test_tree_fingerprint_stable(repo: Path):
+    assert tree_fingerprint(str(repo)) == tree_fingerprint(str(repo))
+
+
+def test_tree_fingerprint_edits(repo: Path):
+    clean = tree_fingerprint(str(repo))
+
+    (repo / "src.py").write_text("x = 2")
+    edited = tree_fingerprint(str(repo))
+    assert edited != clean
+
+    # depends on contents, not mtimes
+    (repo / "src.py").write_text("x = 1")
+    assert tree_fingerprint(str(repo)) == clean
+
+    (repo / "new.py").write_text("")
+    assert tree_fingerprint(str(repo)) != clean
+
+
+def test_tree_fingerprint_ignores_ignored_files(repo: Path):
+    clean = tree_fingerprint(str(repo))
+
+    (repo / "ignored").mkdir()
+    (repo / "ignored" / "output.log").write_text("whatever")
+    assert tree_fingerprint(str(repo)) == clean
+
+
+def test_tree_fingerprint_per_directory(repo: Path, git_commit: GitCommitFunc):
+    # two packages in the same clean tree
+    for package in ["a", "b"]:
+        (repo / "packages" / package).mkdir(parents=True)
+        (repo / "packages" / package / "test_it.py").write_text("")
+    git_commit()
+
+    a = tree_fingerprint(str(repo / "packages" / "a"))
+    assert a == tree_fingerprint(str(repo / "packages" / "a"))
+    assert a != tree_fingerprint(str(repo / "packages" / "b"))
+    assert a != tree_fingerprint(str(repo))
+
+
+def test_tree_fingerprint_not_a_repo(tmp_path: Path):
+    assert tree_fingerprint(str(tmp_path)) is None
+
+
+def test_result_key(monkeypatch):
+    key = result_key(commands.pytest, ["pytest"], "abc")
+
+    assert key == result_key(commands.pytest, ["pytest"], "abc")
+    assert key != result_key(commands.pytest, ["pytest", "-x"], "abc")
+    assert key != result_key(commands.pytest, ["pytest"], "abd")
+    assert key != result_key(commands.uv_pytest, ["pytest"], "abc")
+
+    monkeypatch.setenv("VIRTUAL_ENV", "/somewhere/else")
+    assert result_key(commands.pytest, ["pytest"], "abc") != key
+
+
+@pytest.mark.parametrize(
+    ["name", "value"],
+    [
+        ("UTR_SHARD", "1/2"),
+        ("UTR_CHANGED_SINCE", "main"),
+        ("UTR_FAILED_FIRST", "1"),
+        ("UTR_TIMEOUT", "60"),
+    ],
+)
+def test_result_key_settings(monkeypatch, name: str, value: str):
+    key = result_key(commands.pytest, ["pytest"], "abc")
+
+    monkeypatch.setenv(name, value)
+    assert result_key(commands.pytest, ["pytest"], "abc") != key
+
+
+def test_result_key_ignores_output_settings(monkeypatch):
+    key = result_key(commands.pytest, ["pytest"], "abc")
+
+    monkeypatch.setenv("UTR_DISABLE_ECHO", "1")
+    monkeypatch.setenv("UTR_RESULT_CACHE", "1")
+    assert result_key(commands.pytest, ["pytest"], "abc") == key
+
+
+def test_result_key_custom_env(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgres://a")
+    key = result_key(commands.pytest, ["pytest"], "abc")
+
+    monkeypatch.setenv("DATABASE_URL", "postgres://b")
+    assert result_key(commands.pytest, ["pytest"], "abc") == key
+
+    monkeypatch.setenv("UTR_RESULT_CACHE_ENV", "DATABASE_URL, OTHER")
+    assert result_key(commands.pytest, ["pytest"], "abc") != key
+
+
+def test_result_store(monkeypatch, tmp_path: Path):
+    monkeypatch.setenv("UTR_RESULT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("UTR_RESULT_CACHE_SIZE", "1M")
+
+    store = result_store()
+    assert store.root == tmp_path
+    assert store.max_bytes == 1024**2
+
+
+def test_save_and_lookup_result(tmp_path: Path):
+    store = result_store()
+    assert lookup_result(store, "key") is None
+
+    save_result(store, "key", ["pytest", "-x"], 0, 12.5)
+    result = lookup_result(store, "key")
+
+    assert result is not None
+    assert result["returncode"] == 0
+    assert "`pytest -x` passed at" in describe_result(result)
+    assert "took 12.50s" in describe_result(result)
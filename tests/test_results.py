@@ -0,0 +1,420 @@
+import io
+import json
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.results import (
+    Plan,
+    _describe_junit,
+    _describe_pytest,
+    exunit_events,
+    go_events,
+    junit_events,
+    libtest_events,
+    libtest_pretty_events,
+    ndjson_events,
+    results_plan,
+    run_plan,
+)
+from universal_test_runner.watchdog import TIMED_OUT
+
+PYTEST_JUNIT = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites>
+  <testsuite name="pytest" tests="4">
+    <testcase classname="tests.test_x.TestK" name="test_a" file="tests/test_x.py" line="2" time="0.5" />
+    <testcase classname="tests.test_x" name="test_p[2]" file="tests/test_x.py" line="5" time="0.25">
+      <failure message="assert 2 == 1">details</failure>
+    </testcase>
+    <testcase classname="tests.test_x" name="test_s" file="tests/test_x.py" line="8" time="0.000">
+      <skipped type="pytest.skip" message="nah" />
+    </testcase>
+    <testcase classname="tests.test_x" name="test_e" file="tests/test_x.py" line="10" time="">
+      <error message="fixture broke" />
+    </testcase>
+  </testsuite>
+</testsuites>
+"""
+
+
+def test_junit_events_pytest(tmp_path: Path):
+    report = tmp_path / "junit.xml"
+    report.write_text(PYTEST_JUNIT)
+
+    events = list(junit_events(report, _describe_pytest))
+
+    assert events[0] == {
+        "event": "end",
+        "suite": "tests/test_x.py",
+        "test": "tests/test_x.py::TestK::test_a",
+        "file": "tests/test_x.py",
+        "line": 3,
+        "outcome": "passed",
+        "duration": 0.5,
+    }
+    assert [(e["test"], e["outcome"], e["duration"]) for e in events[1:]] == [
+        ("tests/test_x.py::test_p[2]", "failed", 0.25),
+        ("tests/test_x.py::test_s", "skipped", 0.0),
+        ("tests/test_x.py::test_e", "error", None),
+    ]
+
+
+def test_junit_events_generic(tmp_path: Path):
+    report = tmp_path / "junit.xml"
+    report.write_text(
+        '<testsuites><testsuite><testcase classname="src/a.test.ts" name="math &gt; adds" time="0.1"/></testsuite></testsuites>'
+    )
+
+    assert list(junit_events(report, _describe_junit)) == [
+        {
+            "event": "end",
+            "suite": "src/a.test.ts",
+            "test": "math > adds",
+            "outcome": "passed",
+            "duration": 0.1,
+        }
+    ]
+
+
+def test_junit_events_incomplete(tmp_path: Path):
+    # whatever was written before a crash is still reported
+    report = tmp_path / "junit.xml"
+    report.write_text(PYTEST_JUNIT[: PYTEST_JUNIT.index("<testcase classname") + 200])
+
+    assert [e["test"] for e in junit_events(report, _describe_pytest)] == [
+        "tests/test_x.py::TestK::test_a"
+    ]
+    assert list(junit_events(tmp_path / "missing.xml", _describe_pytest)) == []
+
+
+def test_go_events():
+    lines = [
+        '{"Action":"start","Package":"example.com/a"}\n',
+        '{"Action":"run","Package":"example.com/a","Test":"TestA"}\n',
+        '{"Action":"output","Package":"example.com/a","Test":"TestA","Output":"=== RUN   TestA\\n"}\n',
+        '{"Action":"pass","Package":"example.com/a","Test":"TestA","Elapsed":0.01}\n',
+        '{"Action":"skip","Package":"example.com/a","Test":"TestB","Elapsed":0}\n',
+        '{"Action":"fail","Package":"example.com/a","Test":"TestC/sub","Elapsed":0}\n',
+        "# example.com/b\n",
+        '{"Action":"fail","Package":"example.com/a","Elapsed":0.02}\n',
+    ]
+    out = io.StringIO()
+
+    assert list(go_events(lines, out)) == [
+        {"event": "start", "suite": "example.com/a", "test": "TestA"},
+        {
+            "event": "end",
+            "suite": "example.com/a",
+            "test": "TestA",
+            "outcome": "passed",
+            "duration": 0.01,
+        },
+        {
+            "event": "end",
+            "suite": "example.com/a",
+            "test": "TestB",
+            "outcome": "skipped",
+            "duration": 0,
+        },
+        {
+            "event": "end",
+            "suite": "example.com/a",
+            "test": "TestC/sub",
+            "outcome": "failed",
+            "duration": 0,
+            "parent": "TestC",
+        },
+    ]
+    assert out.getvalue() == "=== RUN   TestA\n# example.com/b\n"
+
+
+def test_libtest_events():
+    lines = [
+        '{ "type": "suite", "event": "started", "test_count": 2 }\n',
+        '{ "type": "test", "event": "started", "name": "tests::a" }\n',
+        '{ "type": "test", "name": "tests::a", "event": "ok", "exec_time": 0.002 }\n',
+        '{ "type": "test", "name": "tests::b", "event": "failed", "exec_time": 0.1, "stdout": "boom\\n" }\n',
+        '{ "type": "suite", "event": "failed", "passed": 1, "failed": 1, "ignored": 0 }\n',
+    ]
+    out = io.StringIO()
+
+    events = list(libtest_events(lines, out))
+
+    assert events == [
+        {"event": "start", "suite": None, "test": "tests::a"},
+        {
+            "event": "end",
+            "suite": None,
+            "test": "tests::a",
+            "outcome": "passed",
+            "duration": 0.002,
+        },
+        {
+            "event": "end",
+            "suite": None,
+            "test": "tests::b",
+            "outcome": "failed",
+            "duration": 0.1,
+        },
+    ]
+    assert "test tests::b ... FAILED\nboom\n" in out.getvalue()
+    assert "test result: failed. 1 passed; 1 failed; 0 ignored" in out.getvalue()
+
+
+def test_libtest_pretty_events():
+    lines = [
+        "running 3 tests\n",
+        "test tests::a ... ok\n",
+        "test src/lib.rs - add (line 3) ... FAILED\n",
+        "test tests::c ... ignored, slow\n",
+    ]
+    out = io.StringIO()
+
+    events = list(libtest_pretty_events(lines, out))
+
+    assert [(e["test"], e["outcome"], e["duration"]) for e in events] == [
+        ("tests::a", "passed", None),
+        ("src/lib.rs - add (line 3)", "failed", None),
+        ("tests::c", "skipped", None),
+    ]
+    assert out.getvalue() == "".join(lines)
+
+
+def test_ndjson_events(tmp_path: Path):
+    report = tmp_path / "results"
+    report.write_text(
+        '{"event": "start", "suite": "a.test.js", "test": "adds"}\nnot json\n'
+    )
+
+    assert list(ndjson_events(report)) == [
+        {"event": "start", "suite": "a.test.js", "test": "adds"}
+    ]
+
+
+def _hex(text: str) -> str:
+    return text.encode().hex().upper()
+
+
+def test_exunit_events(tmp_path: Path):
+    report = tmp_path / "results"
+    file = str(tmp_path / "test" / "math_test.exs")
+    report.write_text(
+        f"start\t{_hex('MathTest')}\t{_hex('test adds')}\t{_hex(file)}\t4\t\t\n"
+        f"end\t{_hex('MathTest')}\t{_hex('test adds')}\t{_hex(file)}\t4\tfailed\t1500\n"
+    )
+
+    assert list(exunit_events(report, str(tmp_path))) == [
+        {
+            "event": "start",
+            "suite": "MathTest",
+            "test": "test adds",
+            "file": "test/math_test.exs",
+            "line": 4,
+        },
+        {
+            "event": "end",
+            "suite": "MathTest",
+            "test": "test adds",
+            "outcome": "failed",
+            "duration": 0.0015,
+            "file": "test/math_test.exs",
+            "line": 4,
+        },
+    ]
+
+
+def test_plan_pytest(build_context: ContextBuilderFunc, tmp_path: Path):
+    plan = results_plan(
+        commands.uv_pytest, build_context(), ["uv", "run", "pytest", "-x"], tmp_path
+    )
+
+    assert plan
+    assert plan.argv == [
+        "uv",
+        "run",
+        "pytest",
+        "-x",
+        f"--junitxml={tmp_path / 'junit.xml'}",
+        "-o",
+        "junit_family=xunit1",
+    ]
+    assert plan.report == tmp_path / "junit.xml"
+
+
+def test_plan_pytest_existing_report(build_context: ContextBuilderFunc, tmp_path: Path):
+    c = build_context()
+
+    plan = results_plan(
+        commands.pytest, c, ["pytest", "--junitxml", "out.xml"], tmp_path / "scratch"
+    )
+
+    assert plan
+    # the report is the user's, so its format is left alone
+    assert plan.argv == ["pytest", "--junitxml", "out.xml"]
+    assert plan.report == Path(c.cwd, "out.xml")
+
+
+@pytest.mark.parametrize(
+    ["argv", "expected"],
+    [
+        (["go", "test", "./..."], ["go", "test", "-json", "./..."]),
+        (["go", "test", "-json"], ["go", "test", "-json"]),
+    ],
+)
+def test_plan_go(argv, expected, build_context: ContextBuilderFunc, tmp_path: Path):
+    plan = results_plan(commands.go_multi, build_context(), argv, tmp_path)
+
+    assert plan
+    assert plan.argv == expected
+    assert plan.parse_stdout == go_events
+
+
+@patch("universal_test_runner.results._is_nightly")
+def test_plan_cargo(mock_nightly, build_context: ContextBuilderFunc, tmp_path: Path):
+    c = build_context()
+    argv = ["cargo", "test", "--", "--nocapture"]
+
+    # stable toolchains only get the usual output
+    mock_nightly.return_value = False
+    plan = results_plan(commands.rust, c, argv, tmp_path)
+    assert plan
+    assert plan.argv == argv
+    assert plan.parse_stdout == libtest_pretty_events
+
+    mock_nightly.return_value = True
+    plan = results_plan(commands.rust, c, argv, tmp_path)
+    assert plan
+    assert plan.argv == [
+        *argv,
+        "-Z",
+        "unstable-options",
+        "--format",
+        "json",
+        "--report-time",
+    ]
+
+
+def test_plan_jest(build_context: ContextBuilderFunc, write_file, tmp_path: Path):
+    write_file("package.json", json.dumps({"scripts": {"test": "jest"}}))
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+
+    plan = results_plan(commands.npm, build_context(), ["npm", "test"], scratch)
+
+    assert plan
+    assert plan.argv == [
+        "npm",
+        "test",
+        "--",
+        "--reporters=default",
+        f"--reporters={scratch / 'reporter.cjs'}",
+    ]
+    assert plan.env == {"UTR_JEST_RESULTS": str(scratch / "results")}
+    assert "onTestCaseResult" in (scratch / "reporter.cjs").read_text()
+
+
+def test_plan_vitest(build_context: ContextBuilderFunc, write_file, tmp_path: Path):
+    write_file("package.json", json.dumps({"scripts": {"test": "vitest run"}}))
+
+    plan = results_plan(commands.pnpm, build_context(), ["pnpm", "test"], tmp_path)
+
+    assert plan
+    assert plan.argv == [
+        "pnpm",
+        "test",
+        "--reporter=default",
+        "--reporter=junit",
+        f"--outputFile.junit={tmp_path / 'results'}",
+    ]
+
+
+def test_plan_exunit(build_context: ContextBuilderFunc, tmp_path: Path):
+    plan = results_plan(commands.elixir, build_context(), ["mix", "test"], tmp_path)
+
+    assert plan
+    assert plan.argv[:5] == [
+        "elixir",
+        "-r",
+        str(tmp_path / "formatter.exs"),
+        "-S",
+        "mix",
+    ]
+    assert plan.argv[-4:] == [
+        "--formatter",
+        "ExUnit.CLIFormatter",
+        "--formatter",
+        "UniversalTestRunner.Formatter",
+    ]
+    assert (
+        "defmodule UniversalTestRunner.Formatter"
+        in (tmp_path / "formatter.exs").read_text()
+    )
+
+
+@pytest.mark.parametrize(
+    ["command", "package_json"],
+    [
+        (commands.makefile, None),
+        # a test script that isn't jest or vitest
+        (commands.npm, {"scripts": {"test": "mocha"}}),
+    ],
+)
+def test_plan_unsupported(
+    command, package_json, build_context: ContextBuilderFunc, write_file, tmp_path
+):
+    if package_json:
+        write_file("package.json", json.dumps(package_json))
+
+    assert results_plan(command, build_context(), ["make", "test"], tmp_path) is None
+
+
+def test_run_plan_stdout(capsys):
+    script = 'print(\'{"Action":"pass","Test":"TestA","Package":"a"}\'); print(\'hello\'); raise SystemExit(3)'
+    events = []
+
+    plan = Plan([sys.executable, "-c", script], parse_stdout=go_events)
+    assert run_plan(plan, events.append) == 3
+
+    assert [e["test"] for e in events] == ["TestA"]
+    out, _ = capsys.readouterr()
+    assert "hello" in out
+
+
+@pytest.mark.parametrize("streamed", [True, False])
+def test_run_plan_timeout(streamed: bool, tmp_path: Path, monkeypatch, capsys):
+    monkeypatch.setenv("UTR_TIMEOUT", "1")
+    script = "import time; print('started', flush=True); time.sleep(60)"
+    report = tmp_path / "results"
+    plan = (
+        Plan([sys.executable, "-c", script], parse_stdout=go_events)
+        if streamed
+        else Plan(
+            [sys.executable, "-c", script], report=report, parse_report=ndjson_events
+        )
+    )
+
+    assert run_plan(plan, lambda event: None) == TIMED_OUT
+
+    out, _ = capsys.readouterr()
+    assert "started" in out
+    assert "it took longer than 1s" in out
+
+
+def test_run_plan_report(tmp_path: Path):
+    report = tmp_path / "results"
+    script = 'import os; open(os.environ[\'REPORT\'], \'w\').write(\'{"event": "end", "test": "a"}\\n\')'
+    events = []
+
+    plan = Plan(
+        [sys.executable, "-c", script],
+        env={"REPORT": str(report)},
+        report=report,
+        parse_report=ndjson_events,
+    )
+    assert run_plan(plan, events.append) == 0
+
+    assert events == [{"event": "end", "test": "a"}]
@@ -1,8 +1,29 @@
+import json
+import os
+import subprocess
+import sys
 from pathlib import Path
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, call, patch
 
+import pytest
+
+import universal_test_runner.commands as commands
 from universal_test_runner.context import Context
-from universal_test_runner.runner import run, run_test_command
+from universal_test_runner.failures import load_failures
+from universal_test_runner.limits import Limits
+from universal_test_runner.parallel import Job, JobResult
+from universal_test_runner.runner import (
+    chosen_command,
+    dispatch,
+    run,
+    run_as_worker,
+    run_matched_command,
+    run_test_command,
+    run_test_commands,
+    run_with_results,
+)
+from universal_test_runner.slowest import load_history
+from universal_test_runner.timings import load_durations, record_durations
 
 
 @patch("subprocess.run")
@@ -11,7 +32,7 @@ def test_run_command(subp_run: Mock):
 
     assert run_test_command(["a", "-b", "--c"]) == 0
 
-    subp_run.assert_called_once_with(["a", "-b", "--c"])
+    subp_run.assert_called_once_with(["a", "-b", "--c"], pass_fds=(), preexec_fn=None)
 
 
 @patch("subprocess.run")
@@ -33,12 +54,103 @@ def test_command_not_found(subp_run: Mock, capsys):
     out, _ = capsys.readouterr()
     assert "command not found:" in out
 
-    subp_run.assert_called_once_with(["pytest"])
+    subp_run.assert_called_once_with(["pytest"], pass_fds=(), preexec_fn=None)
+
+
+@pytest.mark.parametrize(
+    ["env", "expected"],
+    [
+        ({"UTR_CAPTURE": "20"}, (["pytest"], 20, None, None, Limits())),
+        ({"UTR_LOG": "out.log.gz"}, (["pytest"], 100, "out.log.gz", None, Limits())),
+        (
+            {"UTR_CAPTURE": "5", "UTR_LOG": "out.log.gz"},
+            (["pytest"], 5, "out.log.gz", None, Limits()),
+        ),
+    ],
+)
+@patch("universal_test_runner.runner.run_captured")
+@patch("subprocess.run")
+def test_run_command_captured(
+    subp_run: Mock, mock_run_captured: Mock, env, expected, monkeypatch
+):
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    mock_run_captured.return_value = 2
+
+    assert run_test_command(["pytest"]) == 2
+
+    mock_run_captured.assert_called_once_with(*expected)
+    subp_run.assert_not_called()
+
+
+@patch("universal_test_runner.runner.run_captured")
+def test_run_command_with_timeouts(mock_run_captured: Mock, monkeypatch):
+    monkeypatch.setenv("UTR_TIMEOUT", "600")
+    monkeypatch.setenv("UTR_IDLE_TIMEOUT", "60")
+    mock_run_captured.return_value = 124
+
+    assert run_test_command(["go", "test"]) == 124
+
+    # output is shown as usual
+    command, lines, log, watchdog, _ = mock_run_captured.call_args.args
+    assert (command, lines, log) == (["go", "test"], 0, None)
+    assert (watchdog.timeout, watchdog.idle_timeout) == (600, 60)
+
+
+@patch("subprocess.run")
+def test_run_command_with_limits(subp_run: Mock, monkeypatch):
+    monkeypatch.setenv("UTR_NICE", "10")
+    subp_run.return_value = Mock(returncode=1)
+
+    assert run_test_command(["pytest"]) == 1
+
+    assert subp_run.call_args.kwargs["preexec_fn"]
+
+
+@pytest.mark.skipif(not hasattr(os, "wait4"), reason="needs wait4")
+@pytest.mark.parametrize("captured", [False, True])
+def test_run_command_reports_its_own_memory_use(captured: bool, monkeypatch, capsys):
+    if captured:
+        monkeypatch.setenv("UTR_CAPTURE", "20")
+    monkeypatch.setenv("UTR_MAX_RSS", "200M")
+    # an earlier child's memory use isn't blamed on the tests
+    big = "x = b'x' * 180 * 1024**2"
+    subprocess.run([sys.executable, "-c", big], check=True)
+
+    assert run_test_command([sys.executable, "-c", "raise SystemExit(1)"]) == 1
+    out, _ = capsys.readouterr()
+    assert "near the UTR_MAX_RSS limit" not in out
+
+    assert run_test_command([sys.executable, "-c", f"{big}; raise SystemExit(1)"]) == 1
+    out, _ = capsys.readouterr()
+    assert "near the UTR_MAX_RSS limit of 200M" in out
+
+
+@patch("subprocess.run")
+def test_run_command_invalid_limits(subp_run: Mock, monkeypatch, capsys):
+    monkeypatch.setenv("UTR_NICE", "-5")
+
+    assert run_test_command(["pytest"]) == 1
+
+    out, _ = capsys.readouterr()
+    assert "invalid UTR_NICE value: '-5'" in out
+    subp_run.assert_not_called()
+
+
+@patch("universal_test_runner.runner.run_captured")
+def test_run_command_captured_not_found(mock_run_captured: Mock, monkeypatch, capsys):
+    monkeypatch.setenv("UTR_CAPTURE", "20")
+    mock_run_captured.side_effect = FileNotFoundError
+
+    assert run_test_command(["pytest"]) == 1
+
+    out, _ = capsys.readouterr()
+    assert "command not found: pytest" in out
 
 
 @patch("sys.argv", new=["test-runner", "a", "-b", "--c"])
 @patch("sys.exit")
-@patch("universal_test_runner.runner.find_test_command")
+@patch("universal_test_runner.runner.find_command")
 @patch("universal_test_runner.runner.run_test_command")
 @patch("os.getcwd")
 def test_run(
@@ -54,12 +166,756 @@ def test_run(
 
     mock_cwd.return_value = str(tmp_path)
 
-    mock_command_finder.return_value = ["my", "test", "command"]
+    mock_command_finder.return_value = Mock(test_command=["my", "test", "command"])
 
     run()
 
     mock_command_finder.assert_called_once_with(
         Context(str(tmp_path), frozenset(files), ("a", "-b", "--c"))
     )
-    mock_test_runner.assert_called_once_with(["my", "test", "command"])
+    mock_test_runner.assert_called_once_with(
+        ["my", "test", "command", "a", "-b", "--c"]
+    )
     mock_exit.assert_called_once_with(mock_test_runner.return_value)
+
+
+@patch("sys.argv", new=["test-runner", "-x"])
+@patch("sys.exit")
+@patch("universal_test_runner.runner.find_command")
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_in_ram_scratch(
+    mock_test_runner: Mock,
+    mock_command_finder: Mock,
+    mock_exit: Mock,
+    tmp_path: Path,
+    monkeypatch,
+):
+    monkeypatch.setenv("UTR_TMPFS", "1")
+    monkeypatch.setenv("UTR_TMPFS_ROOT", str(tmp_path))
+    mock_command_finder.return_value = commands.pytest
+    seen = {}
+
+    def _run(argv):
+        seen["argv"] = argv
+        seen["tmpdir"] = os.environ["TMPDIR"]
+        return 0
+
+    mock_test_runner.side_effect = _run
+
+    run()
+
+    assert Path(seen["tmpdir"]).parent == tmp_path
+    assert seen["argv"] == ["pytest", "-x", f"--basetemp={seen['tmpdir']}/pytest"]
+    assert list(tmp_path.iterdir()) == []
+    mock_exit.assert_called_once_with(0)
+
+
+@patch("universal_test_runner.runner.chosen_command")
+@patch("universal_test_runner.runner.run_test_command")
+def test_dispatch_with_ci_cache(
+    mock_test_runner: Mock,
+    mock_chosen: Mock,
+    build_context,
+    tmp_path: Path,
+    monkeypatch,
+):
+    monkeypatch.setenv("UTR_CI_CACHE", "1")
+    monkeypatch.setenv("UTR_CI_CACHE_DIR", str(tmp_path / "store"))
+    mock_chosen.return_value = commands.rust
+    seen = {}
+
+    def _run(argv):
+        seen["target"] = os.environ["CARGO_TARGET_DIR"]
+        return 0
+
+    mock_test_runner.side_effect = _run
+
+    assert dispatch(build_context()) == 0
+
+    assert Path(seen["target"]).parent.parent == tmp_path / "store"
+    assert "CARGO_TARGET_DIR" not in os.environ
+
+
+@patch("universal_test_runner.runner.synced_environment")
+@patch("universal_test_runner.runner.chosen_command")
+@patch("universal_test_runner.runner.run_test_command")
+def test_dispatch_with_sync_once(
+    mock_test_runner: Mock,
+    mock_chosen: Mock,
+    mock_synced: Mock,
+    build_context,
+    monkeypatch,
+):
+    monkeypatch.setenv("UTR_SYNC_ONCE", "1")
+    mock_chosen.return_value = commands.uv_pytest
+    mock_test_runner.return_value = 0
+    mock_synced.return_value.__enter__.return_value = 0
+
+    assert dispatch(build_context()) == 0
+    mock_test_runner.assert_called_once_with(["uv", "run", "pytest"])
+
+    # the tests don't run if the sync failed
+    mock_test_runner.reset_mock()
+    mock_synced.return_value.__enter__.return_value = 3
+
+    assert dispatch(build_context()) == 3
+    mock_test_runner.assert_not_called()
+
+
+@patch("sys.argv", new=["test-runner", "-v"])
+@patch("sys.exit")
+@patch("universal_test_runner.runner.run_test_commands")
+@patch("os.getcwd")
+def test_run_polyglot(
+    mock_cwd: Mock,
+    mock_test_runner: Mock,
+    mock_exit: Mock,
+    tmp_path: Path,
+    touch_files,
+    monkeypatch,
+):
+    monkeypatch.setenv("UTR_POLYGLOT", "1")
+    touch_files(["Cargo.toml", "mix.exs"])
+    mock_cwd.return_value = str(tmp_path)
+
+    run()
+
+    mock_test_runner.assert_called_once_with(
+        [
+            Job("elixir", ["mix", "test", "-v"]),
+            Job("rust", ["cargo", "test", "-v"]),
+        ]
+    )
+    mock_exit.assert_called_once_with(mock_test_runner.return_value)
+
+
+@patch("universal_test_runner.runner.run_jobs")
+def test_run_test_commands(mock_run_jobs: Mock):
+    mock_run_jobs.return_value = [
+        JobResult(Job("a", ["a"]), 0, b"", 1.0),
+        JobResult(Job("b", ["b"]), 4, b"", 1.0),
+    ]
+
+    assert run_test_commands([Job("a", ["a"]), Job("b", ["b"])]) == 4
+
+
+def test_run_test_commands_no_matches(capsys):
+    assert run_test_commands([]) == 1
+
+    out, _ = capsys.readouterr()
+    assert "no testing method found" in out
+
+
+@patch("universal_test_runner.runner.run_test_commands")
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_workspaces(
+    mock_test_runner: Mock,
+    mock_jobs_runner: Mock,
+    build_context,
+    write_file,
+    monkeypatch,
+):
+    monkeypatch.setenv("UTR_WORKSPACES", "1")
+    monkeypatch.setenv("UTR_JOBS", "3")
+    write_file(
+        "package.json",
+        json.dumps({"workspaces": ["packages/*"], "scripts": {"test": "lerna"}}),
+    )
+    (package := Path(build_context().cwd, "packages", "core")).mkdir(parents=True)
+    (package / "package.json").write_text(
+        json.dumps({"name": "core", "scripts": {"test": "jest"}})
+    )
+    context = build_context(["yarn.lock"], ["--ci"])
+
+    run_matched_command(commands.yarn, context)
+
+    mock_test_runner.assert_not_called()
+    mock_jobs_runner.assert_called_once_with(
+        [Job("core", ["yarn", "test", "--ci"], cwd=str(package))], limit=3
+    )
+
+
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_workspaces_without_workspaces(
+    mock_test_runner: Mock, build_context, write_file, monkeypatch
+):
+    monkeypatch.setenv("UTR_WORKSPACES", "1")
+    write_file("package.json", json.dumps({"scripts": {"test": "jest"}}))
+
+    run_matched_command(commands.npm, build_context(["package-lock.json"]))
+
+    mock_test_runner.assert_called_once_with(["npm", "test"])
+
+
+@pytest.mark.parametrize(
+    ["affected", "expected"],
+    [
+        (None, ["go", "test", "./..."]),
+        (["go", "test", "example.com/m/api"], ["go", "test", "example.com/m/api"]),
+    ],
+)
+@patch("universal_test_runner.runner.affected_test_command")
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_changed_since(
+    mock_test_runner: Mock,
+    mock_affected: Mock,
+    affected,
+    expected,
+    build_context,
+    monkeypatch,
+):
+    monkeypatch.setenv("UTR_CHANGED_SINCE", "main")
+    mock_affected.return_value = affected
+    c = build_context(["go.mod"])
+
+    run_matched_command(commands.go_multi, c)
+
+    mock_affected.assert_called_once_with(commands.go_multi, c, "main")
+    mock_test_runner.assert_called_once_with(expected)
+
+
+@patch("universal_test_runner.runner.affected_test_command")
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_changed_since_nothing_affected(
+    mock_test_runner: Mock, mock_affected: Mock, build_context, monkeypatch, capsys
+):
+    monkeypatch.setenv("UTR_CHANGED_SINCE", "main")
+    mock_affected.return_value = []
+
+    assert run_matched_command(commands.go_multi, build_context(["go.mod"])) == 0
+
+    mock_test_runner.assert_not_called()
+    out, _ = capsys.readouterr()
+    assert "no tests are affected by changes since main" in out
+
+
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_with_result_cache(
+    mock_test_runner: Mock, build_context, git_commit, monkeypatch, capsys
+):
+    monkeypatch.setenv("UTR_RESULT_CACHE", "1")
+    mock_test_runner.return_value = 0
+    c = build_context(["Cargo.toml"])
+    git_commit()
+
+    # first run is a miss
+    assert run_matched_command(commands.rust, c) == 0
+    mock_test_runner.assert_called_once_with(["cargo", "test"])
+
+    # second is a hit
+    assert run_matched_command(commands.rust, c) == 0
+    mock_test_runner.assert_called_once()
+    out, _ = capsys.readouterr()
+    assert "nothing changed since `cargo test` passed" in out
+
+    # a change is a miss again
+    (Path(c.cwd) / "lib.rs").write_text("fn main() {}")
+    assert run_matched_command(commands.rust, c) == 0
+    assert mock_test_runner.call_count == 2
+
+
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_with_result_cache_failures_not_cached(
+    mock_test_runner: Mock, build_context, git_commit, monkeypatch
+):
+    monkeypatch.setenv("UTR_RESULT_CACHE", "1")
+    mock_test_runner.return_value = 1
+    c = build_context(["Cargo.toml"])
+    git_commit()
+
+    assert run_matched_command(commands.rust, c) == 1
+    assert run_matched_command(commands.rust, c) == 1
+    assert mock_test_runner.call_count == 2
+
+
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_with_result_cache_outside_git(
+    mock_test_runner: Mock, build_context, monkeypatch
+):
+    monkeypatch.setenv("UTR_RESULT_CACHE", "1")
+    mock_test_runner.return_value = 0
+    c = build_context(["Cargo.toml"])
+
+    run_matched_command(commands.rust, c)
+    run_matched_command(commands.rust, c)
+    assert mock_test_runner.call_count == 2
+
+
+@patch("universal_test_runner.runner.start_server")
+@patch("universal_test_runner.runner.run_in_server")
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_with_pytest_server(
+    mock_test_runner: Mock,
+    mock_run_in_server: Mock,
+    mock_start_server: Mock,
+    build_context,
+    monkeypatch,
+):
+    monkeypatch.setenv("UTR_PYTEST_SERVER", "1")
+    mock_run_in_server.return_value = 3
+    c = build_context(args=["-x"])
+
+    assert run_matched_command(commands.uv_pytest, c) == 3
+    assert mock_run_in_server.call_args.args[:3] == (commands.uv_pytest, c, ["-x"])
+    mock_test_runner.assert_not_called()
+    mock_start_server.assert_not_called()
+
+
+@patch("universal_test_runner.runner.start_server")
+@patch("universal_test_runner.runner.run_in_server")
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_with_pytest_server_not_ready(
+    mock_test_runner: Mock,
+    mock_run_in_server: Mock,
+    mock_start_server: Mock,
+    build_context,
+    monkeypatch,
+):
+    monkeypatch.setenv("UTR_PYTEST_SERVER", "1")
+    mock_run_in_server.return_value = None
+    mock_test_runner.return_value = 0
+    c = build_context()
+
+    assert run_matched_command(commands.pytest, c) == 0
+    mock_test_runner.assert_called_once_with(["pytest"])
+    mock_start_server.assert_called_once_with(commands.pytest, c)
+
+    # other commands don't use it
+    run_matched_command(commands.rust, c)
+    mock_test_runner.assert_called_with(["cargo", "test"])
+    mock_run_in_server.assert_called_once()
+
+
+@patch("universal_test_runner.runner.start_server")
+@patch("universal_test_runner.runner.run_in_server")
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_with_pytest_server_and_timeout(
+    mock_test_runner: Mock,
+    mock_run_in_server: Mock,
+    mock_start_server: Mock,
+    build_context,
+    monkeypatch,
+    capsys,
+):
+    monkeypatch.setenv("UTR_PYTEST_SERVER", "1")
+    monkeypatch.setenv("UTR_TIMEOUT", "60")
+    mock_test_runner.return_value = 0
+
+    assert run_matched_command(commands.pytest, build_context()) == 0
+
+    # the limits win, so the run can't hang
+    mock_test_runner.assert_called_once_with(["pytest"])
+    mock_run_in_server.assert_not_called()
+    mock_start_server.assert_not_called()
+    assert "can't be enforced on a warm pytest server" in capsys.readouterr().out
+
+
+@patch("universal_test_runner.runner.run_plan")
+def test_run_with_results(
+    mock_run_plan: Mock, build_context, monkeypatch, tmp_path: Path
+):
+    destination = tmp_path / "results.ndjson"
+    monkeypatch.setenv("UTR_RESULTS", str(destination))
+
+    def _run_plan(plan, on_event):
+        on_event({"event": "start", "test": "TestA"})
+        return 1
+
+    mock_run_plan.side_effect = _run_plan
+    c = build_context(args=["-x"])
+
+    assert run_matched_command(commands.go_single, c) == 1
+
+    plan, _ = mock_run_plan.call_args.args
+    assert plan.argv == ["go", "test", "-json", "-x"]
+    assert json.loads(destination.read_text()) == {"event": "start", "test": "TestA"}
+
+
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_with_results_unsupported(
+    mock_test_runner: Mock, build_context, monkeypatch, tmp_path: Path, capsys
+):
+    monkeypatch.setenv("UTR_RESULTS", str(tmp_path / "results.ndjson"))
+    mock_test_runner.return_value = 0
+
+    assert run_matched_command(commands.makefile, build_context()) == 0
+
+    mock_test_runner.assert_called_once_with(["make", "test"])
+    out, _ = capsys.readouterr()
+    assert "per-test results aren't supported for makefile" in out
+
+
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_with_results_unsupported_runs_every_argv(
+    mock_test_runner: Mock, build_context
+):
+    # like failed-first's failures and then the rest of the suite
+    mock_test_runner.side_effect = [2, 0]
+    argvs = [["make", "test", "failing"], ["make", "test"]]
+
+    assert run_with_results(commands.makefile, build_context(), argvs, None, 0) == 2
+    assert [call.args[0] for call in mock_test_runner.call_args_list] == argvs
+
+
+@patch("universal_test_runner.runner.run_plan")
+def test_run_with_slowest(mock_run_plan: Mock, build_context, monkeypatch, capsys):
+    monkeypatch.setenv("UTR_SLOWEST", "1")
+
+    def _run_plan(plan, on_event):
+        for test, duration in [("TestA", 1.0), ("TestB", 2.0)]:
+            on_event({"event": "end", "suite": "p", "test": test, "duration": duration})
+        return 0
+
+    mock_run_plan.side_effect = _run_plan
+    c = build_context()
+
+    assert run_matched_command(commands.go_single, c) == 0
+
+    out, _ = capsys.readouterr()
+    assert "2.00s  TestB" in out
+    assert "TestA" not in out
+    assert list(load_history(commands.go_single, c)[0]["tests"]) == ["TestB", "TestA"]
+
+
+@patch("universal_test_runner.runner.run_plan")
+def test_run_failed_first(mock_run_plan: Mock, build_context, monkeypatch, capsys):
+    monkeypatch.setenv("UTR_FAILED_FIRST", "1")
+    c = build_context()
+
+    def _fail(plan, on_event):
+        on_event({"event": "end", "suite": "p", "test": "TestA", "outcome": "failed"})
+        return 1
+
+    # nothing is recorded yet, so everything runs once
+    mock_run_plan.side_effect = _fail
+    assert run_matched_command(commands.go_single, c) == 1
+    out, _ = capsys.readouterr()
+    assert "no failed tests have been recorded for go_single yet" in out
+    assert load_failures(commands.go_single, c) == [{"suite": "p", "test": "TestA"}]
+
+    # then the failure goes first, and the rest skips it
+    mock_run_plan.reset_mock(side_effect=True)
+    mock_run_plan.return_value = 0
+    assert run_matched_command(commands.go_single, c) == 0
+    assert [call.args[0].argv for call in mock_run_plan.call_args_list] == [
+        ["go", "test", "-json", "-run", "^(TestA)$", "p"],
+        ["go", "test", "-json", "-skip", "^(TestA)$"],
+    ]
+
+
+@patch("universal_test_runner.runner.run_plan")
+def test_run_failed_first_still_failing(
+    mock_run_plan: Mock, build_context, monkeypatch
+):
+    monkeypatch.setenv("UTR_FAILED_FIRST", "1")
+    c = build_context()
+
+    def _fail(plan, on_event):
+        on_event({"event": "end", "suite": "p", "test": "TestA", "outcome": "failed"})
+        return 1
+
+    mock_run_plan.side_effect = _fail
+    run_matched_command(commands.go_single, c)
+
+    # the failure fails again, and the rest of the suite still runs after it
+    mock_run_plan.reset_mock()
+    mock_run_plan.side_effect = [1, 2]
+    assert run_matched_command(commands.go_single, c) == 1
+    assert [call.args[0].argv for call in mock_run_plan.call_args_list] == [
+        ["go", "test", "-json", "-run", "^(TestA)$", "p"],
+        ["go", "test", "-json", "-skip", "^(TestA)$"],
+    ]
+
+
+@pytest.mark.parametrize(
+    ["variable", "flag"], [("UTR_FAILED_FIRST", "--ff"), ("UTR_RERUN_FAILED", "--lf")]
+)
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_failed_first_pytest(
+    mock_test_runner: Mock, variable, flag, build_context, monkeypatch
+):
+    monkeypatch.setenv(variable, "1")
+    mock_test_runner.return_value = 0
+
+    run_matched_command(commands.pytest, build_context())
+
+    mock_test_runner.assert_called_once_with(["pytest", flag])
+
+
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_failed_first_unsupported(
+    mock_test_runner: Mock, build_context, monkeypatch, capsys
+):
+    monkeypatch.setenv("UTR_RERUN_FAILED", "1")
+    mock_test_runner.return_value = 0
+
+    run_matched_command(commands.makefile, build_context())
+
+    mock_test_runner.assert_called_once_with(["make", "test"])
+    out, _ = capsys.readouterr()
+    assert "failed tests can't be picked out for makefile" in out
+
+
+def test_run_with_results_unwritable(build_context, monkeypatch, tmp_path, capsys):
+    monkeypatch.setenv("UTR_RESULTS", str(tmp_path / "missing" / "results.ndjson"))
+
+    assert run_matched_command(commands.go_single, build_context()) == 1
+
+    out, _ = capsys.readouterr()
+    assert "can't write results to" in out
+
+
+@pytest.mark.parametrize(
+    ["shard", "expected"],
+    [("1/2", ["pytest", "test_a.py"]), ("2/2", ["pytest", "test_b.py"])],
+)
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_shard(mock_test_runner: Mock, shard, expected, build_context, monkeypatch):
+    monkeypatch.setenv("UTR_SHARD", shard)
+    c = build_context(["test_a.py", "test_b.py"])
+
+    run_matched_command(commands.pytest, c)
+
+    mock_test_runner.assert_called_once_with(expected)
+
+
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_shard_with_timings(
+    mock_test_runner: Mock, build_context, monkeypatch, tmp_path: Path
+):
+    (tmp_path / "timings.json").write_text(
+        json.dumps({"test_a.py": 9.0, "test_b.py": 1.0, "test_c.py": 1.0})
+    )
+    monkeypatch.setenv("UTR_SHARD", "1/2")
+    monkeypatch.setenv("UTR_SHARD_TIMINGS", str(tmp_path / "timings.json"))
+    c = build_context(["test_a.py", "test_b.py", "test_c.py"])
+
+    run_matched_command(commands.pytest, c)
+
+    mock_test_runner.assert_called_once_with(["pytest", "test_a.py"])
+
+
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_shard_unreadable_timings(
+    mock_test_runner: Mock, build_context, monkeypatch, tmp_path: Path, capsys
+):
+    monkeypatch.setenv("UTR_SHARD", "1/2")
+    monkeypatch.setenv("UTR_SHARD_TIMINGS", str(tmp_path / "missing.json"))
+
+    assert run_matched_command(commands.pytest, build_context(["test_a.py"])) == 1
+
+    mock_test_runner.assert_not_called()
+    assert "can't read shard timings from" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    ["shard", "command", "message", "code"],
+    [
+        ("nope", commands.pytest, "invalid UTR_SHARD value", 1),
+        ("1/2", commands.makefile, "sharding isn't supported for makefile", 1),
+        ("3/3", commands.pytest, "shard 3/3 has no tests to run", 0),
+    ],
+)
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_shard_errors(
+    mock_test_runner: Mock,
+    shard,
+    command,
+    message,
+    code,
+    build_context,
+    monkeypatch,
+    capsys,
+):
+    monkeypatch.setenv("UTR_SHARD", shard)
+    c = build_context(["test_a.py", "test_b.py"])
+
+    assert run_matched_command(command, c) == code
+
+    mock_test_runner.assert_not_called()
+    out, _ = capsys.readouterr()
+    assert message in out
+
+
+@patch("universal_test_runner.runner.run_jobs")
+def test_run_parallel(mock_run_jobs: Mock, build_context, monkeypatch):
+    monkeypatch.setenv("UTR_PARALLEL", "4")
+    c = build_context(["test_a.py", "test_b.py"])
+    record_durations(commands.pytest, c, {"test_a.py": 1.0, "test_b.py": 2.0})
+    mock_run_jobs.side_effect = lambda jobs, **_: [
+        JobResult(j, 0, b"", 3.0) for j in jobs
+    ]
+
+    assert run_matched_command(commands.pytest, c) == 0
+
+    jobs = mock_run_jobs.call_args.args[0]
+    assert [j.command for j in jobs] == [
+        ["pytest", "test_b.py"],
+        ["pytest", "test_a.py"],
+    ]
+    assert mock_run_jobs.call_args.kwargs["limit"] == 4
+    # durations are updated for next time
+    assert load_durations(commands.pytest, c) == {"test_a.py": 3.0, "test_b.py": 3.0}
+
+
+@patch("universal_test_runner.runner.run_jobs")
+def test_run_matrix(mock_run_jobs: Mock, build_context, monkeypatch, capsys):
+    monkeypatch.setenv("UTR_MATRIX", "3.9,3.12")
+    mock_run_jobs.side_effect = lambda jobs, **_: [
+        JobResult(jobs[0], 0, b"", 3.0),
+        JobResult(jobs[1], 2, b"", 4.0),
+    ]
+
+    assert run_matched_command(commands.uv_pytest, build_context(args=["-x"])) == 2
+
+    jobs = mock_run_jobs.call_args.args[0]
+    assert [j.command for j in jobs] == [
+        ["uv", "run", "--python", "3.9", "pytest", "-x"],
+        ["uv", "run", "--python", "3.12", "pytest", "-x"],
+    ]
+    assert mock_run_jobs.call_args.kwargs["stream"]
+    out, _ = capsys.readouterr()
+    assert "3.9   passed" in out
+    assert "3.12  failed (2)" in out
+
+
+@pytest.mark.parametrize(
+    ["command", "value", "message"],
+    [
+        (commands.pytest, "3.9", "UTR_MATRIX isn't supported for pytest"),
+        (commands.uv_pytest, " , ", "invalid UTR_MATRIX value: ','"),
+    ],
+)
+@patch("universal_test_runner.runner.run_jobs")
+def test_run_matrix_errors(
+    mock_run_jobs: Mock, command, value, message, build_context, monkeypatch, capsys
+):
+    monkeypatch.setenv("UTR_MATRIX", value)
+
+    assert run_matched_command(command, build_context()) == 1
+
+    assert message in capsys.readouterr().out
+    mock_run_jobs.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    ["returncodes", "expected"],
+    [([0, 5], 0), ([5, 5], 5), ([1, 5], 1), ([0, 2], 2)],
+)
+@patch("universal_test_runner.runner.run_jobs")
+def test_run_parallel_returncode(
+    mock_run_jobs: Mock, returncodes, expected, build_context, monkeypatch
+):
+    monkeypatch.setenv("UTR_PARALLEL", "2")
+    c = build_context(["test_a.py", "test_b.py"])
+    mock_run_jobs.side_effect = lambda jobs, **_: [
+        JobResult(j, rc, b"", 1.0) for j, rc in zip(jobs, returncodes)
+    ]
+
+    assert run_matched_command(commands.pytest, c) == expected
+
+
+@patch("universal_test_runner.runner.run_jobs")
+def test_run_parallel_with_shard(mock_run_jobs: Mock, build_context, monkeypatch):
+    monkeypatch.setenv("UTR_PARALLEL", "2")
+    monkeypatch.setenv("UTR_SHARD", "1/2")
+    c = build_context(["test_a.py", "test_b.py", "test_c.py"])
+    mock_run_jobs.side_effect = lambda jobs, **_: [
+        JobResult(j, 0, b"", 1.0) for j in jobs
+    ]
+
+    assert run_matched_command(commands.pytest, c) == 0
+
+    jobs = mock_run_jobs.call_args.args[0]
+    assert sorted(j.label for j in jobs) == ["test_a.py", "test_c.py"]
+
+
+@pytest.mark.parametrize("processes", ["1", "nope"])
+@patch("universal_test_runner.runner.run_jobs")
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_parallel_disabled(
+    mock_test_runner: Mock, mock_run_jobs: Mock, processes, build_context, monkeypatch
+):
+    monkeypatch.setenv("UTR_PARALLEL", processes)
+
+    run_matched_command(commands.pytest, build_context(["test_a.py"]))
+
+    mock_run_jobs.assert_not_called()
+    mock_test_runner.assert_called_once_with(["pytest"])
+
+
+@patch("universal_test_runner.runner.run_jobs")
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_parallel_unsupported(
+    mock_test_runner: Mock, mock_run_jobs: Mock, build_context, monkeypatch
+):
+    monkeypatch.setenv("UTR_PARALLEL", "4")
+
+    run_matched_command(commands.rust, build_context(["Cargo.toml"]))
+
+    mock_run_jobs.assert_not_called()
+    mock_test_runner.assert_called_once_with(["cargo", "test"])
+
+
+@patch("universal_test_runner.runner.run_test_command")
+@patch("universal_test_runner.runner.CoordinatorClient")
+def test_run_as_worker(mock_client: Mock, mock_test_runner: Mock, build_context):
+    client = mock_client.return_value.__enter__.return_value
+    client.next_unit.side_effect = [
+        (commands.pytest, "test_a.py"),
+        (commands.pytest, "test_b.py"),
+        None,
+    ]
+    mock_test_runner.side_effect = [0, 3]
+
+    assert run_as_worker("localhost:8000", build_context(args=["-x"])) == 3
+
+    mock_client.assert_called_once_with(("localhost", 8000))
+    assert mock_test_runner.call_args_list == [
+        call(["pytest", "-x", "test_a.py"]),
+        call(["pytest", "-x", "test_b.py"]),
+    ]
+    results = [c.args[0] for c in client.next_unit.call_args_list]
+    assert results[0] is None
+    assert [(r["unit"], r["returncode"]) for r in results[1:]] == [
+        ("test_a.py", 0),
+        ("test_b.py", 3),
+    ]
+
+
+@patch("universal_test_runner.runner.CoordinatorClient")
+def test_run_as_worker_connection_lost(mock_client: Mock, build_context, capsys):
+    mock_client.side_effect = ConnectionRefusedError("nope")
+
+    assert run_as_worker("localhost:8000", build_context()) == 1
+
+    out, _ = capsys.readouterr()
+    assert "lost the coordinator at localhost:8000" in out
+
+
+def test_run_as_worker_invalid_address(build_context, capsys):
+    assert run_as_worker("localhost", build_context()) == 1
+
+    out, _ = capsys.readouterr()
+    assert "invalid UTR_WORKER value" in out
+
+
+@patch("universal_test_runner.runner.effective_cpus", return_value=3)
+@patch("universal_test_runner.runner.run_test_command")
+def test_run_auto_parallel(
+    mock_test_runner: Mock, _cpus: Mock, build_context, monkeypatch
+):
+    monkeypatch.setenv("UTR_AUTO_PARALLEL", "1")
+
+    run_matched_command(commands.go_multi, build_context(["go.mod"], args=["-v"]))
+
+    mock_test_runner.assert_called_once_with(["go", "test", "./...", "-v", "-p", "3"])
+
+
+@pytest.mark.parametrize(
+    ["name", "expected"], [("rust", commands.rust), ("nope", commands.elixir)]
+)
+def test_chosen_command(name, expected, build_context, monkeypatch):
+    monkeypatch.setenv("UTR_COMMAND", name)
+
+    assert chosen_command(build_context(["mix.exs"])) == expected
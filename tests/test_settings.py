@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from universal_test_runner.settings import (
+    env_flag,
+    env_int,
+    env_size,
+    env_str,
+    format_size,
+    parse_size,
+    patched_environ,
+)
+
+
+@pytest.mark.parametrize(
+    ["value", "expected"],
+    [(None, False), ("0", False), ("1", True), ("yes", True), ("", True)],
+)
+def test_env_flag(value, expected, monkeypatch):
+    if value is not None:
+        monkeypatch.setenv("UTR_THING", value)
+    assert env_flag("UTR_THING") == expected
+
+
+def test_env_str(monkeypatch):
+    assert env_str("UTR_THING") is None
+    monkeypatch.setenv("UTR_THING", "   ")
+    assert env_str("UTR_THING") is None
+    monkeypatch.setenv("UTR_THING", " main ")
+    assert env_str("UTR_THING") == "main"
+
+
+def test_env_int(monkeypatch):
+    assert env_int("UTR_THING", 4) == 4
+    monkeypatch.setenv("UTR_THING", "nope")
+    assert env_int("UTR_THING", 4) == 4
+    monkeypatch.setenv("UTR_THING", "12")
+    assert env_int("UTR_THING", 4) == 12
+
+
+@pytest.mark.parametrize(
+    ["value", "expected"],
+    [
+        ("1024", 1024),
+        ("1.5K", 1536),
+        ("512m", 512 * 1024**2),
+        ("4G", 4 * 1024**3),
+        ("4GiB", 4 * 1024**3),
+        ("10MB", 10 * 1024**2),
+        ("lots", None),
+        ("", None),
+    ],
+)
+def test_parse_size(value, expected):
+    assert parse_size(value) == expected
+
+
+def test_env_size(monkeypatch):
+    assert env_size("UTR_THING", 7) == 7
+    monkeypatch.setenv("UTR_THING", "2K")
+    assert env_size("UTR_THING", 7) == 2048
+
+
+@pytest.mark.parametrize(
+    ["size", "expected"],
+    [(0, "0"), (512, "512"), (4 * 1024**3, "4G"), (1536 * 1024**2, "1.5G")],
+)
+def test_format_size(size, expected):
+    assert format_size(size) == expected
+    assert parse_size(expected) == size
+
+
+def test_patched_environ(monkeypatch):
+    monkeypatch.setenv("UTR_TEST_SET", "before")
+    monkeypatch.delenv("UTR_TEST_UNSET", raising=False)
+
+    with pytest.raises(KeyError):
+        with patched_environ({"UTR_TEST_SET": "a", "UTR_TEST_UNSET": "b"}):
+            assert os.environ["UTR_TEST_SET"] == "a"
+            assert os.environ["UTR_TEST_UNSET"] == "b"
+            raise KeyError
+
+    assert os.environ["UTR_TEST_SET"] == "before"
+    assert "UTR_TEST_UNSET" not in os.environ
@@ -0,0 +1,117 @@
+from unittest.mock import patch
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.sharding import parse_shard, partition, shard_test_command
+from universal_test_runner.timings import record_durations
+
+
+@pytest.mark.parametrize(
+    ["value", "expected"],
+    [
+        ("1/4", (1, 4)),
+        (" 4 / 4 ", (4, 4)),
+        ("0/4", None),
+        ("5/4", None),
+        ("1", None),
+        ("a/b", None),
+    ],
+)
+def test_parse_shard(value, expected):
+    assert parse_shard(value) == expected
+
+
+def test_partition_round_robin():
+    assert partition(["e", "d", "c", "b", "a"], 2) == [["a", "c", "e"], ["b", "d"]]
+
+
+def test_partition_deterministic():
+    units = [f"test_{i}.py" for i in range(20)]
+    assert partition(units, 3) == partition(list(reversed(units)), 3)
+
+
+def test_partition_more_shards_than_units():
+    assert partition(["a"], 3) == [["a"], [], []]
+
+
+def test_partition_by_duration():
+    durations = {"slow": 10.0, "medium": 5.0, "quick_1": 3.0, "quick_2": 2.0}
+    assert partition(list(durations), 2, durations) == [
+        ["slow"],
+        ["medium", "quick_1", "quick_2"],
+    ]
+
+
+def test_partition_unknown_durations_use_average():
+    # "new" is assumed to take 4s, the average
+    durations = {"a": 6.0, "b": 2.0}
+    assert partition(["a", "b", "new"], 2, durations) == [["a"], ["b", "new"]]
+
+
+def test_partition_covers_everything():
+    units = [f"u{i}" for i in range(17)]
+    durations = {u: float(i % 5) for i, u in enumerate(units)}
+
+    for shards in [partition(units, 4), partition(units, 4, durations)]:
+        assert sorted(u for s in shards for u in s) == sorted(units)
+
+
+@pytest.fixture
+def test_files(tmp_path):
+    (tmp_path / "tests").mkdir()
+    for name in ["test_a.py", "test_b.py", "test_c.py"]:
+        (tmp_path / "tests" / name).touch()
+
+
+@pytest.mark.usefixtures("test_files")
+def test_shard_test_command(build_context: ContextBuilderFunc):
+    c = build_context()
+
+    assert shard_test_command(commands.pytest, c, 1, 2) == [
+        "pytest",
+        "tests/test_a.py",
+        "tests/test_c.py",
+    ]
+    assert shard_test_command(commands.pytest, c, 2, 2) == ["pytest", "tests/test_b.py"]
+    assert shard_test_command(commands.pytest, c, 4, 4) == []
+
+
+@pytest.mark.usefixtures("test_files")
+def test_shard_test_command_uses_durations(build_context: ContextBuilderFunc):
+    c = build_context()
+    durations = {"tests/test_a.py": 9.0, "tests/test_b.py": 1.0, "tests/test_c.py": 1.0}
+
+    assert shard_test_command(commands.pytest, c, 1, 2, durations) == [
+        "pytest",
+        "tests/test_a.py",
+    ]
+
+
+@pytest.mark.usefixtures("test_files")
+def test_shard_test_command_ignores_recorded_durations(
+    build_context: ContextBuilderFunc,
+):
+    c = build_context()
+    # other machines won't have these, so they'd split the suite differently
+    record_durations(
+        commands.pytest,
+        c,
+        {"tests/test_a.py": 9.0, "tests/test_b.py": 1.0, "tests/test_c.py": 1.0},
+    )
+
+    assert shard_test_command(commands.pytest, c, 1, 2) == [
+        "pytest",
+        "tests/test_a.py",
+        "tests/test_c.py",
+    ]
+
+
+def test_shard_test_command_unsupported(build_context: ContextBuilderFunc):
+    assert shard_test_command(commands.makefile, build_context(), 1, 2) is None
+
+
+@patch("universal_test_runner.units.go_packages", return_value=None)
+def test_shard_test_command_no_units(_, build_context: ContextBuilderFunc):
+    assert shard_test_command(commands.go_multi, build_context(), 1, 2) is None
@@ -0,0 +1,133 @@
+from unittest.mock import patch
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.slowest import (
+    MAX_RUNS,
+    SlowestTests,
+    load_history,
+    print_slowest,
+    record_run,
+    show_trends,
+)
+
+
+def _end(test: str, duration, suite="a.py", **extra):
+    return {
+        "event": "end",
+        "suite": suite,
+        "test": test,
+        "outcome": "passed",
+        "duration": duration,
+        **extra,
+    }
+
+
+def test_slowest_tests():
+    slowest = SlowestTests(2)
+    for event in [
+        _end("a", 1.0),
+        _end("b", 3.0),
+        {"event": "start", "suite": "a.py", "test": "c"},
+        _end("c", 2.0, suite="b.py"),
+        _end("d", None),
+        _end("e", 0.5, suite="b.py"),
+        # subtests count as tests, but not towards their suite's total
+        _end("c/sub", 1.5, suite="b.py", parent="c"),
+    ]:
+        slowest.add(event)
+
+    assert slowest.tests(2) == [("b", 3.0), ("c", 2.0)]
+    assert slowest.suites(2) == [("a.py", 4.0, 2), ("b.py", 2.5, 2)]
+
+
+def test_slowest_tests_keeps_only_the_slowest():
+    slowest = SlowestTests(1)
+    for i in range(1000):
+        slowest.add(_end(f"t{i}", i / 1000))
+
+    assert len(slowest.heap) == slowest.limit
+    assert slowest.tests(1) == [("t999", 0.999)]
+
+
+def test_print_slowest(capsys):
+    slowest = SlowestTests(5)
+    slowest.add(_end("tests/a.py::test_big", 12.5, suite="tests/a.py"))
+
+    print_slowest(slowest, 5)
+
+    out, _ = capsys.readouterr()
+    assert "slowest 1 test(s)" in out
+    assert "12.50s  tests/a.py::test_big" in out
+    assert "12.50s  tests/a.py (1 test(s))" in out
+
+
+def test_print_slowest_nothing_reported(capsys):
+    print_slowest(SlowestTests(5), 5)
+
+    out, _ = capsys.readouterr()
+    assert "no test durations were reported" in out
+
+
+def test_record_run(build_context: ContextBuilderFunc):
+    c = build_context()
+    slowest = SlowestTests(5)
+    slowest.add(_end("a", 1.23456))
+
+    for _ in range(MAX_RUNS + 2):
+        record_run(commands.pytest, c, slowest)
+
+    history = load_history(commands.pytest, c)
+    assert len(history) == MAX_RUNS
+    assert history[-1]["tests"] == {"a": 1.235}
+    assert history[-1]["suites"] == {"a.py": 1.235}
+    assert load_history(commands.go_multi, c) == []
+
+
+def test_record_run_nothing_reported(build_context: ContextBuilderFunc):
+    c = build_context()
+
+    record_run(commands.pytest, c, SlowestTests(5))
+
+    assert load_history(commands.pytest, c) == []
+
+
+def test_show_trends(build_context: ContextBuilderFunc, capsys):
+    c = build_context()
+    for durations in [{"a": 1.0, "b": 2.0}, {"a": 3.0, "b": 2.0}, {"a": 4.0, "c": 5.0}]:
+        slowest = SlowestTests(5)
+        for test, duration in durations.items():
+            slowest.add(_end(test, duration))
+        with patch("time.time", return_value=0):
+            record_run(commands.pytest, c, slowest)
+
+    assert show_trends(commands.pytest, c, 10) == 0
+
+    out, _ = capsys.readouterr()
+    lines = out.splitlines()
+    header = next(i for i, line in enumerate(lines) if "slowest tests:" in line)
+    tests = lines[header + 2 :]
+    assert tests[0].split() == ["5.00s", "-", "new", "c"]
+    # compared to the median of the earlier runs (1s and 3s), which is what's shown
+    assert tests[1].split() == ["4.00s", "2.00s", "+100%", "a"]
+
+
+def test_show_trends_ignores_noise(build_context: ContextBuilderFunc, capsys):
+    c = build_context()
+    for duration in [0.001, 0.004]:
+        slowest = SlowestTests(5)
+        slowest.add(_end("a", duration))
+        record_run(commands.pytest, c, slowest)
+
+    show_trends(commands.pytest, c, 10)
+
+    out, _ = capsys.readouterr()
+    assert "   -  a" in out
+
+
+def test_show_trends_without_history(build_context: ContextBuilderFunc, capsys):
+    assert show_trends(commands.pytest, build_context(), 10) == 1
+    assert show_trends(None, build_context(), 10) == 1
+
+    out, _ = capsys.readouterr()
+    assert "no test durations have been recorded for pytest yet" in out
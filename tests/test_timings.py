@@ -0,0 +1,52 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.timings import (
+    export_durations,
+    load_durations,
+    read_timings_file,
+    record_durations,
+)
+
+
+def test_durations(build_context: ContextBuilderFunc):
+    c = build_context()
+    assert load_durations(commands.pytest, c) == {}
+
+    record_durations(commands.pytest, c, {"a.py": 1.0, "b.py": 2.0})
+    record_durations(commands.pytest, c, {"b.py": 3.0, "c.py": 4.0})
+
+    assert load_durations(commands.pytest, c) == {"a.py": 1.0, "b.py": 3.0, "c.py": 4.0}
+    # each command is tracked separately
+    assert load_durations(commands.py, c) == {}
+
+
+def test_read_timings_file(tmp_path: Path):
+    path = tmp_path / "timings.json"
+    assert read_timings_file(str(path)) is None
+
+    path.write_text(json.dumps({"a.py": 1, "b.py": 2.5}))
+    assert read_timings_file(str(path)) == {"a.py": 1.0, "b.py": 2.5}
+
+
+@pytest.mark.parametrize("text", ["nope", "[1, 2]", '{"a.py": "slow"}'])
+def test_read_timings_file_invalid(text: str, tmp_path: Path):
+    (path := tmp_path / "timings.json").write_text(text)
+
+    assert read_timings_file(str(path)) is None
+
+
+def test_export_durations(build_context: ContextBuilderFunc, tmp_path: Path, capsys):
+    c = build_context()
+    assert export_durations(commands.pytest, c) == 1
+    assert "no durations have been recorded for pytest" in capsys.readouterr().err
+
+    record_durations(commands.pytest, c, {"b.py": 2.0, "a.py": 1.0})
+    assert export_durations(commands.pytest, c) == 0
+
+    (path := tmp_path / "timings.json").write_text(capsys.readouterr().out)
+    assert read_timings_file(str(path)) == {"a.py": 1.0, "b.py": 2.0}
@@ -0,0 +1,131 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+import universal_test_runner.commands as commands
+from universal_test_runner.tmpfs import (
+    UsageMonitor,
+    disk_usage,
+    ram_scratch,
+    remove_abandoned,
+    with_basetemp,
+)
+
+
+@pytest.fixture
+def root(tmp_path: Path, monkeypatch) -> Path:
+    monkeypatch.setenv("UTR_TMPFS_ROOT", str(tmp_path))
+    return tmp_path
+
+
+def test_disk_usage(tmp_path: Path):
+    (tmp_path / "a").write_bytes(b"x" * 10_000)
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "nested" / "b").write_bytes(b"x" * 20_000)
+
+    assert 30_000 <= disk_usage(tmp_path) < 40_000
+    assert disk_usage(tmp_path / "missing") == 0
+
+
+def test_remove_abandoned(tmp_path: Path):
+    finished = subprocess.Popen(["true"])
+    finished.wait()
+    abandoned = tmp_path / f"utr-{finished.pid}-abc"
+    running = tmp_path / f"utr-{os.getpid()}-def"
+    unrelated = tmp_path / "other"
+    for directory in (abandoned, running, unrelated):
+        directory.mkdir()
+
+    remove_abandoned(tmp_path)
+
+    assert not abandoned.exists()
+    assert running.exists()
+    assert unrelated.exists()
+
+
+@patch("universal_test_runner.tmpfs.stop_children")
+def test_usage_monitor(mock_stop: Mock, tmp_path: Path):
+    monitor = UsageMonitor(tmp_path, 50_000)
+    (tmp_path / "a").write_bytes(b"x" * 20_000)
+    monitor.check()
+    (tmp_path / "a").unlink()
+    monitor.check()
+
+    assert 20_000 <= monitor.peak < 30_000
+    assert not monitor.exceeded
+    mock_stop.assert_not_called()
+
+    (tmp_path / "b").write_bytes(b"x" * 60_000)
+    monitor.check()
+    monitor.check()
+
+    assert monitor.exceeded
+    mock_stop.assert_called_once_with()
+
+
+def test_ram_scratch(root: Path, monkeypatch, capsys):
+    monkeypatch.setenv("TMPDIR", "/elsewhere")
+    monkeypatch.delenv("TEMP", raising=False)
+    monkeypatch.setenv("UTR_TMPFS_SIZE", "1M")
+
+    with ram_scratch() as scratch:
+        assert scratch
+        assert scratch.path.parent == root
+        assert scratch.limit == 1024**2
+        assert os.environ["TMPDIR"] == os.environ["TEMP"] == str(scratch.path)
+        (scratch.path / "file").write_bytes(b"x" * 100_000)
+
+    assert os.environ["TMPDIR"] == "/elsewhere"
+    assert "TEMP" not in os.environ
+    assert not scratch.path.exists()
+    out, _ = capsys.readouterr()
+    assert "the scratch directory used at most" in out
+    assert "of 1M" in out
+
+
+def test_ram_scratch_missing_root(tmp_path: Path, monkeypatch, capsys):
+    monkeypatch.setenv("UTR_TMPFS_ROOT", str(tmp_path / "missing"))
+
+    with ram_scratch() as scratch:
+        assert scratch is None
+
+    out, _ = capsys.readouterr()
+    assert "can't create a scratch directory in" in out
+
+
+def test_ram_scratch_cleans_up_when_terminated(root: Path):
+    script = """
+import os, signal, time
+from universal_test_runner.tmpfs import ram_scratch
+with ram_scratch() as scratch:
+    print(scratch.path, flush=True)
+    os.kill(os.getpid(), signal.SIGTERM)
+    time.sleep(10)
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, timeout=30
+    )
+
+    assert result.returncode == 128 + 15
+    assert not Path(result.stdout.splitlines()[0]).exists()
+    assert list(root.iterdir()) == []
+
+
+@pytest.mark.parametrize(
+    ["command", "argv", "expected"],
+    [
+        (commands.pytest, ["pytest", "-x"], ["pytest", "-x", "--basetemp=/ram/pytest"]),
+        (commands.pytest, ["pytest", "--basetemp=here"], ["pytest", "--basetemp=here"]),
+        (commands.go_single, ["go", "test"], ["go", "test"]),
+    ],
+)
+def test_with_basetemp(command, argv, expected, monkeypatch):
+    monkeypatch.setenv("TMPDIR", "/ram")
+    assert with_basetemp(command, argv) == argv
+
+    monkeypatch.setenv("UTR_TMPFS", "1")
+    assert with_basetemp(command, argv) == expected
@@ -0,0 +1,181 @@
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.units import UNIT_KINDS, unit_jobs
+
+
+@pytest.fixture
+def make_files(tmp_path: Path):
+    def _make(*paths: str):
+        for p in paths:
+            (tmp_path / p).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / p).touch()
+
+    return _make
+
+
+def test_pytest_units(make_files, build_context: ContextBuilderFunc):
+    make_files(
+        "tests/test_a.py",
+        "tests/b_test.py",
+        "tests/helpers.py",
+        "tests/conftest.py",
+        ".venv/lib/test_nope.py",
+        "node_modules/pkg/test_nope.py",
+    )
+    c = build_context(args=["-x"])
+    kind = UNIT_KINDS[commands.uv_pytest]
+
+    assert kind.find(c) == ["tests/b_test.py", "tests/test_a.py"]
+    assert kind.build(commands.uv_pytest, c, ["tests/test_a.py"]) == [
+        "uv",
+        "run",
+        "pytest",
+        "-x",
+        "tests/test_a.py",
+    ]
+
+
+def test_unittest_units(make_files, build_context: ContextBuilderFunc):
+    make_files("tests/test_a.py", "tests/tests.py", "tests/helpers.py")
+    c = build_context()
+    kind = UNIT_KINDS[commands.py]
+
+    assert kind.find(c) == ["tests/test_a.py", "tests/tests.py"]
+    assert kind.build(commands.py, c, ["tests/tests.py"]) == [
+        "python",
+        "-m",
+        "unittest",
+        "tests/tests.py",
+    ]
+
+
+def test_django_units(make_files, build_context: ContextBuilderFunc):
+    make_files("app/tests/test_views.py", "app/views.py")
+    c = build_context()
+    kind = UNIT_KINDS[commands.django]
+
+    assert kind.find(c) == ["app/tests/test_views.py"]
+    assert kind.build(commands.django, c, ["app/tests/test_views.py"]) == [
+        "./manage.py",
+        "test",
+        "app.tests.test_views",
+    ]
+
+
+@patch("universal_test_runner.units.go_packages")
+def test_go_units(mock_packages: Mock, build_context: ContextBuilderFunc):
+    mock_packages.return_value = {
+        "example.com/m/b": {"has_tests": True},
+        "example.com/m/a": {"has_tests": True},
+        "example.com/m/cmd": {"has_tests": False},
+    }
+    c = build_context(args=["-v"])
+    kind = UNIT_KINDS[commands.go_multi]
+
+    assert kind.find(c) == ["example.com/m/a", "example.com/m/b"]
+    assert kind.build(commands.go_multi, c, ["example.com/m/a"]) == [
+        "go",
+        "test",
+        "-v",
+        "example.com/m/a",
+    ]
+
+
+@patch("universal_test_runner.units.go_packages")
+def test_go_units_unavailable(mock_packages: Mock, build_context: ContextBuilderFunc):
+    mock_packages.return_value = None
+    assert UNIT_KINDS[commands.go_multi].find(build_context()) is None
+
+
+@patch("universal_test_runner.units.cargo_crates")
+def test_cargo_units(mock_crates: Mock, build_context: ContextBuilderFunc):
+    mock_crates.return_value = {"core": {}, "api": {}}
+    c = build_context(args=["--", "--nocapture"])
+    kind = UNIT_KINDS[commands.rust]
+
+    assert kind.find(c) == ["api", "core"]
+    assert kind.build(commands.rust, c, ["api", "core"]) == [
+        "cargo",
+        "test",
+        "-p",
+        "api",
+        "-p",
+        "core",
+        "--",
+        "--nocapture",
+    ]
+
+
+def test_js_units(make_files, build_context: ContextBuilderFunc):
+    make_files(
+        "src/a.test.ts",
+        "src/b.spec.jsx",
+        "src/__tests__/c.js",
+        "src/component.tsx",
+        "node_modules/pkg/d.test.js",
+        "dist/e.test.js",
+    )
+    c = build_context()
+
+    assert UNIT_KINDS[commands.npm].find(c) == [
+        "src/__tests__/c.js",
+        "src/a.test.ts",
+        "src/b.spec.jsx",
+    ]
+
+
+@pytest.mark.parametrize(
+    ["command", "args", "expected"],
+    [
+        (commands.npm, [], ["npm", "test", "--", "a.test.js"]),
+        (commands.npm, ["--", "--ci"], ["npm", "test", "--", "--ci", "a.test.js"]),
+        (commands.yarn, ["--ci"], ["yarn", "test", "--ci", "a.test.js"]),
+        (commands.bun, [], ["bun", "test", "a.test.js"]),
+    ],
+)
+def test_js_build(command, args, expected, build_context: ContextBuilderFunc):
+    c = build_context(args=args)
+    assert UNIT_KINDS[command].build(command, c, ["a.test.js"]) == expected
+
+
+def test_elixir_units(make_files, build_context: ContextBuilderFunc):
+    make_files(
+        "test/app_test.exs", "test/nested/thing_test.exs", "test/test_helper.exs"
+    )
+
+    assert UNIT_KINDS[commands.elixir].find(build_context()) == [
+        "test/app_test.exs",
+        "test/nested/thing_test.exs",
+    ]
+
+
+def test_clojure_units(make_files, build_context: ContextBuilderFunc):
+    make_files("test/my_app/core_test.clj", "test/my_app/util/shared.cljc")
+    c = build_context()
+    kind = UNIT_KINDS[commands.clojure]
+
+    assert kind.find(c) == ["my-app.core-test", "my-app.util.shared"]
+    assert kind.build(commands.clojure, c, ["my-app.core-test"]) == [
+        "lein",
+        "test",
+        "my-app.core-test",
+    ]
+
+
+def test_unit_jobs_longest_first(build_context: ContextBuilderFunc):
+    c = build_context(args=["-x"])
+    jobs = unit_jobs(
+        commands.pytest,
+        c,
+        ["quick.py", "new.py", "slow.py"],
+        {"quick.py": 1.0, "slow.py": 5.0},
+    )
+
+    # units without a known duration go first
+    assert [j.label for j in jobs] == ["new.py", "slow.py", "quick.py"]
+    assert jobs[0].command == ["pytest", "-x", "new.py"]
@@ -0,0 +1,31 @@
+import pytest
+
+import universal_test_runner.commands as commands
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.warm import build_command, keep_warm
+
+
+@pytest.mark.parametrize(
+    ["command", "args", "expected"],
+    [
+        (commands.rust, [], ["cargo", "test", "--no-run"]),
+        (
+            commands.rust,
+            ["--release", "--", "--nocapture"],
+            ["cargo", "test", "--no-run", "--release", "--", "--nocapture"],
+        ),
+        (commands.go_multi, [], ["go", "test", "-run", "^$", "./..."]),
+        (commands.go_single, ["-race"], ["go", "test", "-run", "^$", "-race"]),
+        (commands.pytest, [], None),
+    ],
+)
+def test_build_command(command, args, expected, build_context: ContextBuilderFunc):
+    assert build_command(command, build_context(args=args)) == expected
+
+
+@pytest.mark.parametrize("command", [None, commands.elixir])
+def test_keep_warm_unsupported(command, build_context: ContextBuilderFunc, capsys):
+    assert keep_warm(command, build_context()) == 1
+
+    out, _ = capsys.readouterr()
+    assert "there's nothing to precompile" in out
@@ -0,0 +1,120 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from tests.conftest import ContextBuilderFunc
+from universal_test_runner.watch import (
+    Change,
+    Inotify,
+    _without_temporary_files,
+    is_ignored,
+    is_relevant,
+    needs_detection,
+    only_tool_state,
+)
+
+
+@pytest.mark.parametrize(
+    ["path", "expected"],
+    [
+        ("src/app.py", False),
+        ("pyproject.toml", False),
+        (".justfile", False),
+        (".git/index", True),
+        ("src/.hidden", True),
+        ("node_modules/pkg/index.js", True),
+        ("__pycache__", True),
+        ("src/__pycache__/app.cpython-312.pyc", True),
+        ("target/debug/app", True),
+        ("venv/lib/python3.12/site-packages/pkg/__init__.py", True),
+        ("lib/site-packages/pkg/__init__.py", True),
+        ("src/app.py.swp", True),
+        ("src/.#app.py", True),
+        ("src/app.py~", True),
+    ],
+)
+def test_is_ignored(path, expected):
+    assert is_ignored(path) == expected
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="inotify is linux-only")
+def test_inotify(tmp_path: Path):
+    (tmp_path / "node_modules").mkdir()
+    inotify = Inotify(str(tmp_path))
+
+    (tmp_path / "a.py").write_text("1")
+    (tmp_path / "node_modules" / "b.js").write_text("1")
+    assert inotify.read(1) == [Change("a.py", "created"), Change("a.py", "modified")]
+
+    # new directories are watched too
+    (tmp_path / "pkg").mkdir()
+    assert inotify.read(1) == [Change("pkg", "created")]
+    (tmp_path / "pkg" / "c.py").write_text("1")
+    (tmp_path / "a.py").unlink()
+    assert inotify.read(1) == [
+        Change("pkg/c.py", "created"),
+        Change("pkg/c.py", "modified"),
+        Change("a.py", "deleted"),
+    ]
+
+    assert inotify.read(0) == []
+    inotify.close()
+
+
+def test_without_temporary_files(tmp_path: Path):
+    (tmp_path / "kept.py").touch()
+    changes = [
+        Change("tmp123", "created"),
+        Change("tmp123", "deleted"),
+        Change("kept.py", "created"),
+        Change("gone.py", "deleted"),
+    ]
+
+    assert _without_temporary_files(changes, str(tmp_path)) == [
+        Change("kept.py", "created"),
+        Change("gone.py", "deleted"),
+    ]
+
+
+def test_relevant_changes(build_context: ContextBuilderFunc):
+    c = build_context()
+    c.has_any_files(".pytest_cache")
+    changes = [
+        Change(".coverage", "modified"),
+        Change(".pytest_cache", "created"),
+        Change("src/app.py", "modified"),
+    ]
+
+    assert [ch for ch in changes if is_relevant(ch, c)] == changes[1:]
+
+
+@pytest.mark.parametrize(
+    ["changes", "expected"],
+    [
+        (None, True),
+        ([], False),
+        ([Change("src/app.py", "created")], False),
+        ([Change("app.py", "modified")], False),
+        ([Change("app.py", "created")], True),
+        ([Change("pyproject.toml", "modified")], True),
+    ],
+)
+def test_needs_detection(changes, expected, build_context: ContextBuilderFunc):
+    c = build_context(["pyproject.toml"])
+    c.load_file("pyproject.toml")
+
+    assert needs_detection(changes, c) == expected
+
+
+@pytest.mark.parametrize(
+    ["changes", "expected"],
+    [
+        (None, False),
+        ([], False),
+        ([Change(".pytest_cache", "created")], True),
+        ([Change(".pytest_cache", "created"), Change("a.py", "modified")], False),
+    ],
+)
+def test_only_tool_state(changes, expected):
+    assert only_tool_state(changes) == expected
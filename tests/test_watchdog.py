@@ -0,0 +1,166 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from universal_test_runner.capture import is_supported, run_captured
+from universal_test_runner.watchdog import (
+    KILL_GRACE,
+    TIMED_OUT,
+    ProcessInfo,
+    Watchdog,
+    print_report,
+    snapshot,
+)
+
+
+def _info(pid: int, ppid: int, command: str) -> ProcessInfo:
+    return ProcessInfo(
+        pid=pid,
+        ppid=ppid,
+        state="sleeping",
+        cpu_seconds=1.5,
+        waiting_on="do_wait",
+        command=command,
+    )
+
+
+@patch("universal_test_runner.watchdog.signal_session")
+@patch("universal_test_runner.watchdog.snapshot")
+def test_watchdog_idle_timeout(mock_snapshot: Mock, mock_signal: Mock):
+    mock_snapshot.return_value = [_info(10, 1, "go test")]
+    watchdog = Watchdog(0, 5, started=0, last_output=0)
+
+    watchdog.check(10, 4)
+    watchdog.output(4)
+    watchdog.check(10, 8)
+    mock_signal.assert_not_called()
+
+    watchdog.check(10, 9)
+    assert watchdog.reason == "it printed nothing for 5s"
+    assert watchdog.processes == [_info(10, 1, "go test")]
+    mock_signal.assert_called_once_with(10, signal.SIGTERM)
+
+    # it gets a chance to clean up before being killed
+    watchdog.check(10, 9 + KILL_GRACE - 1)
+    watchdog.check(10, 9 + KILL_GRACE)
+    watchdog.check(10, 9 + KILL_GRACE + 1)
+    assert mock_signal.call_args_list[1:] == [((10, signal.SIGKILL),)]
+
+
+@patch("universal_test_runner.watchdog.signal_session")
+@patch("universal_test_runner.watchdog.snapshot")
+def test_watchdog_timeout(mock_snapshot: Mock, mock_signal: Mock):
+    mock_snapshot.return_value = []
+    watchdog = Watchdog(30, 0, started=0, last_output=0)
+
+    watchdog.check(10, 29)
+    assert not watchdog.reason
+
+    watchdog.check(10, 30)
+    assert watchdog.reason == "it took longer than 30s"
+
+
+def test_print_report(capsys):
+    watchdog = Watchdog(30, 0, reason="it took longer than 30s")
+    watchdog.processes = [
+        _info(10, 1, "go test ./..."),
+        _info(11, 10, "/tmp/go-build/calc.test"),
+        _info(20, 1, "node worker.js"),
+    ]
+
+    print_report(watchdog)
+
+    out, _ = capsys.readouterr()
+    assert "the tests were stopped because it took longer than 30s" in out
+    assert (
+        "     11  sleeping      1.50s  do_wait               /tmp/go-build/calc.test"
+        in out
+    )
+    assert "     20  sleeping      1.50s  do_wait             node worker.js" in out
+
+
+def _alive(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # a zombie is just waiting to be reaped by init
+            return f.read().rsplit(") ", 1)[1][0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+needs_proc = pytest.mark.skipif(
+    not os.path.isdir("/proc") or not is_supported(), reason="needs /proc"
+)
+
+
+@needs_proc
+def test_snapshot():
+    proc = subprocess.Popen(
+        [sys.executable, "-c", "import subprocess; subprocess.run(['sleep', '30'])"],
+        start_new_session=True,
+    )
+    try:
+        processes = snapshot(proc.pid)
+        for _ in range(50):
+            if len(processes) == 2:
+                break
+            time.sleep(0.1)
+            processes = snapshot(proc.pid)
+
+        assert [(p.pid, p.command) for p in processes][0] == (
+            proc.pid,
+            f"{sys.executable} -c import subprocess; subprocess.run(['sleep', '30'])",
+        )
+        assert processes[1].ppid == proc.pid
+        assert processes[1].command == "sleep 30"
+    finally:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+
+
+@needs_proc
+def test_run_captured_stops_the_whole_group(tmp_path, capsys):
+    # the grandchild ignores SIGTERM and would outlive its parent
+    pid_file = tmp_path / "pid"
+    script = f"""
+import subprocess, sys
+child = subprocess.Popen([sys.executable, "-c", "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); time.sleep(60)"])
+open({str(pid_file)!r}, "w").write(str(child.pid))
+print("started", flush=True)
+child.wait()
+"""
+
+    with patch("universal_test_runner.watchdog.KILL_GRACE", 0.5):
+        returncode = run_captured(
+            [sys.executable, "-c", script], 0, None, Watchdog(0, 1)
+        )
+
+    assert returncode == TIMED_OUT
+    out, _ = capsys.readouterr()
+    assert "started" in out
+    assert "it printed nothing for 1s" in out
+    assert "time.sleep(60)" in out
+    time.sleep(0.2)
+    assert not _alive(int(pid_file.read_text()))
+
+
+@needs_proc
+def test_run_captured_cleans_up_after_a_passing_run(tmp_path):
+    # a background process the tests forgot about, which would otherwise hold on to its ports
+    pid_file = tmp_path / "pid"
+    script = f"""
+import subprocess, sys
+child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+open({str(pid_file)!r}, "w").write(str(child.pid))
+"""
+
+    returncode = run_captured([sys.executable, "-c", script], 0, None, Watchdog(60, 0))
+
+    assert returncode == 0
+    time.sleep(0.2)
+    assert not _alive(int(pid_file.read_text()))
@@ -0,0 +1,170 @@
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from tests.conftest import ContextBuilderFunc, FileWriterFunc
+from universal_test_runner.cache import mtime_key, write_cache
+from universal_test_runner.workspaces import (
+    ROOT_MANIFESTS,
+    Workspace,
+    _pnpm_patterns,
+    find_workspaces,
+    workspace_jobs,
+    workspace_patterns,
+)
+
+
+@pytest.fixture
+def add_package(tmp_path: Path):
+    def _add(path: str, name: str, test: bool = True, **deps: list[str]):
+        (pkg := tmp_path / path).mkdir(parents=True)
+        manifest: dict = {"name": name}
+        if test:
+            manifest["scripts"] = {"test": "jest"}
+        for key, names in deps.items():
+            manifest[key] = {n: "workspace:*" for n in names}
+        (pkg / "package.json").write_text(json.dumps(manifest))
+
+    return _add
+
+
+@pytest.mark.parametrize(
+    ["text", "expected"],
+    [
+        ("packages:\n  - 'packages/*'\n  - \"apps/*\"\n", ["packages/*", "apps/*"]),
+        (
+            "# comment\npackages:\n  - packages/* # trailing\n\n  - '!**/test/**'\ncatalog:\n  - nope\n",
+            ["packages/*", "!**/test/**"],
+        ),
+        ("catalog:\n  react: ^18\n", []),
+        ("", []),
+    ],
+)
+def test_pnpm_patterns(text: str, expected: list[str]):
+    assert _pnpm_patterns(text.splitlines()) == expected
+
+
+@pytest.mark.parametrize(
+    "package_json",
+    [
+        {"workspaces": ["packages/*"]},
+        {"workspaces": {"packages": ["packages/*"], "nohoist": ["**/react"]}},
+    ],
+)
+def test_workspace_patterns(
+    package_json, build_context: ContextBuilderFunc, write_file: FileWriterFunc
+):
+    write_file("package.json", json.dumps(package_json))
+    assert workspace_patterns(build_context()) == ["packages/*"]
+
+
+def test_workspace_patterns_missing(build_context: ContextBuilderFunc):
+    assert workspace_patterns(build_context()) == []
+
+
+def test_find_workspaces(
+    add_package, build_context: ContextBuilderFunc, write_file: FileWriterFunc
+):
+    write_file(
+        "package.json", json.dumps({"workspaces": ["packages/*", "!packages/skip"]})
+    )
+    add_package("packages/core", "core")
+    add_package("packages/ui", "ui", dependencies=["core", "react"])
+    add_package("packages/docs", "docs", test=False, devDependencies=["ui"])
+    add_package("packages/skip", "skip")
+
+    assert find_workspaces(build_context()) == [
+        Workspace("core", "packages/core", True, ()),
+        Workspace("docs", "packages/docs", False, ("ui",)),
+        Workspace("ui", "packages/ui", True, ("core",)),
+    ]
+
+
+def test_find_workspaces_uses_cache(
+    add_package,
+    build_context: ContextBuilderFunc,
+    write_file: FileWriterFunc,
+    tmp_path: Path,
+):
+    write_file("package.json", json.dumps({"workspaces": ["packages/*"]}))
+    add_package("packages/core", "core")
+    first = find_workspaces(build_context())
+
+    with patch("universal_test_runner.workspaces._build_workspaces") as mock_build:
+        assert find_workspaces(build_context()) == first
+        mock_build.assert_not_called()
+
+    # editing a member's manifest rebuilds the graph
+    (tmp_path / "packages/core/package.json").write_text(json.dumps({"name": "new"}))
+    assert find_workspaces(build_context()) == [
+        Workspace("new", "packages/core", False, ())
+    ]
+
+    # so does a new member that matches an existing pattern, or removing one
+    add_package("packages/ui", "ui", dependencies=["new"])
+    assert find_workspaces(build_context()) == [
+        Workspace("new", "packages/core", False, ()),
+        Workspace("ui", "packages/ui", True, ("new",)),
+    ]
+    (tmp_path / "packages/ui/package.json").unlink()
+    assert find_workspaces(build_context()) == [
+        Workspace("new", "packages/core", False, ())
+    ]
+
+
+@pytest.mark.parametrize(
+    "cached",
+    [
+        lambda members_key: {"workspaces": []},
+        lambda members_key: {"members_key": members_key},
+        lambda members_key: {"members_key": members_key, "workspaces": [{}]},
+        lambda members_key: ["core"],
+    ],
+)
+def test_find_workspaces_unexpected_cache(
+    cached, add_package, build_context: ContextBuilderFunc, write_file: FileWriterFunc
+):
+    # e.g. written by an older version
+    write_file("package.json", json.dumps({"workspaces": ["packages/*"]}))
+    add_package("packages/core", "core")
+    c = build_context()
+    members_key = mtime_key(c.cwd, ["packages/core/package.json"])
+    root_key = mtime_key(c.cwd, ROOT_MANIFESTS)
+    write_cache("js-workspaces", c.cwd, root_key, cached(members_key))
+
+    assert find_workspaces(c) == [Workspace("core", "packages/core", True, ())]
+
+
+def test_workspace_jobs(
+    add_package, build_context: ContextBuilderFunc, write_file: FileWriterFunc
+):
+    write_file("pnpm-workspace.yaml", "packages:\n  - 'packages/*'\n")
+    add_package("packages/core", "core")
+    # no tests here, so ui waits on core directly
+    add_package("packages/utils", "utils", test=False, dependencies=["core"])
+    add_package("packages/ui", "ui", dependencies=["utils"])
+    # cycles lose their ordering, rather than deadlocking
+    add_package("packages/a", "a", dependencies=["b"])
+    add_package("packages/b", "b", dependencies=["a"])
+
+    c = build_context(args=["--ci"])
+    jobs = {j.label: j for j in workspace_jobs(c, "pnpm") or []}
+
+    assert sorted(jobs) == ["a", "b", "core", "ui"]
+    assert jobs["ui"].command == ["pnpm", "test", "--ci"]
+    assert jobs["ui"].cwd == str(Path(c.cwd, "packages/ui"))
+    assert jobs["ui"].dependencies == ("core",)
+    assert jobs["core"].dependencies == ()
+    assert jobs["a"].dependencies == jobs["b"].dependencies == ()
+
+
+def test_workspace_jobs_not_a_workspace(
+    add_package, build_context: ContextBuilderFunc, write_file: FileWriterFunc
+):
+    assert workspace_jobs(build_context(), "npm") is None
+
+    write_file("package.json", json.dumps({"workspaces": ["packages/*"]}))
+    add_package("packages/core", "core", test=False)
+    assert workspace_jobs(build_context(), "npm") is None
@@ -0,0 +1,503 @@
+"""
+Change-based test selection: given the files that changed since a git ref, only run the tests that could have been affected by them.
+
+Each supported `Command` has a selector that returns the argv to run, or an empty list if nothing was affected. A selector returns `None` when it can't safely narrow the run (e.g. a dependency manifest changed), in which case everything runs as usual.
+"""
+
+import ast
+import hashlib
+import json
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from universal_test_runner.cache import digest, mtime_key, read_cache, write_cache
+from universal_test_runner.commands import PYTEST_COMMANDS, Command, go_multi, rust
+from universal_test_runner.context import Context
+from universal_test_runner.git import changed_files
+
+Selector = Callable[[Command, Context, list[str]], Optional[list[str]]]
+
+
+def walk_files(
+    cwd: str, suffixes: tuple[str, ...], skip_dirs: set[str]
+) -> Iterator[str]:
+    """
+    paths (relative to `cwd`) of every file ending in one of `suffixes`, skipping hidden directories and `skip_dirs`
+    """
+    for root, dirs, files in os.walk(cwd):
+        # prune in place so os.walk doesn't descend into them
+        dirs[:] = [d for d in dirs if d not in skip_dirs and not d.startswith(".")]
+        for f in files:
+            if f.endswith(suffixes):
+                yield os.path.relpath(os.path.join(root, f), cwd)
+
+
+def _source_mtimes(cwd: str, suffixes: tuple[str, ...], skip_dirs: set[str]) -> str:
+    """
+    a key that changes whenever a matching source file is added, removed, or edited
+    """
+    return digest(
+        {
+            path: os.stat(os.path.join(cwd, path)).st_mtime_ns
+            for path in walk_files(cwd, suffixes, skip_dirs)
+        }
+    )
+
+
+def _reverse_closure(graph: dict[str, set[str]], start: set[str]) -> set[str]:
+    """
+    everything in `start`, plus everything that (transitively) depends on it. `graph` maps each node to the nodes it depends on
+    """
+    dependents: dict[str, set[str]] = {}
+    for node, deps in graph.items():
+        for dep in deps:
+            dependents.setdefault(dep, set()).add(node)
+
+    found = set(start)
+    stack = list(start)
+    while stack:
+        for dependent in dependents.get(stack.pop(), ()):
+            if dependent not in found:
+                found.add(dependent)
+                stack.append(dependent)
+    return found
+
+
+def _owner(path: str, dirs: dict[str, str]) -> Optional[str]:
+    """
+    the item whose directory most closely contains `path`, where `dirs` maps directories to items
+    """
+    parent = os.path.dirname(path)
+    while True:
+        if parent in dirs:
+            return dirs[parent]
+        if not parent:
+            return None
+        parent = os.path.dirname(parent)
+
+
+def _relative_dir(cwd: Path, path: str) -> str:
+    """
+    `path` relative to `cwd`, where `cwd` itself is the empty string (to match `os.path.dirname`)
+    """
+    relative = Path(path).relative_to(cwd).as_posix()
+    return "" if relative == "." else relative
+
+
+# go
+
+
+GO_MANIFESTS = {"go.mod", "go.sum", "go.work", "go.work.sum"}
+NEXT_OBJECT = re.compile(r"\S")
+
+
+def _parse_json_stream(text: str) -> list[dict]:
+    """
+    `go list -json` prints a series of objects, rather than a single array
+    """
+    decoder = json.JSONDecoder()
+    objects = []
+    index = 0
+    while match := NEXT_OBJECT.search(text, index):
+        obj, index = decoder.raw_decode(text, match.start())
+        objects.append(obj)
+    return objects
+
+
+def go_packages(context: Context) -> Optional[dict[str, dict]]:
+    """
+    the packages in the main module, keyed by import path. Each has its directory (relative to the module root), whether it has tests, and its regular and test imports.
+
+    Cached until a manifest or `.go` file changes.
+    """
+    key = digest(
+        mtime_key(context.cwd, sorted(GO_MANIFESTS)),
+        _source_mtimes(context.cwd, (".go",), {"vendor", "testdata"}),
+    )
+    if (cached := read_cache("go-packages", context.cwd, key)) is not None:
+        context.debug("using cached go package graph")
+        return cached
+
+    context.debug("building go package graph")
+    try:
+        result = subprocess.run(
+            ["go", "list", "-deps", "-json", "./..."],
+            capture_output=True,
+            cwd=context.cwd,
+            check=True,
+            text=True,
+        )
+        listed = _parse_json_stream(result.stdout)
+    except (FileNotFoundError, subprocess.CalledProcessError, ValueError):
+        return None
+
+    root = Path(context.cwd).resolve()
+    packages = {
+        p["ImportPath"]: {
+            "dir": _relative_dir(root, p["Dir"]),
+            "has_tests": bool(p.get("TestGoFiles") or p.get("XTestGoFiles")),
+            "imports": p.get("Imports", []),
+            "test_imports": [*p.get("TestImports", []), *p.get("XTestImports", [])],
+        }
+        for p in listed
+        if not p.get("Standard")
+        and (p.get("Module") or {}).get("Main")
+        and root in (Path(p["Dir"]), *Path(p["Dir"]).parents)
+    }
+    write_cache("go-packages", context.cwd, key, packages)
+    return packages
+
+
+def select_go(
+    command: Command, context: Context, changed: list[str]
+) -> Optional[list[str]]:
+    if GO_MANIFESTS.intersection(changed):
+        context.debug("go module manifest changed, running everything")
+        return None
+
+    if (packages := go_packages(context)) is None:
+        return None
+
+    by_dir = {p["dir"]: name for name, p in packages.items()}
+    touched = {owner for f in changed if (owner := _owner(f, by_dir))}
+
+    # a change to a package affects the code of everything that imports it...
+    code_affected = _reverse_closure(
+        {name: set(p["imports"]) for name, p in packages.items()}, touched
+    )
+    # ...and the tests of everything whose tests import affected code
+    test_affected = code_affected | {
+        name
+        for name, p in packages.items()
+        if code_affected.intersection(p["test_imports"])
+    }
+
+    if targets := sorted(n for n in test_affected if packages[n]["has_tests"]):
+        return ["go", "test", *targets]
+    return []
+
+
+# python
+
+# changes to any of these could affect every test
+PYTHON_MANIFESTS = {
+    "conftest.py",
+    "pyproject.toml",
+    "setup.py",
+    "setup.cfg",
+    "tox.ini",
+    "pytest.ini",
+    "requirements.txt",
+    "uv.lock",
+    "poetry.lock",
+    "pdm.lock",
+}
+PYTHON_SKIP_DIRS = {
+    "__pycache__",
+    "node_modules",
+    "venv",
+    "build",
+    "dist",
+    "site-packages",
+}
+
+
+def is_python_test(path: str) -> bool:
+    # pytest's default `python_files` patterns
+    name = os.path.basename(path)
+    return name.endswith(".py") and (
+        name.startswith("test_") or name.endswith("_test.py")
+    )
+
+
+def _parse_imports(source: bytes, module: str, is_package: bool) -> list[str]:
+    """
+    every module name `source` might import (including parent packages). `from a import b` could be importing module `a.b` or name `b` from `a`, so both are included.
+
+    Relative imports are resolved against `module`, the dotted name of the file itself.
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+
+    package = module.split(".") if is_package else module.split(".")[:-1]
+    imports: set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                if (keep := len(package) - node.level + 1) < 1:
+                    # relative import beyond the top-level package
+                    continue
+                parent = ".".join(
+                    [*package[:keep], *([node.module] if node.module else [])]
+                )
+            else:
+                parent = node.module or ""
+            if parent:
+                imports.add(parent)
+            imports.update(
+                f"{parent}.{alias.name}" if parent else alias.name
+                for alias in node.names
+                if alias.name != "*"
+            )
+
+    # importing `a.b.c` also runs `a/__init__.py` and `a/b/__init__.py`
+    parts = [name.split(".") for name in imports]
+    return sorted({".".join(p[:i]) for p in parts for i in range(1, len(p) + 1)})
+
+
+def _module_name(path: str) -> str:
+    parts = Path(path).with_suffix("").parts
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def python_imports(context: Context) -> dict[str, list[str]]:
+    """
+    the module names imported by every python file in the project, keyed by path.
+
+    Each file is only re-parsed when its contents change; the cache is keyed on each file's mtime and content hash.
+    """
+    cached: dict[str, dict] = read_cache("python-imports", context.cwd, "v1") or {}
+    entries: dict[str, dict] = {}
+    dirty = False
+    for path in walk_files(context.cwd, (".py",), PYTHON_SKIP_DIRS):
+        full_path = os.path.join(context.cwd, path)
+        try:
+            mtime = os.stat(full_path).st_mtime_ns
+            entry = cached.get(path)
+            if entry and entry["mtime"] == mtime:
+                entries[path] = entry
+                continue
+            source = Path(full_path).read_bytes()
+        except OSError:
+            # e.g. a broken symlink or an unreadable file. Left out, so a change to it runs everything
+            context.debug(f"can't read {path}, leaving it out of the import graph")
+            continue
+
+        sha = hashlib.sha256(source).hexdigest()
+        if not entry or entry["hash"] != sha:
+            imports = _parse_imports(
+                source, _module_name(path), path.endswith("__init__.py")
+            )
+        else:
+            # touched, but not edited
+            imports = entry["imports"]
+
+        entries[path] = {"mtime": mtime, "hash": sha, "imports": imports}
+        dirty = True
+
+    if dirty or entries.keys() != cached.keys():
+        write_cache("python-imports", context.cwd, "v1", entries)
+    return {path: entry["imports"] for path, entry in entries.items()}
+
+
+def _module_index(paths: list[str]) -> dict[str, set[str]]:
+    """
+    maps every name a file could be imported as to the file(s) it could be. Files can be imported relative to the project root, a `src` directory, or any directory that isn't itself a package (which is where pytest puts test directories on `sys.path`).
+
+    This over-approximates on purpose: running an extra test is fine, missing one isn't.
+    """
+    packages = {os.path.dirname(p) for p in paths if p.endswith("__init__.py")}
+    roots = {"", "src"} | {
+        os.path.dirname(p) for p in paths if os.path.dirname(p) not in packages
+    }
+
+    index: dict[str, set[str]] = {}
+    for path in paths:
+        for root in roots:
+            if root and not path.startswith(f"{root}/"):
+                continue
+            name = _module_name(path[len(root) + 1 :] if root else path)
+            if name:
+                index.setdefault(name, set()).add(path)
+    return index
+
+
+def select_pytest(
+    command: Command, context: Context, changed: list[str]
+) -> Optional[list[str]]:
+    if manifests := PYTHON_MANIFESTS.intersection(os.path.basename(f) for f in changed):
+        context.debug(f"{', '.join(sorted(manifests))} changed, running everything")
+        return None
+
+    imports = python_imports(context)
+    index = _module_index(list(imports))
+    graph = {
+        path: {dep for name in names for dep in index.get(name, ())}
+        for path, names in imports.items()
+    }
+
+    if removed := [f for f in changed if f.endswith(".py") and f not in imports]:
+        # a deleted module's importers can't be found from what's left
+        context.debug(
+            f"{', '.join(sorted(removed))} can't be traced, running everything"
+        )
+        return None
+
+    # other files (like fixtures and data) belong to the modules in their closest directory that has some
+    by_dir: dict[str, list[str]] = {}
+    for path in imports:
+        by_dir.setdefault(os.path.dirname(path), []).append(path)
+    dirs = {d: d for d in by_dir}
+    touched = set()
+    for f in changed:
+        if f in imports:
+            touched.add(f)
+        elif (owner := _owner(f, dirs)) is not None:
+            touched.update(by_dir[owner])
+
+    affected = _reverse_closure(graph, touched)
+    if targets := sorted(path for path in affected if is_python_test(path)):
+        return [*command.test_command, *context.args, *targets]
+    return []
+
+
+# rust
+
+# changes to any of these could affect every crate
+RUST_MANIFESTS = {
+    "Cargo.toml",
+    "Cargo.lock",
+    ".cargo/config.toml",
+    ".cargo/config",
+    "rust-toolchain",
+    "rust-toolchain.toml",
+}
+
+
+def _cargo_manifests(crates: dict[str, dict]) -> list[str]:
+    return [os.path.join(c["dir"], "Cargo.toml") for c in crates.values()]
+
+
+def cargo_crates(context: Context) -> Optional[dict[str, dict]]:
+    """
+    the crates in the workspace, keyed by name. Each has its directory (relative to the workspace root) and the names of the other members it depends on, split into regular (`dependencies`, `build-dependencies`) and `dev-dependencies`.
+
+    Cached until the workspace manifest, lockfile, or a member's `Cargo.toml` changes.
+    """
+    root_key = mtime_key(context.cwd, ["Cargo.toml", "Cargo.lock"])
+    cached = read_cache("cargo-crates", context.cwd, root_key)
+    # anything else (like a cache written by another version) is a miss
+    if (
+        isinstance(cached, dict)
+        and isinstance(crates := cached.get("crates"), dict)
+        and all(
+            isinstance(c, dict) and isinstance(c.get("dir"), str)
+            for c in crates.values()
+        )
+        and mtime_key(context.cwd, _cargo_manifests(crates))
+        == cached.get("members_key")
+    ):
+        context.debug("using cached cargo workspace graph")
+        return crates
+
+    context.debug("building cargo workspace graph")
+    try:
+        result = subprocess.run(
+            # only workspace members are needed, so skip resolving the full dependency tree
+            ["cargo", "metadata", "--format-version", "1", "--no-deps"],
+            capture_output=True,
+            cwd=context.cwd,
+            check=True,
+            text=True,
+        )
+        metadata = json.loads(result.stdout)
+    except (FileNotFoundError, subprocess.CalledProcessError, ValueError):
+        return None
+
+    root = Path(context.cwd).resolve()
+    members = set(metadata.get("workspace_members", []))
+    packages = [p for p in metadata.get("packages", []) if p["id"] in members]
+    names = {p["name"] for p in packages}
+
+    crates = {}
+    for p in packages:
+        # only path dependencies can be workspace members
+        local = [
+            d for d in p.get("dependencies", []) if d["name"] in names and d.get("path")
+        ]
+        crates[p["name"]] = {
+            "dir": _relative_dir(root, str(Path(p["manifest_path"]).parent)),
+            "dependencies": sorted(
+                {d["name"] for d in local if d.get("kind") != "dev"}
+            ),
+            "dev_dependencies": sorted(
+                {d["name"] for d in local if d.get("kind") == "dev"}
+            ),
+        }
+
+    manifests = _cargo_manifests(crates)
+    write_cache(
+        "cargo-crates",
+        context.cwd,
+        root_key,
+        {"members_key": mtime_key(context.cwd, manifests), "crates": crates},
+    )
+    return crates
+
+
+def select_cargo(
+    command: Command, context: Context, changed: list[str]
+) -> Optional[list[str]]:
+    if manifests := RUST_MANIFESTS.intersection(changed):
+        context.debug(f"{', '.join(sorted(manifests))} changed, running everything")
+        return None
+
+    if (crates := cargo_crates(context)) is None:
+        return None
+
+    by_dir = {c["dir"]: name for name, c in crates.items()}
+    touched = {owner for f in changed if (owner := _owner(f, by_dir))}
+
+    # same as go: changes flow through regular dependencies, and then one step into dev-dependencies
+    code_affected = _reverse_closure(
+        {name: set(c["dependencies"]) for name, c in crates.items()}, touched
+    )
+    test_affected = code_affected | {
+        name
+        for name, c in crates.items()
+        if code_affected.intersection(c["dev_dependencies"])
+    }
+
+    if not test_affected:
+        return []
+    return [
+        *command.test_command,
+        *(arg for name in sorted(test_affected) for arg in ("-p", name)),
+        *context.args,
+    ]
+
+
+SELECTORS: dict[Command, Selector] = {
+    go_multi: select_go,
+    **{c: select_pytest for c in PYTEST_COMMANDS},
+    rust: select_cargo,
+}
+
+
+def affected_test_command(
+    command: Command, context: Context, ref: str
+) -> Optional[list[str]]:
+    """
+    the argv that runs only the tests affected by changes since `ref`.
+
+    `None` means everything should run (because selection isn't supported or isn't safe), while an empty list means nothing was affected.
+    """
+    if not (selector := SELECTORS.get(command)):
+        context.debug(f"change-based selection isn't supported for {command.name}")
+        return None
+
+    if (changed := changed_files(context.cwd, ref)) is None:
+        context.debug(f"unable to diff against {ref}, running everything")
+        return None
+
+    context.debug(f"{len(changed)} file(s) changed since {ref}")
+    return selector(command, context, changed)
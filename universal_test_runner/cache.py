@@ -0,0 +1,145 @@
+"""
+A small on-disk store for things that are slow to compute but rarely change between runs (like dependency graphs).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from universal_test_runner.settings import env_str
+
+
+def cache_dir() -> Path:
+    """
+    `UTR_CACHE_DIR` if it's set, otherwise the platform-standard user cache directory
+    """
+    if custom := env_str("UTR_CACHE_DIR"):
+        return Path(custom)
+    return (
+        Path(env_str("XDG_CACHE_HOME") or Path.home() / ".cache")
+        / "universal-test-runner"
+    )
+
+
+def digest(*parts: object) -> str:
+    """
+    a short, stable hash of some JSON-serializable parts
+    """
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode()
+    ).hexdigest()[:32]
+
+
+def mtime_key(cwd: str, paths: Iterable[str]) -> str:
+    """
+    a key that changes whenever any of `paths` is modified, created, or deleted
+    """
+    stamps = {}
+    for p in paths:
+        try:
+            stamps[p] = Path(cwd, p).stat().st_mtime_ns
+        except OSError:
+            stamps[p] = None
+    return digest(stamps)
+
+
+def atomic_write(path: Path, data: bytes):
+    """
+    write to a temp file next to `path` and then rename it into place, so readers never see a partial file
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _entry_path(namespace: str, cwd: str) -> Path:
+    # each project gets its own file, so unrelated projects don't evict each other
+    return cache_dir() / namespace / f"{digest(os.path.abspath(cwd))}.json"
+
+
+def read_cache(namespace: str, cwd: str, key: str) -> Optional[Any]:
+    """
+    the value stored for this project, if it was stored with the same `key`
+    """
+    try:
+        entry = json.loads(_entry_path(namespace, cwd).read_text("utf-8"))
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(entry, dict) or entry.get("key") != key:
+        return None
+    return entry.get("value")
+
+
+def write_cache(namespace: str, cwd: str, key: str, value: Any):
+    """
+    store a JSON-serializable `value` for this project. Failures are ignored, since the cache is only an optimization
+    """
+    try:
+        atomic_write(
+            _entry_path(namespace, cwd),
+            json.dumps({"key": key, "value": value}).encode(),
+        )
+    except OSError:
+        pass
+
+
+@dataclass(frozen=True)
+class DirectoryStore:
+    """
+    A content store backed by a plain directory, with one file per key. It's safe to share between processes (or machines, via a mounted path): writes are atomic, and readers tolerate entries being evicted out from under them.
+
+    Once the store grows past `max_bytes`, the least-recently-used entries are evicted. Reads bump an entry's mtime, which is what "recently used" means here.
+    """
+
+    root: Path
+    max_bytes: int
+
+    def _path(self, key: str) -> Path:
+        # fan out a little, so no single directory gets huge
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes):
+        try:
+            atomic_write(self._path(key), data)
+            self.evict()
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = []
+        for path in self.root.glob("*/*"):
+            # skip in-progress writes from other processes
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
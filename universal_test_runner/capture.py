@@ -0,0 +1,240 @@
+"""
+Runs a test command without streaming all of its output to the terminal, which can be the bottleneck for very chatty suites (especially on CI).
+
+The command's output goes through a pty (so it keeps its colors, but this is Linux and macOS only), but only the last few lines are kept in memory, to be shown if the run fails. The full output can also be written to a gzipped log by a background thread. If that thread falls behind, output is dropped from the log (and a note left in its place) rather than making the command wait or letting memory grow.
+"""
+
+import gzip
+import os
+import queue
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from colorama import Style
+
+from universal_test_runner.jobserver import child_fds
+from universal_test_runner.limits import Limits, preexec, reap, report_limits
+from universal_test_runner.watchdog import (
+    TIMED_OUT,
+    Watchdog,
+    print_report,
+    signal_session,
+)
+
+# how many lines of output are kept when only `UTR_LOG` is set
+DEFAULT_LINES = 100
+# a longer line is cut down to this many bytes, so memory doesn't depend on the output
+MAX_LINE_BYTES = 4096
+READ_SIZE = 64 * 1024
+# chunks of output waiting to be compressed, so at most ~16MB
+MAX_PENDING_CHUNKS = 256
+
+
+class TailBuffer:
+    """
+    The last `lines` lines of a byte stream, fed in arbitrary chunks.
+    """
+
+    def __init__(self, lines: int):
+        self.limit = max(lines, 1)
+        self.lines: deque[bytes] = deque(maxlen=self.limit)
+        self.partial = b""
+        self.total = 0
+
+    def add(self, chunk: bytes):
+        if not (count := chunk.count(b"\n")):
+            self.partial = (self.partial + chunk)[:MAX_LINE_BYTES]
+            return
+        # only the lines that could still be kept are split out
+        *complete, rest = chunk.rsplit(b"\n", self.limit + 1)
+        if count > self.limit:
+            complete = complete[1:]
+        else:
+            complete[0] = self.partial + complete[0]
+        self.lines.extend(line[:MAX_LINE_BYTES] + b"\n" for line in complete)
+        self.partial = rest[:MAX_LINE_BYTES]
+        self.total += count
+
+    def tail(self) -> list[bytes]:
+        return [*self.lines, self.partial] if self.partial else list(self.lines)
+
+
+class LogWriter:
+    """
+    Compresses output to `path` on a background thread. `add` never blocks.
+    """
+
+    def __init__(self, path: str):
+        self.file = gzip.open(path, "wb", compresslevel=6)
+        self.pending: queue.Queue[Optional[bytes]] = queue.Queue(MAX_PENDING_CHUNKS)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def _write(self):
+        while (chunk := self.pending.get()) is not None:
+            self.file.write(chunk)
+
+    def add(self, chunk: bytes):
+        try:
+            if self.dropped:
+                self.pending.put_nowait(
+                    f"\n[universal-test-runner: {self.dropped} bytes of output were dropped here]\n".encode()
+                )
+                self.dropped = 0
+            self.pending.put_nowait(chunk)
+        except queue.Full:
+            self.dropped += len(chunk)
+
+    def close(self):
+        # the sentinel has to get through, so this is the one place that waits
+        self.pending.put(None)
+        self.thread.join()
+        self.file.close()
+
+
+def is_supported() -> bool:
+    return hasattr(os, "openpty")
+
+
+def _open_pty() -> tuple[int, int]:
+    """
+    a (read, write) pair of fds for the command's output, sized like the real terminal
+    """
+    import fcntl
+    import termios
+
+    reader, writer = os.openpty()
+    try:
+        size = fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, b"\0" * 8)
+        fcntl.ioctl(writer, termios.TIOCSWINSZ, size)
+    except (OSError, ValueError):
+        pass
+    return reader, writer
+
+
+def _read(fd: int) -> bytes:
+    try:
+        return os.read(fd, READ_SIZE)
+    except OSError:
+        # a pty reports EIO instead of EOF once the other end is closed
+        return b""
+
+
+def run_captured(
+    command: list[str],
+    lines: int,
+    log: Optional[str],
+    watchdog: Optional[Watchdog] = None,
+    limits: Optional[Limits] = None,
+    env: Optional[dict[str, str]] = None,
+) -> int:
+    """
+    run `command` (with `env` and `limits`, if given), printing only its last `lines` lines of output if it fails (or all of it as it arrives, if `lines` is 0), and writing all of it to `log` (if given). A `watchdog` stops it if it runs too long
+    """
+    try:
+        writer = LogWriter(log) if log else None
+    except OSError as e:
+        print(f"can't write a log to {log}: {e}")
+        return 1
+
+    tail = TailBuffer(lines)
+    batch = bytearray()
+    reader, child_output = _open_pty()
+    interrupted = False
+    peak = None
+    try:
+        # in its own session, so everything it starts can be stopped together
+        with subprocess.Popen(
+            command,
+            stdout=child_output,
+            stderr=child_output,
+            pass_fds=child_fds(),
+            start_new_session=bool(watchdog),
+            preexec_fn=preexec(limits) if limits else None,
+            env=env,
+        ) as proc:
+            os.close(child_output)
+            child_output = -1
+            try:
+                while True:
+                    # anything left behind (e.g. a background process holding the output open) stops mattering once the command exits
+                    try:
+                        ready, _, _ = select.select([reader], [], [], 0.1)
+                    except KeyboardInterrupt:
+                        if not watchdog or interrupted:
+                            raise
+                        # the command is out of reach of the terminal's Ctrl-C, so it's passed along. A second one stops everything
+                        interrupted = True
+                        signal_session(proc.pid, signal.SIGINT)
+                        continue
+                    if watchdog:
+                        now = time.monotonic()
+                        if ready:
+                            watchdog.output(now)
+                        watchdog.check(proc.pid, now)
+                    if not ready:
+                        peak = reap(proc, block=False)
+                        if proc.returncode is not None:
+                            break
+                        continue
+                    if not (chunk := _read(reader)):
+                        break
+                    if lines:
+                        tail.add(chunk)
+                    else:
+                        sys.stdout.buffer.write(chunk)
+                        sys.stdout.flush()
+                    if writer:
+                        # output tends to arrive a line at a time, so it's handed over in bigger pieces
+                        batch += chunk
+                        if len(batch) >= READ_SIZE:
+                            writer.add(bytes(batch))
+                            batch.clear()
+                if proc.returncode is None:
+                    peak = reap(proc)
+            except BaseException:
+                if watchdog:
+                    signal_session(proc.pid, signal.SIGKILL)
+                proc.kill()
+                raise
+        if watchdog:
+            # only now that the command has been waited on, so it isn't cut off while it's still exiting
+            watchdog.finish(proc.pid)
+        # already waited on, so this only reads the exit code
+        returncode = proc.wait()
+    finally:
+        if child_output != -1:
+            os.close(child_output)
+        os.close(reader)
+        if writer:
+            writer.add(bytes(batch))
+            writer.close()
+
+    if watchdog and watchdog.reason:
+        returncode = TIMED_OUT
+
+    shown = tail.tail() if returncode else []
+    hidden = tail.total + bool(tail.partial) - len(shown)
+    note = f" (all of it is in {log})" if log else ""
+    if lines and hidden:
+        print(
+            Style.DIM
+            + f"-> {hidden} line(s) of output were hidden{note}"
+            + Style.RESET_ALL,
+            flush=True,
+        )
+    if lines and shown:
+        sys.stdout.buffer.write(b"".join(shown))
+        sys.stdout.flush()
+    if watchdog and watchdog.reason:
+        print_report(watchdog)
+    if limits:
+        report_limits(limits, returncode, peak)
+    return returncode
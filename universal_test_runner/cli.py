@@ -1,7 +1,14 @@
+import os
+import sys
+
 import click
 
-from universal_test_runner.commands import find_test_command
+from universal_test_runner.commands import find_command, find_test_command
 from universal_test_runner.context import Context
+from universal_test_runner.distributed import run_coordinator
+from universal_test_runner.slowest import show_trends
+from universal_test_runner.timings import export_durations
+from universal_test_runner.warm import keep_warm
 
 HELP_LINES = [
     "This command only exists to print information about the package.",
@@ -20,3 +27,44 @@ def cli():
 @cli.command(help="Run command with extra logs so you know why it was chosen")
 def debug():
     find_test_command(Context.from_invocation(debugging=True))
+
+
+@cli.command(
+    help="Hand out this project's tests to `t` workers (started with `UTR_WORKER=HOST:PORT`) until they've all run"
+)
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option(
+    "--port", default=0, help="Port to listen on. By default, a free one is picked"
+)
+def coordinate(host: str, port: int):
+    context = Context.build(os.getcwd(), [])
+    sys.exit(run_coordinator(find_command(context), context, host, port))
+
+
+@cli.command(
+    help="Keep this project's test binaries compiled in the background (cargo and go only). Any ARGS are the ones you'll pass to `t`",
+    context_settings={"ignore_unknown_options": True},
+)
+@click.argument("args", nargs=-1, type=click.UNPROCESSED)
+def warm(args: tuple[str, ...]):
+    context = Context.build(os.getcwd(), list(args))
+    sys.exit(keep_warm(find_command(context), context))
+
+
+@cli.command(
+    help="Show this project's slowest tests from the latest `t` run with `UTR_SLOWEST` set, and how they compare to earlier runs"
+)
+@click.option(
+    "--limit", default=10, show_default=True, help="How many tests (and suites) to show"
+)
+def slowest(limit: int):
+    context = Context.build(os.getcwd(), [])
+    sys.exit(show_trends(find_command(context), context, limit))
+
+
+@cli.command(
+    help="Print how long each of this project's test units took in its last `UTR_PARALLEL` run, as JSON. Commit it and point `UTR_SHARD_TIMINGS` at it to balance shards by time"
+)
+def timings():
+    context = Context.build(os.getcwd(), [])
+    sys.exit(export_durations(find_command(context), context))
@@ -1,14 +1,21 @@
+import fnmatch
 import json
 import re
 import subprocess
 from dataclasses import dataclass
 from functools import cache
-from typing import Callable, Sequence, TypeVar, Union
+from typing import Callable, Iterable, Optional, Sequence, TypeVar, Union
 
 from universal_test_runner.context import Context
 
 T = TypeVar("T")
 
+# shared `Command.ecosystem` values
+TASK_RUNNER = "task runner"
+PYTHON = "python"
+GO = "go"
+JAVASCRIPT = "javascript"
+
 
 def dig(obj: dict[str, Union[T, object]], path: list[str], default: T) -> T:
     """
@@ -33,6 +40,37 @@ def dig(obj: dict[str, Union[T, object]], path: list[str], default: T) -> T:
     return dig(val, path[1:], default)
 
 
+class PatternMatcher:
+    """
+    Checks filenames against several globs at once. They're compiled into a single regex with an optional lookahead per glob, so one match reports every glob a filename satisfies (an alternation would only report the first).
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = tuple(dict.fromkeys(patterns))
+        self.regex = re.compile(
+            "".join(f"(?=({fnmatch.translate(p)}))?" for p in self.patterns)
+        )
+
+    def find(self, filenames: Iterable[str]) -> frozenset[str]:
+        """
+        the globs that at least one of `filenames` matches, found in a single pass that stops once every glob has matched
+        """
+        found: set[str] = set()
+        for filename in filenames:
+            # `lastindex` is only set if some glob matched, so most filenames skip straight past
+            match = self.regex.match(filename)
+            if not match or match.lastindex is None:
+                continue
+            found.update(
+                pattern
+                for pattern, group in zip(self.patterns, match.groups())
+                if group is not None
+            )
+            if len(found) == len(self.patterns):
+                break
+        return frozenset(found)
+
+
 @dataclass(frozen=True)  # frozen so I can hash them for tests
 class Command:
     """
@@ -59,6 +97,14 @@ class Command:
     """
     a human-readable description of what this command expects if it will run
     """
+    ecosystem: str = ""
+    """
+    commands in the same ecosystem are alternatives to each other (e.g. `pytest` and `python -m unittest`), so only the first match of each runs in polyglot mode. Blank means the command is its own ecosystem
+    """
+    file_patterns: tuple[str, ...] = ()
+    """
+    globs (like `*_test.go`) that `should_run` checks filenames against with `has_matching_files`. Every command's globs are compiled together when this module loads, so a single pass over the filenames answers all of them
+    """
 
     @property
     def test_command(self) -> list[str]:
@@ -67,8 +113,14 @@ class Command:
     def __repr__(self) -> str:
         return f"<{type(self).__name__} {self.name}>"
 
+    @property
+    def family(self) -> str:
+        return self.ecosystem or self.name
+
     @staticmethod
-    def basic_builder(name: str, file: str, command: str) -> "Command":
+    def basic_builder(
+        name: str, file: str, command: str, ecosystem: str = ""
+    ) -> "Command":
         """
         shorthand builder for running a command if a single file is in the file list
         """
@@ -77,10 +129,13 @@ class Command:
             lambda c: c.has_all_files(file),
             command,
             debug_line=f'looking for: "{file}"',
+            ecosystem=ecosystem,
         )
 
     @staticmethod
-    def any_builder(name: str, files: Sequence[str], command: str) -> "Command":
+    def any_builder(
+        name: str, files: Sequence[str], command: str, ecosystem: str = ""
+    ) -> "Command":
         """
         shorthand builder for running a command if any of these file is in the file list
         """
@@ -89,6 +144,7 @@ class Command:
             lambda c: c.has_any_files(*files),
             command,
             debug_line=f"looking for any of: {files}",
+            ecosystem=ecosystem,
         )
 
     @staticmethod
@@ -98,6 +154,7 @@ class Command:
             lambda c: c.has_test_script_and_lockfile(lockfile),
             f"{name} test",
             debug_line=f'looking for: "package.json", a "scripts.test" property, and a "{lockfile}"',
+            ecosystem=JAVASCRIPT,
         )
 
     @staticmethod
@@ -114,6 +171,7 @@ class Command:
             lambda c: c.has_all_files(lockfile) and _matches_pytest(c),
             f"{name} run pytest",
             debug_line=f'looking for: a pytest cache / dependency, plus a "{lockfile}"',
+            ecosystem=PYTHON,
         )
 
 
@@ -124,14 +182,17 @@ go_multi = Command(
     lambda c: c.has_all_files("go.mod") and not c.args,
     "go test ./...",
     debug_line='looking for: "go.mod" and no arguments',
+    ecosystem=GO,
 )
 # however, if we're in the package root and there's a test file here, then we can just run
+GO_TEST_FILE = "*_test.go"
 go_single = Command(
     "go_single",
-    lambda c: c.has_all_files("go.mod")
-    or any(re.search(r"_test.go$", f) for f in c.filenames),
+    lambda c: c.has_all_files("go.mod") or has_matching_files(c, GO_TEST_FILE),
     "go test",
     debug_line='looking for: "go.mod" or a file named "..._test.go"',
+    ecosystem=GO,
+    file_patterns=(GO_TEST_FILE,),
 )
 
 makefile = Command(
@@ -140,6 +201,7 @@ makefile = Command(
     and any(line.startswith("test:") for line in c.read_file("Makefile")),
     "make test",
     debug_line='looking for: a "Makefile" and a "test:" line',
+    ecosystem=TASK_RUNNER,
 )
 
 JUSTFILE_NAMES = "justfile", "Justfile", ".justfile"
@@ -180,13 +242,25 @@ justfile = Command(
     _matches_justfile,
     "just test",
     debug_line=f'looking for: any of {JUSTFILE_NAMES} and a "test" or "@test" recipe',
+    ecosystem=TASK_RUNNER,
 )
 
 npm = Command.js_builder("npm", "package-lock.json")
 yarn = Command.js_builder("yarn", "yarn.lock")
 pnpm = Command.js_builder("pnpm", "pnpm-lock.yaml")
 # don't use JS builder because it doesn't need a `test` property in pkg.json
-bun = Command.basic_builder("bun", "bun.lockb", "bun test")
+bun = Command.basic_builder("bun", "bun.lockb", "bun test", ecosystem=JAVASCRIPT)
+# the package managers that run a `scripts.test` property
+JS_COMMANDS = npm, yarn, pnpm
+
+
+def with_script_args(command: Command, argv: Sequence[str], *args: str) -> list[str]:
+    """
+    `argv` plus `args` meant for the script a JS package manager runs, which npm needs a `--` before (unless `argv` already has one)
+    """
+    separator = ["--"] if command == npm and "--" not in argv else []
+    return [*argv, *separator, *args]
+
 
 # TODO:
 # - ruby?
@@ -286,7 +360,11 @@ pytest = Command(
     _matches_pytest,
     "pytest",
     debug_line='looking for: a ".pytest_cache", pytest configuration files, or a dependency on pytest in "pyproject.toml" (from any popular package manager)',
+    ecosystem=PYTHON,
 )
+# the commands that run pytest (in or out of a package manager)
+PYTEST_COMMANDS = uv_pytest, poetry_pytest, pdm_pytest, pytest
+
 py = Command.any_builder(
     "py",
     (
@@ -299,13 +377,18 @@ py = Command.any_builder(
         "venv",
     ),
     "python -m unittest",
+    ecosystem=PYTHON,
 )
-django = Command.basic_builder("django", "manage.py", "./manage.py test")
+django = Command.basic_builder("django", "manage.py", "./manage.py test", PYTHON)
 elixir = Command.basic_builder("elixir", "mix.exs", "mix test")
 rust = Command.basic_builder("rust", "Cargo.toml", "cargo test")
 clojure = Command.basic_builder("clojure", "project.clj", "lein test")
-exercism = Command.basic_builder("exercism", ".exercism", "exercism test --")
-advent_of_code = Command.basic_builder("advent of code", "advent", "./advent")
+exercism = Command.basic_builder(
+    "exercism", ".exercism", "exercism test --", TASK_RUNNER
+)
+advent_of_code = Command.basic_builder(
+    "advent of code", "advent", "./advent", TASK_RUNNER
+)
 
 # these are checked in order
 ALL_COMMANDS: tuple[Command, ...] = (
@@ -333,9 +416,24 @@ ALL_COMMANDS: tuple[Command, ...] = (
 )
 
 NUM_COMMANDS = len(ALL_COMMANDS)
+COMMANDS_BY_NAME = {c.name: c for c in ALL_COMMANDS}
+# compiled once, up front, so detection itself never compiles a regex
+FILE_PATTERNS = PatternMatcher(p for c in ALL_COMMANDS for p in c.file_patterns)
 
 
-def find_test_command(context: Context) -> list[str]:
+@cache
+def matching_patterns(c: Context) -> frozenset[str]:
+    return FILE_PATTERNS.find(c.filenames)
+
+
+def has_matching_files(c: Context, *patterns: str) -> bool:
+    """
+    whether any filename matches any of `patterns`, which must be declared in some command's `file_patterns`
+    """
+    return not matching_patterns(c).isdisjoint(patterns)
+
+
+def find_command(context: Context) -> Optional[Command]:
     context.debug("checking each handler for first match")
     for i, command in enumerate(ALL_COMMANDS):
         context.debug(
@@ -345,7 +443,7 @@ def find_test_command(context: Context) -> list[str]:
         if command.should_run(context):
             context.debug("matched!", indent=4)
             context.debug(f"would have run: `{command._test_command}`", indent=6)
-            return [*command.test_command, *context.args]
+            return command
 
         context.debug("no match, continuing", indent=4)
 
@@ -353,4 +451,45 @@ def find_test_command(context: Context) -> list[str]:
     context.debug(
         "no matching test handler. To add a new one, please file an issue: https://github.com/xavdid/universal-test-runner/issues"
     )
+    return None
+
+
+def clear_detection_caches():
+    """
+    detection caches file contents, keyed on the directory listing. Long-running callers should clear them when files change
+    """
+    Context.load_file.cache_clear()
+    Context.read_json.cache_clear()
+    Context.read_toml.cache_clear()
+    _matches_pytest.cache_clear()
+    matching_patterns.cache_clear()
+
+
+def find_test_command(context: Context) -> list[str]:
+    if command := find_command(context):
+        return [*command.test_command, *context.args]
     return []
+
+
+def find_all_commands(context: Context) -> list[Command]:
+    """
+    for polyglot directories (e.g. a Rust core with JS bindings), find the first match from every ecosystem rather than the first match overall.
+
+    Task runners (like `make test`) are assumed to already cover the whole project, so they're only ever run on their own.
+    """
+    context.debug("checking each handler for a match in every ecosystem")
+    matches: list[Command] = []
+    for command in ALL_COMMANDS:
+        if any(m.family == command.family for m in matches):
+            context.debug(
+                f"skipping {command.name}, already matched {command.family}", indent=2
+            )
+            continue
+
+        if command.should_run(context):
+            context.debug(f"matched {command.name}", indent=2)
+            if command.ecosystem == TASK_RUNNER:
+                return [command]
+            matches.append(command)
+
+    return matches
@@ -29,6 +29,10 @@ class Context:
     filenames: frozenset[str]
     args: tuple[str, ...]
     debugging: bool = field(compare=False, default=False)
+    consulted: set[str] = field(compare=False, default_factory=set)
+    """
+    names of the files that were looked for or read through this context, so callers can tell what a detection depended on
+    """
 
     @staticmethod
     def build(cwd: str, args: list[str], debugging: bool = False):
@@ -54,6 +58,7 @@ class Context:
         """
         get the contents of a file as a string
         """
+        self.consulted.add(filename)
         # readers don't have to check that a file exists
         if filename not in self.filenames:
             return ""
@@ -63,6 +68,7 @@ class Context:
         """
         get the lines of a file
         """
+        self.consulted.add(filename)
         if filename not in self.filenames:
             return []
         return self.load_file(filename).splitlines()
@@ -81,6 +87,7 @@ class Context:
         return {}
 
     def _has_files(self, checker: Checker, *filenames: str) -> bool:
+        self.consulted.update(filenames)
         return bool(self.filenames) and checker(f in self.filenames for f in filenames)
 
     def has_all_files(self, *filenames: str) -> bool:
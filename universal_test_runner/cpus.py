@@ -0,0 +1,164 @@
+"""
+Works out how many CPUs this process can actually use, and tells test runners about it.
+
+Inside a container, `os.cpu_count()` reports every core on the host, even if the container is only allowed a few of them. Runners that size their worker pools off of it end up thrashing.
+"""
+
+import math
+import os
+from pathlib import Path
+from typing import Optional
+
+from universal_test_runner.commands import (
+    JS_COMMANDS,
+    PYTEST_COMMANDS,
+    Command,
+    dig,
+    django,
+    go_multi,
+    go_single,
+    makefile,
+    rust,
+    with_script_args,
+)
+from universal_test_runner.context import Context
+from universal_test_runner.limits import parse_cpu_list
+from universal_test_runner.settings import env_str
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+
+def _cgroup_path() -> Optional[str]:
+    # cgroup v2 has a single hierarchy, listed as `0::/path`
+    try:
+        lines = Path("/proc/self/cgroup").read_text().splitlines()
+    except OSError:
+        return None
+    return next((line[3:] for line in lines if line.startswith("0::")), None)
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """
+    the number of CPUs' worth of time this process's cgroup (or any ancestor) is allowed, or `None` if there's no limit
+    """
+    if (path := _cgroup_path()) is None:
+        return None
+
+    limits = []
+    directory = CGROUP_ROOT / path.lstrip("/")
+    # limits are inherited, so the tightest one anywhere up the tree wins
+    while True:
+        try:
+            quota, period = (directory / "cpu.max").read_text().split()[:2]
+            if quota != "max":
+                limits.append(int(quota) / int(period))
+        except (OSError, ValueError):
+            pass
+        if directory == CGROUP_ROOT or directory == directory.parent:
+            break
+        directory = directory.parent
+
+    return min(limits, default=None)
+
+
+def effective_cpus() -> int:
+    """
+    the number of CPUs this process can actually use, accounting for its affinity mask, cgroup CPU quota, and `UTR_CPUS`
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # not available on macOS or Windows
+        cpus = os.cpu_count() or 1
+
+    # the tests themselves may be pinned to fewer CPUs than `t` can use
+    if (pinned := env_str("UTR_CPUS")) and (chosen := parse_cpu_list(pinned)):
+        cpus = min(cpus, len(chosen))
+
+    if (limit := cgroup_cpu_limit()) is not None:
+        cpus = min(cpus, math.ceil(limit))
+    return max(cpus, 1)
+
+
+def has_flag(args: tuple[str, ...], *flags: str, attached: bool = True) -> bool:
+    """
+    whether any of `flags` was passed, including as `--flag=value` or (if `attached`) a short flag with its value stuck on, like `-n4`
+    """
+    for arg in args:
+        for flag in flags:
+            if arg == flag or arg.startswith(f"{flag}="):
+                return True
+            if attached and not flag.startswith("--") and arg.startswith(flag):
+                return True
+    return False
+
+
+def _has_xdist(context: Context) -> bool:
+    # tests run in the project's environment, not ours, so look for the plugin there
+    envs = [Path(context.cwd, name) for name in (".venv", "venv")]
+    if virtual_env := os.environ.get("VIRTUAL_ENV"):
+        envs.append(Path(virtual_env))
+    return any(
+        any(env.glob(pattern))
+        for env in envs
+        for pattern in ("lib/python*/site-packages/xdist", "Lib/site-packages/xdist")
+    )
+
+
+def uses_jest(context: Context) -> bool:
+    return "jest" in dig(context.read_json("package.json"), ["scripts", "test"], "")
+
+
+def uses_vitest(context: Context) -> bool:
+    return "vitest" in dig(context.read_json("package.json"), ["scripts", "test"], "")
+
+
+def insert_before_separator(args: tuple[str, ...], extra: list[str]) -> list[str]:
+    """
+    `args` with `extra` added just before any `--`, where flags meant for the tool itself (rather than what it runs) go
+    """
+    if "--" in args:
+        i = args.index("--")
+        return [*args[:i], *extra, *args[i:]]
+    return [*args, *extra]
+
+
+def parallelism_args(command: Command, context: Context, cpus: int) -> list[str]:
+    """
+    `context.args`, plus whatever flag tells this command's runner to use `cpus` workers. Nothing is added if the user already set one (or the runner doesn't have one)
+    """
+    args = context.args
+    n = str(cpus)
+
+    if command in PYTEST_COMMANDS:
+        if _has_xdist(context) and not has_flag(args, "-n", "--numprocesses"):
+            return [*args, "-n", n]
+
+    elif command in (go_multi, go_single):
+        # go's flags are all single-dash, so `-parallel` isn't `-p` with a value
+        if not has_flag(args, "-p", "--p", attached=False):
+            return [*args, "-p", n]
+
+    elif command == rust:
+        result = list(args)
+        if not has_flag(args, "-j", "--jobs"):
+            result = insert_before_separator(tuple(result), ["-j", n])
+        if not has_flag(args, "--test-threads"):
+            if "--" not in result:
+                result.append("--")
+            result += ["--test-threads", n]
+        return result
+
+    elif command == makefile:
+        if not has_flag(args, "-j", "--jobs"):
+            return [*args, f"-j{n}"]
+
+    elif command in JS_COMMANDS:
+        if uses_jest(context) and not has_flag(args, "--maxWorkers", "-w"):
+            return with_script_args(command, args, f"--maxWorkers={n}")
+
+    elif command == django:
+        if not has_flag(args, "--parallel"):
+            return [*args, "--parallel", n]
+
+    return list(args)
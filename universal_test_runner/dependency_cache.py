@@ -0,0 +1,260 @@
+"""
+Shares dependency and build caches between CI jobs on the same machine (`UTR_CI_CACHE`), so identical lockfiles don't mean downloading and compiling the same things over and over.
+
+Each command's cache variables (like `UV_CACHE_DIR` or `CARGO_TARGET_DIR`) are pointed at a directory in a shared store, keyed by a hash of the command's lockfile. Jobs with the same lockfile share a directory, and the tools themselves handle concurrent use of it. The store is kept under a size limit by evicting the least-recently-used directories, and file locks make sure a directory is never evicted while a job is using it.
+
+Measuring a directory means walking every file in it, which for a big build cache takes longer than some test runs. So a job only marks its directory as used when it's done, and eviction (at most every few minutes, by whichever job gets there first) measures just the directories that were used since they were last measured.
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Optional
+
+from universal_test_runner.cache import atomic_write, cache_dir
+from universal_test_runner.commands import (
+    Command,
+    bun,
+    go_multi,
+    go_single,
+    npm,
+    pdm_pytest,
+    pnpm,
+    poetry_pytest,
+    rust,
+    uv_pytest,
+    yarn,
+)
+from universal_test_runner.context import Context
+from universal_test_runner.settings import env_size, env_str, patched_environ
+from universal_test_runner.tmpfs import disk_usage
+
+DEFAULT_MAX_SIZE = 20 * 1024**3
+# touched in each entry when a job is done with it, so its mtime is when the entry was last used
+USED_FILE = ".utr-used"
+# the entry's size as of when it was last measured, so eviction doesn't have to walk every entry
+SIZE_FILE = ".utr-size"
+LOCK_SUFFIX = ".lock"
+# its mtime is when the store was last evicted from
+EVICTED_FILE = ".evicted"
+# seconds between evictions. The store can go over its limit by whatever is added in between
+EVICT_INTERVAL = 5 * 60
+
+
+@dataclass(frozen=True)
+class CacheSpec:
+    lockfiles: tuple[str, ...]
+    """
+    the lockfile whose contents decide which entry is used. The first that exists wins
+    """
+    variables: tuple[str, ...]
+    """
+    the variables that point the tool at its caches, each of which gets its own directory
+    """
+
+
+CACHE_SPECS: dict[Command, CacheSpec] = {
+    uv_pytest: CacheSpec(("uv.lock",), ("UV_CACHE_DIR",)),
+    poetry_pytest: CacheSpec(("poetry.lock",), ("POETRY_CACHE_DIR",)),
+    pdm_pytest: CacheSpec(("pdm.lock",), ("PDM_CACHE_DIR",)),
+    npm: CacheSpec(("package-lock.json",), ("npm_config_cache",)),
+    yarn: CacheSpec(("yarn.lock",), ("YARN_CACHE_FOLDER",)),
+    pnpm: CacheSpec(("pnpm-lock.yaml",), ("npm_config_store_dir",)),
+    bun: CacheSpec(("bun.lock", "bun.lockb"), ("BUN_INSTALL_CACHE_DIR",)),
+    rust: CacheSpec(("Cargo.lock",), ("CARGO_TARGET_DIR",)),
+    go_multi: CacheSpec(("go.sum",), ("GOCACHE", "GOMODCACHE")),
+    go_single: CacheSpec(("go.sum",), ("GOCACHE", "GOMODCACHE")),
+}
+
+
+def is_supported() -> bool:
+    try:
+        import fcntl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def store_root() -> Path:
+    return Path(env_str("UTR_CI_CACHE_DIR") or cache_dir() / "ci")
+
+
+def lockfile_hash(spec: CacheSpec, cwd: str) -> Optional[str]:
+    for name in spec.lockfiles:
+        try:
+            return hashlib.sha256(Path(cwd, name).read_bytes()).hexdigest()[:32]
+        except OSError:
+            continue
+    return None
+
+
+def _entries(root: Path) -> Iterator[Path]:
+    try:
+        yield from (
+            p for p in root.iterdir() if p.is_dir() and not p.name.startswith(".")
+        )
+    except OSError:
+        return
+
+
+def _mtime(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return None
+
+
+def _last_used(entry: Path) -> float:
+    # entries from before USED_FILE existed were marked by writing their size
+    for marker in (entry / USED_FILE, entry / SIZE_FILE, entry):
+        if (used := _mtime(marker)) is not None:
+            return used
+    return 0.0
+
+
+def _size(entry: Path) -> int:
+    """
+    the entry's recorded size, measuring (and recording) it again if it was used since
+    """
+    measured = _mtime(entry / SIZE_FILE)
+    used = _mtime(entry / USED_FILE)
+    if measured is not None and (used is None or used <= measured):
+        try:
+            return int((entry / SIZE_FILE).read_text())
+        except (OSError, ValueError):
+            pass
+    size = disk_usage(entry)
+    try:
+        atomic_write(entry / SIZE_FILE, str(size).encode())
+    except OSError:
+        pass
+    return size
+
+
+def eviction_due(root: Path) -> bool:
+    """
+    whether it's been `EVICT_INTERVAL` seconds since the store was last evicted from
+    """
+    evicted = _mtime(root / EVICTED_FILE)
+    return evicted is None or time.time() - evicted >= EVICT_INTERVAL
+
+
+def _make_writable(function, path, _excinfo):
+    # go makes its module cache read-only, so directories have to be opened up before anything in them can be removed
+    os.chmod(os.path.dirname(path), 0o755)
+    if os.path.isdir(path):
+        os.chmod(path, 0o755)
+    function(path)
+
+
+def _lock_path(entry: Path) -> Path:
+    return entry.with_name(entry.name + LOCK_SUFFIX)
+
+
+def _lock_entry(entry: Path) -> IO[str]:
+    """
+    take a shared lock on `entry`, so it can't be evicted while it's open. Raises an `OSError` if the lock file can't be created
+    """
+    import fcntl
+
+    path = _lock_path(entry)
+    while True:
+        lock = open(path, "w")
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        try:
+            if os.fstat(lock.fileno()).st_ino == path.stat().st_ino:
+                return lock
+        except OSError:
+            pass
+        # the entry was evicted (and its lock file deleted) while this was waiting, so this lock guards nothing
+        lock.close()
+
+
+def remove_entry(entry: Path):
+    try:
+        if sys.version_info >= (3, 12):
+            shutil.rmtree(entry, onexc=_make_writable)
+        else:
+            shutil.rmtree(entry, onerror=_make_writable)
+    except OSError:
+        pass
+
+
+def evict(root: Path, max_bytes: int, keep: Path):
+    """
+    remove the least-recently-used entries (besides `keep`) until the store fits in `max_bytes`. Entries that are in use are skipped
+    """
+    import fcntl
+
+    with open(root / f".evict{LOCK_SUFFIX}", "w") as store_lock:
+        # one job evicts at a time. The others have nothing to add
+        try:
+            fcntl.flock(store_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        (root / EVICTED_FILE).touch()
+
+        entries = [(_last_used(entry), _size(entry), entry) for entry in _entries(root)]
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= max_bytes:
+                break
+            if entry == keep:
+                continue
+            lock_path = _lock_path(entry)
+            with open(lock_path, "w") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                remove_entry(entry)
+                # while it's still held, so a job waiting on it notices it's gone (see `_lock_entry`)
+                lock_path.unlink(missing_ok=True)
+            total -= size
+
+
+@contextmanager
+def dependency_cache(command: Command, context: Context) -> Iterator[Optional[Path]]:
+    """
+    point `command`'s cache variables at the shared store's entry for its lockfile for as long as this is open. Yields the entry, or `None` (changing nothing) if the command has no known caches
+    """
+    if not (spec := CACHE_SPECS.get(command)):
+        context.debug(f"there are no dependency caches to share for {command.name}")
+        yield None
+        return
+
+    lockfile = lockfile_hash(spec, context.cwd)
+    root = store_root()
+    entry = root / f"{command.name}-{lockfile or 'no-lockfile'}"
+    try:
+        root.mkdir(parents=True, exist_ok=True)
+        # shared, so any number of jobs can use the entry, but it can't be evicted out from under them
+        lock = _lock_entry(entry)
+    except OSError as e:
+        print(f"can't use the CI cache in {root}: {e}")
+        yield None
+        return
+
+    try:
+        entry.mkdir(exist_ok=True)
+        context.debug(f"using the CI cache in {entry}")
+        with patched_environ({name: str(entry / name) for name in spec.variables}):
+            yield entry
+    finally:
+        try:
+            (entry / USED_FILE).touch()
+        except OSError:
+            pass
+        lock.close()
+        try:
+            if eviction_due(root):
+                evict(root, env_size("UTR_CI_CACHE_SIZE", DEFAULT_MAX_SIZE), entry)
+        except OSError:
+            pass
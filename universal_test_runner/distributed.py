@@ -0,0 +1,241 @@
+"""
+Spreads a test suite's units (see `units.py`) across any number of machines, which pull work from a central coordinator as they go. Unlike sharding, fast workers just take more units, so nobody sits idle waiting on the slowest shard.
+
+The protocol is newline-delimited JSON over TCP. A worker sends a message (including the result of its previous unit, if any) and gets back either its next unit or `{"done": true}`. If a worker disconnects mid-unit, that unit goes back on the queue for someone else.
+"""
+
+import asyncio
+import json
+import os
+import socket
+from collections import deque
+from typing import Any, Optional
+
+from colorama import Style
+
+from universal_test_runner.commands import COMMANDS_BY_NAME, Command
+from universal_test_runner.context import Context
+from universal_test_runner.parallel import Job, JobResult, print_summary
+from universal_test_runner.timings import load_durations, record_durations
+from universal_test_runner.units import UNIT_KINDS, unit_jobs, units_returncode
+
+# a unit that takes down this many workers is probably the problem, so it's marked as failed rather than handed out again
+MAX_ATTEMPTS = 3
+# a quiet worker is probed after this many seconds, and given up on (and its unit requeued) after this many unanswered probes.
+# A worker that's busy with a long unit still answers them, so only machines that vanished are dropped, after about a minute
+KEEPALIVE_IDLE = 30
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_PROBES = 3
+
+
+def parse_address(address: str) -> Optional[tuple[str, int]]:
+    """
+    `"host:port"` -> `("host", port)`
+    """
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        return None
+    return host.strip("[]"), int(port)
+
+
+def enable_keepalive(sock: socket.socket):
+    """
+    notice when the machine on the other end of `sock` vanishes without closing the connection, on platforms that let us tune how soon
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # the system defaults wait hours before probing. macOS calls TCP_KEEPIDLE TCP_KEEPALIVE
+    for names, value in (
+        (("TCP_KEEPIDLE", "TCP_KEEPALIVE"), KEEPALIVE_IDLE),
+        (("TCP_KEEPINTVL",), KEEPALIVE_INTERVAL),
+        (("TCP_KEEPCNT",), KEEPALIVE_PROBES),
+    ):
+        option = next((getattr(socket, n) for n in names if hasattr(socket, n)), None)
+        if option is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, option, value)
+
+
+def _encode(message: dict[str, Any]) -> bytes:
+    return (json.dumps(message) + "\n").encode()
+
+
+class Coordinator:
+    """
+    Holds the queue of units and hands them out to workers on request. Must be created inside a running event loop.
+    """
+
+    def __init__(self, command: Command, jobs: list[Job]):
+        self.command = command
+        self.jobs = {job.label: job for job in jobs}
+        self.pending = deque(self.jobs)
+        self.in_flight: set[str] = set()
+        self.attempts: dict[str, int] = {}
+        self.results: dict[str, JobResult] = {}
+        self.changed = asyncio.Condition()
+        self.drained = asyncio.Event()
+        if not self.jobs:
+            self.drained.set()
+
+    def _check_drained(self):
+        if not self.pending and not self.in_flight:
+            self.drained.set()
+
+    async def _next_unit(self) -> Optional[str]:
+        async with self.changed:
+            while True:
+                if self.pending:
+                    unit = self.pending.popleft()
+                    self.in_flight.add(unit)
+                    return unit
+                if not self.in_flight:
+                    return None
+                # something else is still running, and might come back if its worker dies
+                await self.changed.wait()
+
+    async def _finish(self, unit: str, result: dict[str, Any], worker: str):
+        returncode = int(result.get("returncode", 1))
+        duration = float(result.get("duration", 0.0))
+        status = "passed" if returncode == 0 else f"failed ({returncode})"
+        print(
+            Style.DIM
+            + f"-> [{unit}] {status} on {worker} in {duration:.2f}s"
+            + Style.RESET_ALL,
+            flush=True,
+        )
+        async with self.changed:
+            self.in_flight.discard(unit)
+            self.results[unit] = JobResult(self.jobs[unit], returncode, b"", duration)
+            self._check_drained()
+            self.changed.notify_all()
+
+    async def _requeue(self, unit: str, worker: str):
+        async with self.changed:
+            self.in_flight.discard(unit)
+            self.attempts[unit] = self.attempts.get(unit, 0) + 1
+            if self.attempts[unit] >= MAX_ATTEMPTS:
+                print(f"-> [{unit}] lost {MAX_ATTEMPTS} workers, giving up on it")
+                self.results[unit] = JobResult(self.jobs[unit], 1, b"", 0.0)
+            else:
+                print(f"-> [{unit}] lost {worker}, requeueing", flush=True)
+                self.pending.appendleft(unit)
+            self._check_drained()
+            self.changed.notify_all()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker = "unknown worker"
+        current: Optional[str] = None
+        if sock := writer.get_extra_info("socket"):
+            enable_keepalive(sock)
+        try:
+            while line := await reader.readline():
+                if not isinstance(message := json.loads(line), dict):
+                    raise ValueError(f"unexpected message: {message!r}")
+                worker = str(message.get("worker", worker))
+                if current and (result := message.get("result")):
+                    if not isinstance(result, dict):
+                        raise ValueError(f"unexpected result: {result!r}")
+                    await self._finish(current, result, worker)
+                    current = None
+
+                if (current := await self._next_unit()) is None:
+                    writer.write(_encode({"done": True}))
+                    await writer.drain()
+                    break
+
+                writer.write(_encode({"command": self.command.name, "unit": current}))
+                await writer.drain()
+        except (ConnectionError, ValueError, TypeError):
+            # a worker that's gone, or sent something unexpected, is dropped
+            pass
+        finally:
+            if current is not None:
+                await self._requeue(current, worker)
+            writer.close()
+
+    def ordered_results(self) -> list[JobResult]:
+        return [self.results[label] for label in self.jobs if label in self.results]
+
+
+async def _coordinate(
+    command: Command, context: Context, jobs: list[Job], host: str, port: int
+) -> list[JobResult]:
+    coordinator = Coordinator(command, jobs)
+    server = await asyncio.start_server(coordinator.handle, host, port)
+
+    address = server.sockets[0].getsockname()
+    print(
+        f"coordinating {len(jobs)} {UNIT_KINDS[command].name}(s) for {command.name} on {address[0]}:{address[1]}",
+        flush=True,
+    )
+    context.debug(f"units: {', '.join(j.label for j in jobs)}")
+
+    async with server:
+        await coordinator.drained.wait()
+    return coordinator.ordered_results()
+
+
+def run_coordinator(
+    command: Optional[Command], context: Context, host: str, port: int
+) -> int:
+    """
+    serve the detected command's units to workers until each one has run, then print a merged summary
+    """
+    if not command or command not in UNIT_KINDS:
+        print(
+            f"{command.name if command else 'this project'} can't be split up between workers"
+        )
+        return 1
+    if (units := UNIT_KINDS[command].find(context)) is None:
+        print(f"couldn't find the {UNIT_KINDS[command].name}s for {command.name}")
+        return 1
+
+    jobs = unit_jobs(command, context, units, load_durations(command, context))
+    results = asyncio.run(_coordinate(command, context, jobs, host, port))
+
+    print_summary(results)
+    record_durations(command, context, {r.job.label: r.duration for r in results})
+    return units_returncode(command, results)
+
+
+class CoordinatorClient:
+    """
+    A worker's connection to the coordinator
+    """
+
+    def __init__(self, address: tuple[str, int]):
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.sock = socket.create_connection(address)
+        self.file = self.sock.makefile("rwb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.file.close()
+        self.sock.close()
+
+    def next_unit(
+        self, result: Optional[dict[str, Any]] = None
+    ) -> Optional[tuple[Command, str]]:
+        """
+        report how the last unit went (if there was one) and get the next one. `None` once the queue is empty.
+
+        Raises an `OSError` if the coordinator goes away, or a `ValueError` if it sends something unexpected.
+        """
+        message: dict[str, Any] = {"worker": self.name}
+        if result:
+            message["result"] = result
+        self.file.write(_encode(message))
+        self.file.flush()
+
+        if not (line := self.file.readline()):
+            raise ConnectionError("coordinator closed the connection")
+        reply = json.loads(line)
+        if reply.get("done"):
+            return None
+
+        if (
+            command := COMMANDS_BY_NAME.get(reply.get("command", ""))
+        ) not in UNIT_KINDS:
+            raise ValueError(f"unexpected reply from coordinator: {reply}")
+        assert command
+        return command, reply["unit"]
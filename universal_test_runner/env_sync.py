@@ -0,0 +1,166 @@
+"""
+Skips the environment check that `uv run` does before every run (`UTR_SYNC_ONCE`), which can take seconds in a big project.
+
+Instead, `t` keeps a fingerprint of what the project's environment was last synced from: the lockfile, `pyproject.toml`, the requested Python version, and the interpreter the environment was built on. While it matches, the tests run without syncing. When it changes, the environment is synced once, up front, and then the tests run. `poetry run` and `pdm run` never sync on their own, so for them this keeps the environment from going stale without a manual `poetry install` or `pdm sync`.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from colorama import Style
+
+from universal_test_runner.cache import digest, read_cache, write_cache
+from universal_test_runner.commands import Command, pdm_pytest, poetry_pytest, uv_pytest
+from universal_test_runner.context import Context
+from universal_test_runner.settings import env_flag, patched_environ
+
+NAMESPACE = "env-sync"
+# the files that decide what gets installed
+WATCHED_FILES = ("pyproject.toml", ".python-version")
+# run in the project's environment to find out where it is
+PROBE = "import json, sys; print(json.dumps([sys.prefix, sys.executable]))"
+
+
+@dataclass(frozen=True)
+class SyncSpec:
+    lockfile: str
+    sync: tuple[str, ...]
+    """
+    the command that brings the environment up to date with the lockfile
+    """
+    no_sync: dict[str, str]
+    """
+    the variables that tell the manager not to sync on its own
+    """
+
+
+SYNC_SPECS: dict[Command, SyncSpec] = {
+    # `uv run` syncs without removing extra packages, so this matches it
+    uv_pytest: SyncSpec("uv.lock", ("uv", "sync", "--inexact"), {"UV_NO_SYNC": "1"}),
+    poetry_pytest: SyncSpec("poetry.lock", ("poetry", "install"), {}),
+    pdm_pytest: SyncSpec("pdm.lock", ("pdm", "sync"), {}),
+}
+
+
+def _file_hash(path: Path) -> Optional[str]:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+def _interpreter_stamp(executable: str) -> Optional[list[int]]:
+    # a venv's python is a link to the real one, which is replaced when that python is upgraded
+    try:
+        stat = os.stat(executable)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def fingerprint(spec: SyncSpec, cwd: str, prefix: str, executable: str) -> str:
+    """
+    a hash of everything that decides whether the environment at `prefix` is up to date
+    """
+    return digest(
+        {name: _file_hash(Path(cwd, name)) for name in (spec.lockfile, *WATCHED_FILES)},
+        # recreating the environment rewrites this, and it names the python version it was made with
+        _file_hash(Path(prefix, "pyvenv.cfg")),
+        _interpreter_stamp(executable),
+    )
+
+
+def is_synced(command: Command, context: Context) -> bool:
+    """
+    whether the environment hasn't changed since it was last synced
+    """
+    spec = SYNC_SPECS[command]
+    record = read_cache(NAMESPACE, context.cwd, command.name)
+    if not isinstance(record, dict):
+        return False
+    prefix, executable = record.get("prefix", ""), record.get("executable", "")
+    return record.get("fingerprint") == fingerprint(
+        spec, context.cwd, prefix, executable
+    )
+
+
+def _locate_environment(
+    command: Command, context: Context
+) -> Optional[tuple[str, str]]:
+    # `uv run pytest` -> `uv run python`
+    try:
+        result = subprocess.run(
+            [*command.test_command[:-1], "python", "-c", PROBE],
+            capture_output=True,
+            cwd=context.cwd,
+            check=True,
+            env={**os.environ, **SYNC_SPECS[command].no_sync},
+        )
+        prefix, executable = json.loads(result.stdout.decode().strip().splitlines()[-1])
+    except (OSError, subprocess.CalledProcessError, ValueError, IndexError):
+        return None
+    return prefix, executable
+
+
+def sync(command: Command, context: Context) -> int:
+    """
+    sync the environment and remember its fingerprint. Returns the sync's exit code
+    """
+    spec = SYNC_SPECS[command]
+    if not env_flag("UTR_DISABLE_ECHO"):
+        print(
+            Style.DIM
+            + "-> "
+            + " ".join(spec.sync)
+            + " (the environment changed)"
+            + Style.RESET_ALL,
+            flush=True,
+        )
+    try:
+        returncode = subprocess.run(list(spec.sync), cwd=context.cwd).returncode
+    except FileNotFoundError:
+        print(f"command not found: {spec.sync[0]}")
+        return 1
+    if returncode:
+        print(f"couldn't sync the environment with `{' '.join(spec.sync)}`")
+        return returncode
+
+    if located := _locate_environment(command, context):
+        prefix, executable = located
+        write_cache(
+            NAMESPACE,
+            context.cwd,
+            command.name,
+            {
+                "fingerprint": fingerprint(spec, context.cwd, prefix, executable),
+                "prefix": prefix,
+                "executable": executable,
+            },
+        )
+    else:
+        context.debug(
+            "couldn't find the environment, so it'll be synced again next time"
+        )
+    return 0
+
+
+@contextmanager
+def synced_environment(command: Command, context: Context) -> Iterator[int]:
+    """
+    sync the environment if it changed, then tell the manager not to sync it again for as long as this is open. Yields the sync's exit code, and changes nothing if it failed
+    """
+    if is_synced(command, context):
+        context.debug("the environment is up to date, skipping the sync")
+    elif returncode := sync(command, context):
+        yield returncode
+        return
+
+    with patched_environ(SYNC_SPECS[command].no_sync):
+        yield 0
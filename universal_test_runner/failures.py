@@ -0,0 +1,266 @@
+"""
+Remembers which tests failed, so the next run can start with them (`UTR_FAILED_FIRST`) or run only them (`UTR_RERUN_FAILED`).
+
+Failures are recorded from the events described in `results.py`, and picked out again with each runner's own filtering flags. pytest already does all of this itself (with `--lf` and `--ff`), so it's left to that.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from universal_test_runner.cache import read_cache, write_cache
+from universal_test_runner.commands import (
+    Command,
+    bun,
+    elixir,
+    go_multi,
+    go_single,
+    npm,
+    pnpm,
+    rust,
+    with_script_args,
+    yarn,
+)
+from universal_test_runner.context import Context
+from universal_test_runner.cpus import uses_jest
+from universal_test_runner.results import Event
+
+# the most failures that are remembered, so a badly broken suite doesn't turn into an enormous command line
+MAX_FAILURES = 500
+FAILED_OUTCOMES = {"failed", "error"}
+# the parts of an event that identify a test
+IDENTIFYING_FIELDS = ("suite", "test", "file", "line", "parent")
+
+Failure = dict[str, Any]
+
+
+def _key(event: Event) -> tuple[Any, Any]:
+    return event.get("suite"), event.get("test")
+
+
+def load_failures(command: Command, context: Context) -> list[Failure]:
+    failures = read_cache("failures", context.cwd, command.name)
+    if not isinstance(failures, list):
+        return []
+    return [
+        f for f in failures if isinstance(f, dict) and isinstance(f.get("test"), str)
+    ]
+
+
+class FailureTracker:
+    """
+    Follows a run's events to work out which tests are failing now: the ones that just failed, plus earlier failures that didn't run this time. Passing tests are only tracked if they used to fail, so memory use doesn't depend on the size of the suite.
+    """
+
+    def __init__(self, previous: list[Failure]):
+        self.previous = {_key(f): f for f in previous}
+        self.failed: dict[tuple[Any, Any], Failure] = {}
+        self.fixed: set[tuple[Any, Any]] = set()
+
+    def add(self, event: Event):
+        if event.get("event") != "end":
+            return
+        key = _key(event)
+        if event.get("outcome") in FAILED_OUTCOMES:
+            if len(self.failed) < MAX_FAILURES:
+                self.failed[key] = {
+                    k: event[k] for k in IDENTIFYING_FIELDS if event.get(k) is not None
+                }
+        elif key in self.previous:
+            self.fixed.add(key)
+
+    def failures(self) -> list[Failure]:
+        remaining = {k: f for k, f in self.previous.items() if k not in self.fixed}
+        return list({**remaining, **self.failed}.values())[:MAX_FAILURES]
+
+
+def record_failures(command: Command, context: Context, tracker: FailureTracker):
+    write_cache("failures", context.cwd, command.name, tracker.failures())
+
+
+def _escape(text: str) -> str:
+    # the characters that are special in both JS and RE2 (go) regexes. Python's `re.escape` escapes more than RE2 allows
+    return re.sub(r"[.*+?^${}()|[\]\\]", r"\\\g<0>", text)
+
+
+def _alternatives(names: set[str]) -> str:
+    return "|".join(_escape(n) for n in sorted(names))
+
+
+def _suites(failures: list[Failure]) -> list[str]:
+    return sorted({f["suite"] for f in failures if isinstance(f.get("suite"), str)})
+
+
+def _split_args(args: list[str]) -> tuple[list[str], list[str]]:
+    """
+    args for the tool itself and for the test binary, on either side of `--`
+    """
+    if "--" not in args:
+        return list(args), []
+    i = args.index("--")
+    return list(args[:i]), list(args[i + 1 :])
+
+
+def _selected(argv: list[str], prefix: list[str]) -> Optional[list[str]]:
+    """
+    the units (files, packages, etc) that sharding or change-based selection appended to `prefix`, or `None` if `argv` runs everything
+    """
+    if argv[: len(prefix)] != prefix or len(argv) == len(prefix):
+        return None
+    return argv[len(prefix) :]
+
+
+# go
+
+
+def _go_pattern(failures: list[Failure]) -> str:
+    # `-run` splits patterns on `/` to match subtests level by level, so the whole top-level test is run
+    return f"^({_alternatives({f['test'].split('/')[0] for f in failures})})$"
+
+
+def _go_only(
+    command: Command, context: Context, failures: list[Failure], argv: list[str]
+) -> Optional[list[str]]:
+    prefix = ["go", "test", *context.args]
+    selected = _selected(argv, prefix)
+    if selected is None or selected == command.test_command[2:]:
+        # everything runs, so only the packages with failures have to be built
+        packages = _suites(failures) or command.test_command[2:]
+    # otherwise, only the failures in this part of the suite
+    elif not (packages := [p for p in _suites(failures) if p in selected]):
+        return None
+    return [*prefix, "-run", _go_pattern(failures), *packages]
+
+
+def _go_skip(
+    command: Command, context: Context, failures: list[Failure], argv: list[str]
+) -> Optional[list[str]]:
+    # `-skip` needs go 1.20+
+    return [*argv, "-skip", _go_pattern(failures)]
+
+
+# rust
+
+
+def _cargo_names(failures: list[Failure]) -> list[str]:
+    return sorted({f["test"] for f in failures})
+
+
+def _cargo_only(
+    command: Command, context: Context, failures: list[Failure], argv: list[str]
+) -> Optional[list[str]]:
+    # test names that aren't in the selected crates just don't match anything
+    cargo_args, test_args = _split_args(argv)
+    return [*cargo_args, "--", *test_args, *_cargo_names(failures), "--exact"]
+
+
+def _cargo_skip(
+    command: Command, context: Context, failures: list[Failure], argv: list[str]
+) -> Optional[list[str]]:
+    cargo_args, test_args = _split_args(argv)
+    skips = [arg for name in _cargo_names(failures) for arg in ("--skip", name)]
+    return [*cargo_args, "--", *test_args, *skips, "--exact"]
+
+
+# javascript
+
+
+def _js_args(command: Command, context: Context) -> list[str]:
+    return with_script_args(command, [*command.test_command, *context.args])
+
+
+def _js_only(
+    command: Command, context: Context, failures: list[Failure], argv: list[str]
+) -> Optional[list[str]]:
+    prefix = _js_args(command, context)
+    files = _suites(failures)
+    if (selected := _selected(argv, prefix)) is not None:
+        files = [f for f in files if f in selected]
+    if not files:
+        return None
+    # jest matches names against a test's full name. Other runners get the failing files
+    names = (
+        [f"--testNamePattern=^(?:{_alternatives({f['test'] for f in failures})})$"]
+        if command != bun and uses_jest(context)
+        else []
+    )
+    return [*prefix, *files, *names]
+
+
+def _js_skip(
+    command: Command, context: Context, failures: list[Failure], argv: list[str]
+) -> Optional[list[str]]:
+    if command == bun or not uses_jest(context):
+        return None
+    return with_script_args(
+        command,
+        argv,
+        f"--testNamePattern=^(?!(?:{_alternatives({f['test'] for f in failures})})$)",
+    )
+
+
+# elixir
+
+
+def _exunit_only(
+    command: Command, context: Context, failures: list[Failure], argv: list[str]
+) -> Optional[list[str]]:
+    prefix = [*command.test_command, *context.args]
+    selected = _selected(argv, prefix)
+    locations = sorted(
+        {
+            f"{f['file']}:{f['line']}"
+            for f in failures
+            if f.get("file")
+            and f.get("line")
+            and (selected is None or f["file"] in selected)
+        }
+    )
+    if not locations:
+        return None
+    return [*prefix, *locations]
+
+
+@dataclass(frozen=True)
+class FailureFilter:
+    only: Callable[[Command, Context, list[Failure], list[str]], Optional[list[str]]]
+    """
+    the argv that runs just the given failures, out of those the given argv runs. `None` if they can't be picked out
+    """
+    skip: Optional[
+        Callable[[Command, Context, list[Failure], list[str]], Optional[list[str]]]
+    ] = None
+    """
+    the argv that runs everything else the given argv runs. Without one, the rest of a failed-first run repeats them
+    """
+
+
+FAILURE_FILTERS: dict[Command, FailureFilter] = {
+    go_multi: FailureFilter(_go_only, _go_skip),
+    go_single: FailureFilter(_go_only, _go_skip),
+    rust: FailureFilter(_cargo_only, _cargo_skip),
+    npm: FailureFilter(_js_only, _js_skip),
+    yarn: FailureFilter(_js_only, _js_skip),
+    pnpm: FailureFilter(_js_only, _js_skip),
+    bun: FailureFilter(_js_only, _js_skip),
+    elixir: FailureFilter(_exunit_only),
+}
+
+
+def failure_runs(
+    command: Command,
+    context: Context,
+    failures: list[Failure],
+    argv: list[str],
+    rerun_only: bool,
+) -> list[list[str]]:
+    """
+    the argvs to run in order: just the failures, then (unless `rerun_only`) everything else, both limited to what `argv` runs (which may already be narrowed down by sharding or change-based selection). If the failures can't be picked out, that's just `argv`
+    """
+    selection = FAILURE_FILTERS[command]
+    if not (only := selection.only(command, context, failures, argv)):
+        return [argv]
+    if rerun_only:
+        return [only]
+    rest = selection.skip(command, context, failures, argv) if selection.skip else None
+    return [only, rest or argv]
@@ -0,0 +1,62 @@
+"""
+Thin wrappers around the `git` CLI. Each returns `None` if `git` isn't installed or the directory isn't a repo, so callers can fall back to doing everything.
+"""
+
+import subprocess
+from typing import Optional
+
+
+def _git(cwd: str, *args: str) -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", *args], capture_output=True, cwd=cwd, check=True, text=True
+        )
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return None
+    return result.stdout
+
+
+def changed_files(cwd: str, ref: str) -> Optional[list[str]]:
+    """
+    paths (relative to `cwd`) of files under `cwd` that differ from `ref`, including uncommitted and untracked changes
+    """
+    diff = _git(cwd, "diff", "--name-only", "--relative", ref, "--")
+    untracked = _git(cwd, "ls-files", "--others", "--exclude-standard")
+    if diff is None or untracked is None:
+        return None
+
+    return sorted({*diff.splitlines(), *untracked.splitlines()} - {""})
+
+
+def repo_root(cwd: str) -> Optional[str]:
+    if root := _git(cwd, "rev-parse", "--show-toplevel"):
+        return root.strip()
+    return None
+
+
+def index_entries(root: str) -> Optional[str]:
+    """
+    the mode, blob hash, and path of every file in the index. Git keeps these up to date using cached stat data, so nothing is re-hashed
+    """
+    return _git(root, "ls-files", "--stage", "-z")
+
+
+def dirty_files(root: str) -> Optional[list[str]]:
+    """
+    paths (relative to the repo root) of files whose working copy differs from the index, plus untracked files
+    """
+    if (
+        status := _git(root, "status", "--porcelain", "-z", "--untracked-files=all")
+    ) is None:
+        return None
+
+    paths = []
+    entries = iter(status.split("\0"))
+    for entry in entries:
+        if not entry:
+            continue
+        paths.append(entry[3:])
+        # renames and copies are followed by their original path
+        if entry[0] in "RC":
+            paths.append(next(entries, ""))
+    return sorted(set(paths) - {""})
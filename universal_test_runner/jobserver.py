@@ -0,0 +1,198 @@
+"""
+Support for GNU make's jobserver, which lets nested builds share a single budget of concurrent jobs: https://www.gnu.org/software/make/manual/html_node/Job-Slots.html
+
+Every process in the tree gets one job for free. Each job past that needs a token, which is a byte read from a shared pipe (or fifo) and written back once the job is done. So when `t` runs under `make -j8`, everything it starts counts against those 8 slots.
+"""
+
+import asyncio
+import os
+import re
+import select
+import shlex
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import cache
+from typing import Optional
+
+from universal_test_runner.settings import env_str
+
+# make 4.4+ writes `fifo:PATH`, older versions write `R,W` pipe fds. `--jobserver-fds` is from make 3.x
+JOBSERVER_AUTH = re.compile(r"^--jobserver-(?:auth|fds)=(.+)$")
+
+# how often (in seconds) a job waiting on a token checks whether the implicit slot is free
+POLL_INTERVAL = 0.1
+
+
+def _nonblocking_reader(fd: int) -> int:
+    """
+    a non-blocking fd for reading the same pipe as `fd`. `fd` itself has to stay as it is, since making it non-blocking would also make it non-blocking for make and every other process sharing it (that's also why this can't just be an `os.dup`)
+    """
+    try:
+        # a new open file description, so its flags are its own. Linux only
+        return os.open(f"/proc/self/fd/{fd}", os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        # elsewhere, a token another process takes between `select` and `read` leaves the read waiting for the next one
+        return fd
+
+
+@dataclass(frozen=True)
+class Jobserver:
+    read_fd: int
+    """
+    where tokens are read from. Non-blocking where possible, so a token that another process takes first doesn't leave the read waiting
+    """
+    write_fd: int
+    inherited_fds: tuple[int, ...]
+    """
+    fds that child processes need to be given (with `pass_fds`) to use the jobserver themselves. Empty for fifos, which children open by path
+    """
+
+    def try_acquire(self, timeout: float) -> Optional[bytes]:
+        """
+        take a token, waiting at most `timeout` seconds for one to be available
+        """
+        readable, _, _ = select.select([self.read_fd], [], [], timeout)
+        if not readable:
+            return None
+        try:
+            return os.read(self.read_fd, 1) or None
+        except (BlockingIOError, InterruptedError):
+            # another process got there first, since `select` said there was a token
+            return None
+
+    def release(self, token: bytes):
+        os.write(self.write_fd, token)
+
+
+def parse_makeflags(makeflags: str) -> Optional[str]:
+    """
+    the jobserver's address from `MAKEFLAGS`, if there is one. Later flags win, same as in make
+    """
+    auth = None
+    for flag in shlex.split(makeflags):
+        if match := JOBSERVER_AUTH.match(flag):
+            auth = match.group(1)
+    return auth
+
+
+def connect(auth: str) -> Optional[Jobserver]:
+    """
+    open the jobserver described by `auth`. `None` if it's unusable, e.g. because make didn't pass its fds along (which happens unless the recipe is marked as recursive with `+`)
+    """
+    if auth.startswith("fifo:"):
+        path = auth[len("fifo:") :]
+        try:
+            read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            return None
+        try:
+            # doesn't wait for a reader, since there already is one
+            write_fd = os.open(path, os.O_WRONLY)
+        except OSError:
+            os.close(read_fd)
+            return None
+        return Jobserver(read_fd, write_fd, ())
+
+    try:
+        read_fd, write_fd = (int(fd) for fd in auth.split(","))
+        # make passes negative fds when the jobserver is disabled
+        if read_fd < 0 or write_fd < 0:
+            return None
+        os.fstat(read_fd)
+        os.fstat(write_fd)
+    except (ValueError, OSError):
+        return None
+    return Jobserver(_nonblocking_reader(read_fd), write_fd, (read_fd, write_fd))
+
+
+@cache
+def find_jobserver() -> Optional[Jobserver]:
+    """
+    the jobserver this process was started under, if any
+    """
+    if not (auth := parse_makeflags(env_str("MAKEFLAGS") or "")):
+        return None
+    return connect(auth)
+
+
+def start_jobserver(slots: int) -> Jobserver:
+    """
+    become a jobserver with `slots` total job slots, advertised to every child process through `MAKEFLAGS`
+    """
+    read_fd, write_fd = os.pipe()
+    # this process's own implicit slot is the one that isn't in the pipe
+    os.write(write_fd, b"+" * (slots - 1))
+
+    makeflags = env_str("MAKEFLAGS") or ""
+    os.environ["MAKEFLAGS"] = (
+        f"{makeflags} -j{slots} --jobserver-auth={read_fd},{write_fd}".strip()
+    )
+    find_jobserver.cache_clear()
+    # the same one that everything else in this process will find
+    jobserver = find_jobserver()
+    assert jobserver
+    return jobserver
+
+
+def child_fds() -> tuple[int, ...]:
+    """
+    fds that every child should inherit, so the jobserver reaches `make`, `just`, and nested `t` runs
+    """
+    return jobserver.inherited_fds if (jobserver := find_jobserver()) else ()
+
+
+class TokenPool:
+    """
+    Hands out job slots to concurrently running jobs. The first job uses this process's implicit slot, and every other one waits on a jobserver token. Without a jobserver, slots are unlimited.
+    """
+
+    def __init__(self, jobserver: Optional[Jobserver]):
+        self.jobserver = jobserver
+        self.implicit_free = True
+
+    async def _acquire(self) -> Optional[bytes]:
+        jobserver = self.jobserver
+        assert jobserver
+        future = asyncio.get_running_loop().run_in_executor(
+            None, jobserver.try_acquire, POLL_INTERVAL
+        )
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # the read carries on without us, so whatever token it gets has to go back
+            def _give_back(done: "asyncio.Future[Optional[bytes]]"):
+                if (
+                    not done.cancelled()
+                    and not done.exception()
+                    and (token := done.result())
+                ):
+                    jobserver.release(token)
+
+            future.add_done_callback(_give_back)
+            raise
+
+    @asynccontextmanager
+    async def slot(self):
+        if not self.jobserver:
+            yield
+            return
+
+        if self.implicit_free:
+            self.implicit_free = False
+            try:
+                yield
+            finally:
+                self.implicit_free = True
+            return
+
+        # reading blocks, so it happens off of the event loop. It also gives up regularly, in case the implicit slot frees up (which might be the only one)
+        while not (token := await self._acquire()):
+            if self.implicit_free:
+                async with self.slot():
+                    yield
+                return
+
+        try:
+            yield
+        finally:
+            self.jobserver.release(token)
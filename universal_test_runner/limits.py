@@ -0,0 +1,206 @@
+"""
+Keeps a test run from starving everything else on a shared machine: which CPUs it can use (`UTR_CPUS`), how much memory each process can take (`UTR_MAX_RSS`), and how its CPU and disk time are prioritized (`UTR_NICE` and `UTR_IO_CLASS`).
+
+The limits are applied to the test command just before it starts (so everything it starts inherits them), using only what an unprivileged process is allowed to do, so there's no need for root, systemd, or cgroups.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import platform
+import signal
+import subprocess
+from dataclasses import dataclass
+from typing import Callable, Optional, Union
+
+from colorama import Style
+
+from universal_test_runner.settings import env_str, format_size, parse_size
+
+# `ioprio_set` isn't wrapped by libc, so it's called by number
+IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251,
+    "aarch64": 30,
+    "i386": 289,
+    "i686": 289,
+    "armv7l": 314,
+    "ppc64le": 273,
+    "s390x": 282,
+    "riscv64": 30,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+# realtime needs root, so it isn't offered
+IO_CLASSES = {"best-effort": 2, "idle": 3}
+# how close to the memory limit the biggest process has to get for it to be the likely cause of a failure
+NEAR_LIMIT = 0.8
+
+
+@dataclass(frozen=True)
+class Limits:
+    cpus: Optional[frozenset[int]] = None
+    max_rss: Optional[int] = None
+    nice: Optional[int] = None
+    io_priority: Optional[int] = None
+    """
+    the class and level, packed together the way `ioprio_set` takes them
+    """
+
+    def __bool__(self):
+        return any(
+            value is not None
+            for value in (self.cpus, self.max_rss, self.nice, self.io_priority)
+        )
+
+
+def parse_cpu_list(value: str) -> Optional[frozenset[int]]:
+    """
+    a list of CPUs in the same format as `taskset -c`, like `0-3,8`
+    """
+    cpus: set[int] = set()
+    try:
+        for part in value.split(","):
+            first, dash, last = part.strip().partition("-")
+            cpus.update(range(int(first), int(last if dash else first) + 1))
+    except ValueError:
+        return None
+    return frozenset(cpus) if cpus and min(cpus) >= 0 else None
+
+
+def _parse_io_class(value: str) -> Optional[int]:
+    name, _, level = value.strip().lower().partition(":")
+    if name not in IO_CLASSES:
+        return None
+    try:
+        # 0 is the highest priority within a class, and 4 is the default
+        if not 0 <= (priority := int(level or 4)) <= 7:
+            return None
+    except ValueError:
+        return None
+    return IO_CLASSES[name] << IOPRIO_CLASS_SHIFT | priority
+
+
+def _ioprio_set() -> Optional[Callable[[int], int]]:
+    if (number := IOPRIO_SET_SYSCALLS.get(platform.machine())) is None:
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+    return lambda priority: libc.syscall(number, IOPRIO_WHO_PROCESS, 0, priority)
+
+
+def limits_from_env() -> Union[Limits, str]:
+    """
+    the limits asked for with `UTR_*` variables, or a message explaining why they can't be used
+    """
+    cpus = max_rss = nice = io_priority = None
+
+    if value := env_str("UTR_CPUS"):
+        if not (cpus := parse_cpu_list(value)):
+            return f"invalid UTR_CPUS value: {value!r} (expected something like 0-3,8)"
+        if not hasattr(os, "sched_setaffinity"):
+            return "UTR_CPUS isn't supported on this platform"
+        if unusable := cpus - os.sched_getaffinity(0):
+            return f"UTR_CPUS includes CPUs that aren't available here: {', '.join(map(str, sorted(unusable)))}"
+
+    if value := env_str("UTR_MAX_RSS"):
+        if not (max_rss := parse_size(value)):
+            return f"invalid UTR_MAX_RSS value: {value!r} (expected something like 4G)"
+        try:
+            import resource  # noqa: F401
+        except ImportError:
+            return "UTR_MAX_RSS isn't supported on this platform"
+
+    if value := env_str("UTR_NICE"):
+        try:
+            nice = int(value)
+        except ValueError:
+            nice = -1
+        # raising priority needs root
+        if not 0 <= nice <= 19:
+            return f"invalid UTR_NICE value: {value!r} (expected 0 to 19)"
+
+    if value := env_str("UTR_IO_CLASS"):
+        if (io_priority := _parse_io_class(value)) is None:
+            return f"invalid UTR_IO_CLASS value: {value!r} (expected idle or best-effort, optionally with a level like best-effort:7)"
+        if not _ioprio_set():
+            return "UTR_IO_CLASS isn't supported on this platform"
+
+    return Limits(cpus=cpus, max_rss=max_rss, nice=nice, io_priority=io_priority)
+
+
+def preexec(limits: Limits) -> Optional[Callable[[], None]]:
+    """
+    a function that applies `limits` to the current process, for `preexec_fn`. Everything it needs is looked up ahead of time, since it runs between fork and exec
+    """
+    if not limits:
+        return None
+
+    import resource
+
+    ioprio_set = _ioprio_set() if limits.io_priority is not None else None
+
+    def _apply():
+        if limits.cpus is not None:
+            os.sched_setaffinity(0, limits.cpus)
+        if limits.max_rss is not None:
+            # the kernel doesn't enforce RLIMIT_RSS, but RLIMIT_DATA covers the memory a process actually allocates (and, unlike RLIMIT_AS, not the address space that go and node reserve up front)
+            resource.setrlimit(resource.RLIMIT_DATA, (limits.max_rss, limits.max_rss))
+        if limits.nice is not None:
+            os.nice(limits.nice)
+        if ioprio_set and limits.io_priority is not None:
+            if ioprio_set(limits.io_priority) != 0:
+                raise OSError(ctypes.get_errno(), "ioprio_set failed")
+
+    return _apply
+
+
+def reap(proc: subprocess.Popen, block: bool = True) -> Optional[int]:
+    """
+    wait for `proc` to exit like `proc.wait()` (or only check whether it has, like `proc.poll()`, if not `block`), setting its `returncode`. Once it has, returns the most memory it or any of its descendants used, in bytes (if that can be measured)
+    """
+    if proc.returncode is not None:
+        return None
+    if not hasattr(os, "wait4"):
+        if block:
+            proc.wait()
+        else:
+            proc.poll()
+        return None
+    # from the child's own exit status, since `RUSAGE_CHILDREN` would also count everything else this process has run
+    pid, status, usage = os.wait4(proc.pid, 0 if block else os.WNOHANG)
+    if not pid:
+        return None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # linux reports KB, while macOS reports bytes
+    peak = usage.ru_maxrss
+    return peak if platform.system() == "Darwin" else peak * 1024
+
+
+def report_limits(limits: Limits, returncode: int, peak: Optional[int]):
+    """
+    explain a failure that was probably caused by a limit, given the test command's `peak` memory use (from `reap`)
+    """
+    if not returncode or not limits.max_rss:
+        return
+
+    if returncode == -signal.SIGKILL:
+        print(
+            Style.DIM
+            + "-> the tests were killed with SIGKILL, possibly by the kernel for running out of memory"
+            + Style.RESET_ALL
+        )
+    elif peak and peak >= limits.max_rss * NEAR_LIMIT:
+        print(
+            Style.DIM
+            + f"-> a process used {format_size(peak)} of memory, near the UTR_MAX_RSS limit of {format_size(limits.max_rss)}, which is likely why the tests failed"
+            + Style.RESET_ALL
+        )
+    elif returncode in (-signal.SIGABRT, -signal.SIGSEGV, -signal.SIGBUS):
+        # runtimes often abort when a single big allocation fails, long before they get near the limit
+        print(
+            Style.DIM
+            + f"-> the tests crashed, which can happen when an allocation goes over the UTR_MAX_RSS limit of {format_size(limits.max_rss)}"
+            + Style.RESET_ALL
+        )
@@ -0,0 +1,79 @@
+"""
+Runs the tests against several versions of the language at once (`UTR_MATRIX`), like `3.9,3.10,3.11` for Python or `1.21.0,1.22.0` for Go, instead of one after another.
+
+Each version is a `Job` with its own environment: `uv run --python` with a separate virtualenv per version (kept between runs, so only the first one has to install anything), or `go test` with `GOTOOLCHAIN` set (go keeps each toolchain's build cache separate on its own). Their output is printed as it arrives, each line prefixed with its version, followed by a table of which passed.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Callable
+
+from universal_test_runner.cache import cache_dir, digest
+from universal_test_runner.commands import Command, go_multi, go_single, uv_pytest
+from universal_test_runner.context import Context
+from universal_test_runner.parallel import Job
+
+
+@dataclass(frozen=True)
+class MatrixKind:
+    name: str
+    """
+    what the versions are versions of, for messages
+    """
+    build: Callable[[Command, Context, str], Job]
+    """
+    the job that runs the tests with one version
+    """
+
+
+def parse_versions(value: str) -> list[str]:
+    """
+    a comma-separated list of versions, without blanks or duplicates
+    """
+    versions: list[str] = []
+    for version in value.split(","):
+        if (version := version.strip()) and version not in versions:
+            versions.append(version)
+    return versions
+
+
+def environment_dir(context: Context, version: str) -> str:
+    # outside the project, so matrix runs don't clutter it (or get picked up by its tests)
+    return str(cache_dir() / "matrix" / digest(os.path.abspath(context.cwd)) / version)
+
+
+def _uv_job(command: Command, context: Context, version: str) -> Job:
+    env = {**os.environ, "UV_PROJECT_ENVIRONMENT": environment_dir(context, version)}
+    # each version's environment has to be synced by `uv run` itself, even if the main one was synced ahead of time
+    env.pop("UV_NO_SYNC", None)
+    # `uv run pytest` -> `uv run --python 3.9 pytest`
+    run, rest = command.test_command[:2], command.test_command[2:]
+    return Job(
+        version,
+        [*run, "--python", version, *rest, *context.args],
+        cwd=context.cwd,
+        env=env,
+    )
+
+
+def _go_job(command: Command, context: Context, version: str) -> Job:
+    # GOTOOLCHAIN wants `go1.22.0`, but `1.22.0` is what people write
+    toolchain = f"go{version}" if version[:1].isdigit() else version
+    return Job(
+        version,
+        [*command.test_command, *context.args],
+        cwd=context.cwd,
+        env={**os.environ, "GOTOOLCHAIN": toolchain},
+    )
+
+
+MATRIX_KINDS: dict[Command, MatrixKind] = {
+    uv_pytest: MatrixKind("python", _uv_job),
+    go_multi: MatrixKind("go", _go_job),
+    go_single: MatrixKind("go", _go_job),
+}
+
+
+def matrix_jobs(command: Command, context: Context, versions: list[str]) -> list[Job]:
+    kind = MATRIX_KINDS[command]
+    return [kind.build(command, context, version) for version in versions]
@@ -0,0 +1,205 @@
+import asyncio
+import io
+import signal
+import sys
+import time
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field
+from typing import Optional
+
+from colorama import Style
+
+from universal_test_runner.jobserver import TokenPool, child_fds, find_jobserver
+from universal_test_runner.watchdog import (
+    CHECK_INTERVAL,
+    TIMED_OUT,
+    Watchdog,
+    print_report,
+    signal_session,
+    watchdog_from_env,
+)
+
+READ_SIZE = 64 * 1024
+
+
+@dataclass
+class Job:
+    """
+    a single test command to be run alongside others
+    """
+
+    label: str
+    """
+    a human-readable way to identify this job in the output
+    """
+    command: list[str]
+    """
+    the argv that gets executed
+    """
+    cwd: Optional[str] = None
+    env: Optional[dict[str, str]] = None
+    dependencies: tuple[str, ...] = ()
+    """
+    labels of other jobs that must finish before this one starts. Labels that aren't part of the run are ignored
+    """
+
+
+@dataclass
+class JobResult:
+    job: Job
+    returncode: int
+    output: bytes = field(repr=False)
+    duration: float
+
+
+def _prefix(job: Job) -> bytes:
+    return (Style.DIM + f"[{job.label}] " + Style.RESET_ALL).encode()
+
+
+async def _read(
+    job: Job, stdout: asyncio.StreamReader, stream: bool, watchdog: Optional[Watchdog]
+) -> bytes:
+    """
+    read all of the job's output, telling the `watchdog` whenever some arrives. With `stream`, each line is also printed as it arrives, prefixed with the job's label
+    """
+    output = bytearray()
+    partial = b""
+    prefix = _prefix(job)
+    while chunk := await stdout.read(READ_SIZE):
+        if watchdog:
+            watchdog.output(time.monotonic())
+        output += chunk
+        if not stream:
+            continue
+        *lines, partial = (partial + chunk).split(b"\n")
+        # writes from different jobs can't interleave mid-line, since they all happen on this thread
+        if lines:
+            sys.stdout.buffer.write(b"".join(prefix + line + b"\n" for line in lines))
+            sys.stdout.flush()
+    if partial:
+        sys.stdout.buffer.write(prefix + partial + b"\n")
+        sys.stdout.flush()
+    return bytes(output)
+
+
+async def _guard(watchdog: Watchdog, session: int):
+    while True:
+        watchdog.check(session, time.monotonic())
+        await asyncio.sleep(CHECK_INTERVAL)
+
+
+async def _run_job(job: Job, stream: bool = False) -> JobResult:
+    start = time.monotonic()
+    # each job gets its own limits, and its own session so they can be enforced
+    watchdog = watchdog_from_env()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *job.command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=job.cwd,
+            env=job.env,
+            pass_fds=child_fds(),
+            start_new_session=bool(watchdog),
+        )
+    except FileNotFoundError:
+        output = f"command not found: {job.command[0]}\n".encode()
+        if stream:
+            print((_prefix(job) + output).decode(), end="", flush=True)
+        return JobResult(job, 1, output, 0.0)
+
+    assert proc.stdout
+    guard = asyncio.ensure_future(_guard(watchdog, proc.pid)) if watchdog else None
+    try:
+        # without `stream`, everything is buffered so concurrent jobs don't interleave their output
+        output = await _read(job, proc.stdout, stream, watchdog)
+        await proc.wait()
+    except BaseException:
+        # e.g. Ctrl-C, which doesn't reach a job in its own session on its own
+        if watchdog:
+            signal_session(proc.pid, signal.SIGKILL)
+        raise
+    finally:
+        if guard:
+            guard.cancel()
+    assert proc.returncode is not None
+    returncode = proc.returncode
+
+    if watchdog:
+        watchdog.finish(proc.pid)
+        if watchdog.reason:
+            returncode = TIMED_OUT
+            with redirect_stdout(io.StringIO()) as report:
+                print_report(watchdog)
+            text = report.getvalue().encode()
+            if stream:
+                sys.stdout.buffer.write(
+                    b"".join(_prefix(job) + line + b"\n" for line in text.splitlines())
+                )
+                sys.stdout.flush()
+            output += text
+    return JobResult(job, returncode, output, time.monotonic() - start)
+
+
+def _echo_job(job: Job):
+    print(Style.DIM + f"-> [{job.label}] " + " ".join(job.command) + Style.RESET_ALL)
+
+
+def print_result(result: JobResult, echo: bool = True):
+    if echo:
+        _echo_job(result.job)
+    print(result.output.decode(errors="replace"), end="", flush=True)
+
+
+async def _run_all(
+    jobs: list[Job], echo: bool, limit: Optional[int], stream: bool
+) -> list[JobResult]:
+    finished = {job.label: asyncio.Event() for job in jobs}
+    slots = asyncio.Semaphore(limit or len(jobs) or 1)
+    tokens = TokenPool(find_jobserver())
+
+    async def _run_and_print(job: Job) -> JobResult:
+        for dep in job.dependencies:
+            if dep in finished and dep != job.label:
+                await finished[dep].wait()
+
+        # only take a slot once the job is ready, so waiting jobs don't block runnable ones
+        async with slots, tokens.slot():
+            if stream and echo:
+                _echo_job(job)
+            result = await _run_job(job, stream)
+
+        # print each job's output as soon as it finishes, rather than in the order they were started
+        if not stream:
+            print_result(result, echo=echo)
+        finished[job.label].set()
+        return result
+
+    # gather keeps the results in job order for the summary
+    return list(await asyncio.gather(*(_run_and_print(job) for job in jobs)))
+
+
+def run_jobs(
+    jobs: list[Job], echo: bool = True, limit: Optional[int] = None, stream=False
+) -> list[JobResult]:
+    """
+    run every job concurrently (at most `limit` at a time), printing each one's output as a single block once it finishes. With `stream`, each line is printed as soon as it arrives instead, prefixed with its job's label.
+
+    Jobs wait for their `dependencies` to finish, so those must not form a cycle.
+    """
+    return asyncio.run(_run_all(jobs, echo, limit, stream))
+
+
+def aggregate_returncode(results: list[JobResult]) -> int:
+    """
+    `0` if everything passed, otherwise the first failing job's exit code
+    """
+    return next((r.returncode for r in results if r.returncode), 0)
+
+
+def print_summary(results: list[JobResult]):
+    width = max((len(r.job.label) for r in results), default=0)
+    print(Style.DIM + "-> summary:" + Style.RESET_ALL)
+    for r in results:
+        status = "passed" if r.returncode == 0 else f"failed ({r.returncode})"
+        print(f"   {r.job.label:<{width}}  {status:<12}  {r.duration:.2f}s")
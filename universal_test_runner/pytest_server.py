@@ -0,0 +1,178 @@
+"""
+Keeps a pytest process warm in the background, with the project's code, conftest files, and dependencies already imported. Each run is a fork of it, so it skips straight to running tests.
+
+The server (`pytest_server_main.py`) runs under the project's own interpreter. It listens on a unix socket, and `t` hands it the args, environment, and its stdin/stdout/stderr. Once any file it imported (or one of the project's manifests) changes, it turns down the next run and shuts down, so that run happens the normal way while a fresh server starts up.
+"""
+
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+from pathlib import Path
+from typing import Callable, Optional
+
+from universal_test_runner.affected import (
+    PYTHON_MANIFESTS,
+    PYTHON_SKIP_DIRS,
+    is_python_test,
+    walk_files,
+)
+from universal_test_runner.cache import cache_dir, digest
+from universal_test_runner.commands import Command, pytest
+from universal_test_runner.context import Context
+
+SERVER_SCRIPT = Path(__file__).with_name("pytest_server_main.py")
+# left next to the socket by a server that can't run under the project's interpreter. Matches the one in `pytest_server_main.py`
+UNSUPPORTED_SUFFIX = ".unsupported"
+
+
+def is_supported() -> bool:
+    return hasattr(os, "fork") and hasattr(socket, "AF_UNIX")
+
+
+def socket_path(command: Command, context: Context) -> Path:
+    # unix socket paths are limited to ~100 bytes, so the name is kept short
+    return (
+        cache_dir()
+        / "pytest-server"
+        / f"{digest(os.path.abspath(context.cwd), command.name)[:16]}.sock"
+    )
+
+
+def interpreter(command: Command) -> Optional[list[str]]:
+    """
+    the argv prefix that runs the project's Python, the one that `command` runs pytest with
+    """
+    if command != pytest:
+        # `uv run pytest` -> `uv run python`
+        return [*command.test_command[:-1], "python"]
+
+    if not (executable := shutil.which("pytest")):
+        return None
+    # pytest's entrypoint script names the interpreter it was installed for
+    try:
+        with open(executable, "rb") as f:
+            first_line = f.readline().decode(errors="replace")
+    except OSError:
+        return None
+    if not first_line.startswith("#!"):
+        return None
+    return first_line[2:].split() or None
+
+
+def _known_unsupported(path: Path, cwd: str) -> bool:
+    """
+    whether a server already found that the project's interpreter is too old to run it, and nothing that could have changed the interpreter has changed since
+    """
+    try:
+        found = Path(f"{path}{UNSUPPORTED_SUFFIX}").stat().st_mtime
+    except OSError:
+        return False
+    for name in [*PYTHON_MANIFESTS, ".python-version"]:
+        try:
+            if Path(cwd, name).stat().st_mtime > found:
+                return False
+        except OSError:
+            pass
+    return True
+
+
+def start_server(command: Command, context: Context) -> bool:
+    """
+    start a server in the background, for the next run to use. Returns whether it was started
+    """
+    if not is_supported() or not (prefix := interpreter(command)):
+        return False
+
+    path = socket_path(command, context)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    watched = [
+        os.path.abspath(os.path.join(context.cwd, name)) for name in PYTHON_MANIFESTS
+    ]
+    if _known_unsupported(path, context.cwd):
+        context.debug(
+            "the project's python is too old for the pytest server (it needs 3.9+)"
+        )
+        return False
+    test_files = [
+        os.path.join(os.path.abspath(context.cwd), f)
+        for f in walk_files(context.cwd, (".py",), PYTHON_SKIP_DIRS)
+        if is_python_test(f) or os.path.basename(f) == "conftest.py"
+    ]
+    try:
+        proc = subprocess.Popen(
+            [*prefix, str(SERVER_SCRIPT), str(path), json.dumps(sorted(watched))],
+            cwd=context.cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        # the server compares this against its own environment, to find what the tool (like `uv run`) set up for the project
+        assert proc.stdin
+        with proc.stdin:
+            proc.stdin.write(
+                json.dumps({"env": dict(os.environ), "test_files": test_files}).encode()
+            )
+    except OSError:
+        return False
+    return True
+
+
+def run_in_server(
+    command: Command,
+    context: Context,
+    args: list[str],
+    on_start: Callable[[], None] = lambda: None,
+) -> Optional[int]:
+    """
+    run pytest with `args` in a fork of the warm server, sharing this process's terminal. `on_start` is called once the server accepts the run. `None` if there's no server ready, or it's out of date
+    """
+    if not is_supported():
+        return None
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with conn:
+        try:
+            conn.connect(str(socket_path(command, context)))
+        except OSError:
+            return None
+
+        request = {
+            "args": args,
+            "cwd": os.path.abspath(context.cwd),
+            "env": dict(os.environ),
+        }
+        try:
+            socket.send_fds(conn, [(json.dumps(request) + "\n").encode()], [0, 1, 2])
+        except OSError:
+            # an out-of-date server hangs up straight away
+            return None
+
+        pid = None
+        replies = conn.makefile("rb")
+        while True:
+            try:
+                line = replies.readline()
+            except OSError:
+                # e.g. the connection was reset by a server that was shutting down
+                line = b""
+            except KeyboardInterrupt:
+                # the run isn't in this terminal's process group, so pass Ctrl-C along and let pytest wrap up
+                if pid is not None:
+                    os.kill(pid, signal.SIGINT)
+                continue
+
+            if not line:
+                # the server went away before the run started, so it can happen elsewhere. If it went away during the run, its output is already on screen
+                return None if pid is None else 1
+            reply = json.loads(line)
+            if reply.get("stale"):
+                return None
+            if "pid" in reply:
+                pid = reply["pid"]
+                on_start()
+            if "returncode" in reply:
+                return reply["returncode"]
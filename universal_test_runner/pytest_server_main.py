@@ -0,0 +1,203 @@
+"""
+The server half of `pytest_server.py`.
+
+This file is run by the *project's* Python interpreter (not the one `t` is installed into), so it can only import the standard library and pytest. It imports everything the test modules and `conftest.py` files import once, then forks a copy of itself for each run. pytest itself only ever runs in those forks, since it doesn't support running more than once in the same process. For the same reason, the test modules and `conftest.py` files are left for each run to import, so pytest can rewrite their asserts.
+
+Usage: python pytest_server_main.py SOCKET_PATH WATCHED_FILES_JSON < CLIENT_JSON
+
+where CLIENT_JSON has the client's `env` and the `test_files` to warm up from. If this interpreter can't receive the client's terminal (`socket.recv_fds` is new in 3.9), it leaves a file at SOCKET_PATH + UNSUPPORTED_SUFFIX and exits, so the client stops trying.
+"""
+
+import ast
+import importlib
+import json
+import os
+import signal
+import socket
+import sys
+import traceback
+
+# shut down after this long (in seconds) without any runs
+IDLE_TIMEOUT = 60 * 60
+UNSUPPORTED_SUFFIX = ".unsupported"
+
+
+def _send(conn: socket.socket, message: dict):
+    conn.sendall((json.dumps(message) + "\n").encode())
+
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _snapshot(watched: list) -> dict:
+    """
+    the modification time of every imported module's file, plus `watched`
+    """
+    paths = set(watched)
+    for module in list(sys.modules.values()):
+        if isinstance(path := getattr(module, "__file__", None), str):
+            paths.add(path)
+    return {p: _mtime(p) for p in paths}
+
+
+def _is_stale(snapshot: dict) -> bool:
+    return any(_mtime(path) != mtime for path, mtime in snapshot.items())
+
+
+def _environment_changes(client_env: dict) -> tuple:
+    """
+    what the tool that started this process (like `uv run`) changed about the client's environment, so runs can get the same changes
+    """
+    changed = {k: v for k, v in os.environ.items() if client_env.get(k) != v}
+    removed = set(client_env) - set(os.environ)
+    return changed, removed
+
+
+def _is_test_module(name: str) -> bool:
+    last = name.rpartition(".")[2]
+    return last == "conftest" or last.startswith("test_") or last.endswith("_test")
+
+
+def _imports(path: str) -> list:
+    """
+    the absolute imports in the file at `path`
+    """
+    try:
+        with open(path, "rb") as f:
+            tree = ast.parse(f.read(), path)
+    except (OSError, SyntaxError, ValueError):
+        return []
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+            names.append(node.module)
+    return names
+
+
+def _base_dir(path: str) -> str:
+    """
+    the directory pytest puts on `sys.path` to import the test module at `path`: the first one up that isn't a package
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    while os.path.isfile(os.path.join(directory, "__init__.py")):
+        directory = os.path.dirname(directory)
+    return directory
+
+
+def _warm_up(test_files: list):
+    import pytest  # noqa: F401
+
+    for path in test_files:
+        if (base := _base_dir(path)) not in sys.path:
+            sys.path.insert(0, base)
+        for name in _imports(path):
+            if name in sys.modules or _is_test_module(name):
+                continue
+            try:
+                importlib.import_module(name)
+            except (Exception, SystemExit):
+                # it'll fail (or not) the same way in the run itself
+                pass
+
+
+def _handle(conn: socket.socket, changes: tuple):
+    """
+    runs in a forked child: take over the client's stdio, run pytest, and report back. Never returns
+    """
+    returncode = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        data, fds, _, _ = socket.recv_fds(conn, 64 * 1024, 3)
+        while not data.endswith(b"\n"):
+            if not (more := conn.recv(64 * 1024)):
+                os._exit(1)
+            data += more
+        request = json.loads(data)
+
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        os.chdir(request["cwd"])
+        changed, removed = changes
+        os.environ.clear()
+        os.environ.update(request["env"])
+        os.environ.update(changed)
+        for name in removed:
+            os.environ.pop(name, None)
+        sys.argv = ["pytest", *request["args"]]
+        _send(conn, {"pid": os.getpid()})
+
+        import pytest
+
+        returncode = int(pytest.main(request["args"]))
+    except SystemExit as e:
+        returncode = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            _send(conn, {"returncode": returncode})
+        finally:
+            os._exit(0)
+
+
+def main():
+    path, watched = sys.argv[1], json.loads(sys.argv[2])
+    client = json.load(sys.stdin)
+    if not hasattr(socket, "recv_fds"):
+        with open(path + UNSUPPORTED_SUFFIX, "w"):
+            pass
+        return
+    changes = _environment_changes(client["env"])
+
+    _warm_up(client["test_files"])
+    snapshot = _snapshot(watched)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    server.bind(path)
+    inode = os.stat(path).st_ino
+    server.listen()
+    server.settimeout(IDLE_TIMEOUT)
+    # finished runs are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                break
+            conn.settimeout(None)
+
+            if _is_stale(snapshot):
+                _send(conn, {"stale": True})
+                conn.close()
+                break
+
+            if os.fork() == 0:
+                server.close()
+                _handle(conn, changes)
+            conn.close()
+    finally:
+        server.close()
+        # a newer server may have replaced the socket already
+        if _mtime(path) is not None and os.stat(path).st_ino == inode:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
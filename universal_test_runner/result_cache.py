@@ -0,0 +1,131 @@
+"""
+Skips re-running a test command if nothing relevant has changed since it last passed.
+
+A result is keyed on the matched command, its full argv, a few environment variables (and every `UTR_*` setting that can change what runs), where in the repo it ran, and a fingerprint of every file tracked by git.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from universal_test_runner.cache import DirectoryStore, cache_dir, digest
+from universal_test_runner.commands import Command
+from universal_test_runner.git import dirty_files, index_entries, repo_root
+from universal_test_runner.settings import env_size, env_str
+
+# variables that commonly change what (or how) tests run. Add more with `UTR_RESULT_CACHE_ENV`
+DEFAULT_ENV_VARS = (
+    "PATH",
+    "VIRTUAL_ENV",
+    "PYTHONPATH",
+    "NODE_ENV",
+    "NODE_OPTIONS",
+    "GOFLAGS",
+    "GOOS",
+    "GOARCH",
+    "RUSTFLAGS",
+    "CARGO_BUILD_TARGET",
+    "MIX_ENV",
+)
+# the only `UTR_*` settings that can't change which tests run or whether they pass. Every other one is part of the key
+OUTCOME_NEUTRAL_VARS = {
+    "UTR_CACHE_DIR",
+    "UTR_CLEAR_PRE_RUN",
+    "UTR_DISABLE_ECHO",
+    "UTR_RESULT_CACHE",
+    "UTR_RESULT_CACHE_DIR",
+    "UTR_RESULT_CACHE_ENV",
+    "UTR_RESULT_CACHE_SIZE",
+}
+DEFAULT_MAX_SIZE = 64 * 1024**2
+
+
+def result_store() -> DirectoryStore:
+    """
+    `UTR_RESULT_CACHE_DIR` can point at a shared (e.g. network-mounted) directory so CI nodes share results
+    """
+    return DirectoryStore(
+        Path(env_str("UTR_RESULT_CACHE_DIR") or cache_dir() / "results"),
+        max_bytes=env_size("UTR_RESULT_CACHE_SIZE", DEFAULT_MAX_SIZE),
+    )
+
+
+def tree_fingerprint(cwd: str) -> Optional[str]:
+    """
+    a hash of the contents of every tracked (and untracked, but not ignored) file in the repo, and of where in it `cwd` is (so each package in a monorepo gets its own results).
+
+    Clean files are identified by the blob hashes git already has in its index, so only dirty files are read and hashed. Returns `None` outside of a git repo.
+    """
+    if not (root := repo_root(cwd)):
+        return None
+    if (index := index_entries(root)) is None or (dirty := dirty_files(root)) is None:
+        return None
+
+    dirty_hashes = {}
+    for path in dirty:
+        try:
+            dirty_hashes[path] = hashlib.sha256(
+                Path(root, path).read_bytes()
+            ).hexdigest()
+        except OSError:
+            # deleted (or a directory, like a submodule)
+            dirty_hashes[path] = None
+
+    return digest(
+        Path(os.path.relpath(cwd, root)).as_posix(),
+        hashlib.sha256(index.encode()).hexdigest(),
+        dirty_hashes,
+    )
+
+
+def result_key(command: Command, argv: list[str], fingerprint: str) -> str:
+    extra = (env_str("UTR_RESULT_CACHE_ENV") or "").split(",")
+    settings = {
+        name
+        for name in os.environ
+        if name.startswith("UTR_") and name not in OUTCOME_NEUTRAL_VARS
+    }
+    env_vars = sorted(
+        {*DEFAULT_ENV_VARS, *settings, *(e.strip() for e in extra if e.strip())}
+    )
+    return digest(
+        command.name,
+        argv,
+        {name: os.environ.get(name) for name in env_vars},
+        fingerprint,
+    )
+
+
+def lookup_result(store: DirectoryStore, key: str) -> Optional[dict]:
+    if (data := store.get(key)) is None:
+        return None
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+def save_result(
+    store: DirectoryStore, key: str, argv: list[str], returncode: int, duration: float
+):
+    store.put(
+        key,
+        json.dumps(
+            {
+                "command": argv,
+                "returncode": returncode,
+                "duration": duration,
+                "finished_at": time.time(),
+            }
+        ).encode(),
+    )
+
+
+def describe_result(result: dict) -> str:
+    finished = time.strftime(
+        "%Y-%m-%d %H:%M:%S", time.localtime(result.get("finished_at", 0))
+    )
+    return f"nothing changed since `{' '.join(result.get('command', []))}` passed at {finished} (took {result.get('duration', 0):.2f}s), skipping"
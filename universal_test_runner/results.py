@@ -0,0 +1,599 @@
+"""
+Turns each runner's machine-readable output into a single stream of per-test events, written as newline-delimited JSON.
+
+Every event has an `event` (`"start"` or `"end"`), a `test`, and a `suite` (the file, package, or module the test is in, if known). `"end"` events also have an `outcome` (`"passed"`, `"failed"`, `"skipped"`, or `"error"`) and a `duration` in seconds (or `null`). Runners that report where a test lives add `file` and `line` too, and subtests (in go) name their `parent`.
+
+Results are read either from the runner's stdout as it's written (go, cargo) or from a report file once the run is over (everything else). Either way, they're parsed one test at a time, so memory use doesn't grow with the size of the suite.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional, TextIO
+from xml.etree import ElementTree
+
+from universal_test_runner.capture import run_captured
+from universal_test_runner.commands import (
+    PYTEST_COMMANDS,
+    Command,
+    bun,
+    elixir,
+    go_multi,
+    go_single,
+    npm,
+    pnpm,
+    rust,
+    with_script_args,
+    yarn,
+)
+from universal_test_runner.context import Context
+from universal_test_runner.cpus import has_flag, uses_jest, uses_vitest
+from universal_test_runner.jobserver import child_fds
+from universal_test_runner.watchdog import (
+    TIMED_OUT,
+    Watchdog,
+    guarding,
+    print_report,
+    watchdog_from_env,
+)
+
+Event = dict[str, Any]
+
+
+@dataclass(frozen=True)
+class Plan:
+    """
+    how to run a test command so that it reports results
+    """
+
+    argv: list[str]
+    env: dict[str, str] = field(default_factory=dict)
+    parse_stdout: Optional[Callable[[Iterable[str], TextIO], Iterator[Event]]] = None
+    """
+    reads the runner's stdout line by line, echoing anything meant for people to the given stream
+    """
+    report: Optional[Path] = None
+    """
+    a file the runner writes results to, read once it exits
+    """
+    parse_report: Optional[Callable[[Path], Iterator[Event]]] = None
+
+
+def _end(
+    suite: Optional[str], test: str, outcome: str, duration: Optional[float]
+) -> Event:
+    return {
+        "event": "end",
+        "suite": suite,
+        "test": test,
+        "outcome": outcome,
+        "duration": duration,
+    }
+
+
+# junit xml (pytest, vitest, bun)
+
+JUNIT_OUTCOMES = {"failure": "failed", "error": "error", "skipped": "skipped"}
+
+
+def junit_events(
+    path: Path, describe: Callable[[dict[str, str]], Event]
+) -> Iterator[Event]:
+    """
+    an `"end"` event per `<testcase>`, where `describe` gives the test's `suite` and `test` (and any location) based on its attributes. Each test is dropped from the tree once it's been read
+    """
+    parents: list[ElementTree.Element] = []
+    try:
+        for kind, elem in ElementTree.iterparse(path, events=("start", "end")):
+            if kind == "start":
+                parents.append(elem)
+                continue
+            parents.pop()
+            if elem.tag != "testcase":
+                continue
+
+            outcome = next(
+                (JUNIT_OUTCOMES[c.tag] for c in elem if c.tag in JUNIT_OUTCOMES),
+                "passed",
+            )
+            try:
+                duration = float(elem.get("time", ""))
+            except ValueError:
+                duration = None
+            yield {
+                "event": "end",
+                **describe(dict(elem.attrib)),
+                "outcome": outcome,
+                "duration": duration,
+            }
+            if parents:
+                parents[-1].remove(elem)
+    except (OSError, ElementTree.ParseError):
+        # the runner crashed before writing (all of) its report
+        return
+
+
+def _describe_pytest(attrib: dict[str, str]) -> Event:
+    # with `junit_family=xunit1` (which `t` asks for, unless the report is someone else's), pytest includes the file, so the node ID can be rebuilt: `classname` is the file as a dotted module, followed by any classes
+    classname, name, file = (
+        attrib.get("classname", ""),
+        attrib.get("name", ""),
+        attrib.get("file"),
+    )
+    if not file:
+        return {"suite": classname or None, "test": name}
+
+    module = file.removesuffix(".py").replace("/", ".")
+    classes = (
+        classname[len(module) + 1 :].split(".")
+        if classname.startswith(f"{module}.")
+        else []
+    )
+    event: Event = {"suite": file, "test": "::".join([file, *classes, name])}
+    if (line := attrib.get("line", "")).isdigit():
+        # pytest's lines are 0-indexed
+        event.update(file=file, line=int(line) + 1)
+    return event
+
+
+def _describe_junit(attrib: dict[str, str]) -> Event:
+    return {
+        "suite": attrib.get("classname") or None,
+        "test": attrib.get("name", ""),
+    }
+
+
+def _option_value(args: list[str], *flags: str) -> Optional[str]:
+    """
+    the value of the last `--flag value` or `--flag=value` in `args`
+    """
+    value = None
+    for i, arg in enumerate(args):
+        for flag in flags:
+            if arg == flag and i + 1 < len(args):
+                value = args[i + 1]
+            elif arg.startswith(f"{flag}="):
+                value = arg[len(flag) + 1 :]
+    return value
+
+
+def _plan_pytest(
+    command: Command, context: Context, argv: list[str], scratch: Path
+) -> Optional[Plan]:
+    # pytest only writes one junit report, so if one was asked for, read that instead (in whichever format it was asked for)
+    if existing := _option_value(argv, "--junitxml", "--junit-xml"):
+        report = Path(context.cwd, existing)
+        extra = []
+    else:
+        report = scratch / "junit.xml"
+        # the older format includes each test's file, so the report is only ours to choose it for
+        extra = [f"--junitxml={report}", "-o", "junit_family=xunit1"]
+    return Plan(
+        [*argv, *extra],
+        report=report,
+        parse_report=lambda path: junit_events(path, _describe_pytest),
+    )
+
+
+# go
+
+GO_OUTCOMES = {"pass": "passed", "fail": "failed", "skip": "skipped"}
+
+
+def go_events(lines: Iterable[str], out: TextIO) -> Iterator[Event]:
+    """
+    events from `go test -json`, echoing the test output it wraps
+    """
+    for line in lines:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict):
+            out.write(line)
+            continue
+
+        action, test = event.get("Action"), event.get("Test")
+        if isinstance(output := event.get("Output"), str):
+            out.write(output)
+        if not test:
+            continue
+
+        result: Optional[Event] = None
+        if action == "run":
+            result = {"event": "start", "suite": event.get("Package"), "test": test}
+        elif action in GO_OUTCOMES:
+            result = _end(
+                event.get("Package"), test, GO_OUTCOMES[action], event.get("Elapsed")
+            )
+        if result:
+            if "/" in test:
+                result["parent"] = test.rsplit("/", 1)[0]
+            yield result
+
+
+def _plan_go(
+    command: Command, context: Context, argv: list[str], scratch: Path
+) -> Optional[Plan]:
+    if argv[:2] != ["go", "test"]:
+        return None
+    flag = [] if has_flag(tuple(argv), "-json", attached=False) else ["-json"]
+    return Plan([*argv[:2], *flag, *argv[2:]], parse_stdout=go_events)
+
+
+# rust
+
+LIBTEST_OUTCOMES = {"ok": "passed", "failed": "failed", "ignored": "skipped"}
+
+
+def libtest_events(lines: Iterable[str], out: TextIO) -> Iterator[Event]:
+    """
+    events from libtest's (unstable) `--format json`, echoing roughly what its default output would have been
+    """
+    for line in lines:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict):
+            out.write(line)
+            continue
+
+        kind, status = event.get("type"), event.get("event")
+        if kind == "suite" and status == "started":
+            out.write(f"\nrunning {event.get('test_count', 0)} tests\n")
+        elif kind == "suite" and status in ("ok", "failed"):
+            out.write(
+                f"\ntest result: {status}. {event.get('passed', 0)} passed; {event.get('failed', 0)} failed; {event.get('ignored', 0)} ignored\n\n"
+            )
+        elif kind == "test" and (name := event.get("name")):
+            if status == "started":
+                yield {"event": "start", "suite": None, "test": name}
+            elif status in LIBTEST_OUTCOMES:
+                out.write(
+                    f"test {name} ... {'FAILED' if status == 'failed' else status}\n"
+                )
+                if status == "failed" and (stdout := event.get("stdout")):
+                    out.write(stdout)
+                yield _end(None, name, LIBTEST_OUTCOMES[status], event.get("exec_time"))
+
+
+LIBTEST_LINE = re.compile(r"^test (.+?) \.\.\. (ok|FAILED|ignored)\b")
+
+
+def libtest_pretty_events(lines: Iterable[str], out: TextIO) -> Iterator[Event]:
+    """
+    `"end"` events from libtest's usual output, which is passed through untouched. It doesn't include durations
+    """
+    for line in lines:
+        out.write(line)
+        if match := LIBTEST_LINE.match(line):
+            name, status = match.groups()
+            yield _end(None, name, LIBTEST_OUTCOMES[status.lower()], None)
+
+
+def _is_nightly(context: Context) -> bool:
+    # run in the project, since a `rust-toolchain.toml` can pick the toolchain
+    try:
+        version = subprocess.run(
+            ["rustc", "-V"], cwd=context.cwd, capture_output=True, text=True
+        ).stdout
+    except OSError:
+        return False
+    return "-nightly" in version or "-dev" in version
+
+
+def _plan_cargo(
+    command: Command, context: Context, argv: list[str], scratch: Path
+) -> Optional[Plan]:
+    if argv[:2] != ["cargo", "test"]:
+        return None
+    # JSON output is still unstable in libtest, so it needs a nightly toolchain
+    if not _is_nightly(context):
+        return Plan(argv, parse_stdout=libtest_pretty_events)
+    separator = [] if "--" in argv else ["--"]
+    return Plan(
+        [
+            *argv,
+            *separator,
+            "-Z",
+            "unstable-options",
+            "--format",
+            "json",
+            "--report-time",
+        ],
+        parse_stdout=libtest_events,
+    )
+
+
+# javascript
+
+# a jest reporter that writes events in the same format as this module. `onTestCaseStart` needs jest 29.6+
+JEST_REPORTER = """\
+const fs = require("fs");
+const path = require("path");
+
+const OUTCOMES = { passed: "passed", failed: "failed" };
+
+class UniversalTestRunnerReporter {
+  constructor(globalConfig) {
+    this.rootDir = globalConfig.rootDir;
+    this.fd = fs.openSync(process.env.UTR_JEST_RESULTS, "a");
+  }
+
+  write(event) {
+    fs.writeSync(this.fd, JSON.stringify(event) + "\\n");
+  }
+
+  onTestCaseStart(test, info) {
+    const suite = path.relative(this.rootDir, test.path);
+    this.write({ event: "start", suite, test: info.fullName });
+  }
+
+  onTestCaseResult(test, result) {
+    const suite = path.relative(this.rootDir, test.path);
+    const duration = result.duration == null ? null : result.duration / 1000;
+    const outcome = OUTCOMES[result.status] || "skipped";
+    this.write({ event: "end", suite, test: result.fullName, outcome, duration });
+  }
+
+  onRunComplete() {
+    fs.closeSync(this.fd);
+  }
+}
+
+module.exports = UniversalTestRunnerReporter;
+"""
+
+
+def ndjson_events(path: Path) -> Iterator[Event]:
+    """
+    events from a file that's already in this module's format, one per line
+    """
+    try:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(event, dict):
+                    yield event
+    except OSError:
+        return
+
+
+def _plan_js(
+    command: Command, context: Context, argv: list[str], scratch: Path
+) -> Optional[Plan]:
+    report = scratch / "results"
+
+    if uses_jest(context):
+        reporter = scratch / "reporter.cjs"
+        reporter.write_text(JEST_REPORTER)
+        return Plan(
+            with_script_args(
+                command, argv, "--reporters=default", f"--reporters={reporter}"
+            ),
+            env={"UTR_JEST_RESULTS": str(report)},
+            report=report,
+            parse_report=ndjson_events,
+        )
+    if uses_vitest(context):
+        return Plan(
+            with_script_args(
+                command,
+                argv,
+                "--reporter=default",
+                "--reporter=junit",
+                f"--outputFile.junit={report}",
+            ),
+            report=report,
+            parse_report=lambda path: junit_events(path, _describe_junit),
+        )
+    return None
+
+
+def _plan_bun(
+    command: Command, context: Context, argv: list[str], scratch: Path
+) -> Optional[Plan]:
+    report = scratch / "junit.xml"
+    return Plan(
+        [*argv, "--reporter=junit", f"--reporter-outfile={report}"],
+        report=report,
+        parse_report=lambda path: junit_events(path, _describe_junit),
+    )
+
+
+# elixir
+
+# an ExUnit formatter that writes a tab-separated line per event. Elixir only got a JSON encoder in 1.18, so text fields are hex-encoded instead
+EXUNIT_FORMATTER = """\
+defmodule UniversalTestRunner.Formatter do
+  @moduledoc false
+  use GenServer
+
+  @impl true
+  def init(_opts) do
+    {:ok, File.open!(System.fetch_env!("UTR_EXUNIT_RESULTS"), [:write])}
+  end
+
+  @impl true
+  def handle_cast({:test_started, %ExUnit.Test{} = test}, file) do
+    write(file, "start", test, "", "")
+    {:noreply, file}
+  end
+
+  def handle_cast({:test_finished, %ExUnit.Test{} = test}, file) do
+    write(file, "end", test, outcome(test.state), Integer.to_string(test.time))
+    {:noreply, file}
+  end
+
+  def handle_cast({:suite_finished, _times}, file) do
+    File.close(file)
+    {:noreply, file}
+  end
+
+  def handle_cast(_event, file), do: {:noreply, file}
+
+  defp outcome(nil), do: "passed"
+  defp outcome({:failed, _}), do: "failed"
+  defp outcome({:invalid, _}), do: "error"
+  defp outcome(_), do: "skipped"
+
+  defp write(file, event, test, outcome, time) do
+    fields = [
+      event,
+      hex(inspect(test.module)),
+      hex(to_string(test.name)),
+      hex(to_string(test.tags[:file])),
+      to_string(test.tags[:line]),
+      outcome,
+      time
+    ]
+
+    IO.binwrite(file, Enum.join(fields, "\\t") <> "\\n")
+  end
+
+  defp hex(text), do: Base.encode16(text)
+end
+"""
+
+
+def exunit_events(path: Path, cwd: str) -> Iterator[Event]:
+    """
+    events from the lines written by `EXUNIT_FORMATTER`
+    """
+    try:
+        with open(path, encoding="ascii", errors="replace") as f:
+            for line in f:
+                try:
+                    kind, module, name, file, lineno, outcome, time = line.rstrip(
+                        "\n"
+                    ).split("\t")
+                    module, name, file = (
+                        bytes.fromhex(field).decode(errors="replace")
+                        for field in (module, name, file)
+                    )
+                except ValueError:
+                    continue
+
+                event: Event = (
+                    _end(
+                        module,
+                        name,
+                        outcome,
+                        int(time) / 1_000_000 if time.isdigit() else None,
+                    )
+                    if kind == "end"
+                    else {"event": "start", "suite": module, "test": name}
+                )
+                if file:
+                    event["file"] = os.path.relpath(file, cwd)
+                if lineno.isdigit():
+                    event["line"] = int(lineno)
+                yield event
+    except OSError:
+        return
+
+
+def _plan_exunit(
+    command: Command, context: Context, argv: list[str], scratch: Path
+) -> Optional[Plan]:
+    if argv[:2] != ["mix", "test"]:
+        return None
+    formatter = scratch / "formatter.exs"
+    formatter.write_text(EXUNIT_FORMATTER)
+    report = scratch / "results"
+    # loading the formatter before mix starts makes it available to ExUnit. Passing any `--formatter` replaces the default, so it's added back
+    return Plan(
+        [
+            "elixir",
+            "-r",
+            str(formatter),
+            "-S",
+            *argv,
+            "--formatter",
+            "ExUnit.CLIFormatter",
+            "--formatter",
+            "UniversalTestRunner.Formatter",
+        ],
+        env={"UTR_EXUNIT_RESULTS": str(report)},
+        report=report,
+        parse_report=lambda path: exunit_events(path, context.cwd),
+    )
+
+
+Planner = Callable[[Command, Context, list[str], Path], Optional[Plan]]
+
+PLANNERS: dict[Command, Planner] = {
+    **{c: _plan_pytest for c in PYTEST_COMMANDS},
+    go_multi: _plan_go,
+    go_single: _plan_go,
+    rust: _plan_cargo,
+    npm: _plan_js,
+    yarn: _plan_js,
+    pnpm: _plan_js,
+    bun: _plan_bun,
+    elixir: _plan_exunit,
+}
+
+
+def results_plan(
+    command: Command, context: Context, argv: list[str], scratch: Path
+) -> Optional[Plan]:
+    """
+    how to run `argv` so that it reports results, with any files it needs kept in `scratch`. `None` if the runner can't (or won't, in this project) report them
+    """
+    if not (planner := PLANNERS.get(command)):
+        return None
+    return planner(command, context, argv, scratch)
+
+
+def _watched(lines: Iterable[str], watchdog: Watchdog) -> Iterator[str]:
+    for line in lines:
+        watchdog.output(time.monotonic())
+        yield line
+
+
+def run_plan(plan: Plan, on_event: Callable[[Event], None]) -> int:
+    """
+    run the plan, calling `on_event` with each test's events, and stopping it if it hits the `UTR_TIMEOUT` or `UTR_IDLE_TIMEOUT` limit. Raises `FileNotFoundError` if the runner isn't installed
+    """
+    env = {**os.environ, **plan.env}
+    watchdog = watchdog_from_env()
+    if watchdog and not plan.parse_stdout:
+        # its output goes straight to the terminal, so it's watched through a pty, like a single command's is
+        returncode = run_captured(plan.argv, 0, None, watchdog, env=env)
+    else:
+        with subprocess.Popen(
+            plan.argv,
+            env=env,
+            stdout=subprocess.PIPE if plan.parse_stdout else None,
+            text=True,
+            errors="replace",
+            pass_fds=child_fds(),
+            start_new_session=bool(watchdog),
+        ) as proc:
+            with guarding(watchdog, proc.pid) if watchdog else nullcontext():
+                if plan.parse_stdout and proc.stdout:
+                    lines = _watched(proc.stdout, watchdog) if watchdog else proc.stdout
+                    for event in plan.parse_stdout(lines, sys.stdout):
+                        on_event(event)
+                    sys.stdout.flush()
+                proc.wait()
+        returncode = proc.returncode
+        if watchdog and watchdog.reason:
+            print_report(watchdog)
+            returncode = TIMED_OUT
+
+    if plan.report and plan.parse_report:
+        for event in plan.parse_report(plan.report):
+            on_event(event)
+    return returncode
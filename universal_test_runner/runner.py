@@ -1,11 +1,94 @@
-import os
+import json
 import subprocess
 import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable, Optional
 
 from colorama import Style, just_fix_windows_console
 
-from universal_test_runner.commands import find_test_command
+from universal_test_runner.affected import affected_test_command
+from universal_test_runner.capture import DEFAULT_LINES, run_captured
+from universal_test_runner.capture import is_supported as capture_supported
+from universal_test_runner.commands import (
+    COMMANDS_BY_NAME,
+    JS_COMMANDS,
+    PYTEST_COMMANDS,
+    Command,
+    clojure,
+    find_all_commands,
+    find_command,
+    py,
+)
 from universal_test_runner.context import Context
+from universal_test_runner.cpus import effective_cpus, parallelism_args
+from universal_test_runner.dependency_cache import dependency_cache
+from universal_test_runner.dependency_cache import is_supported as ci_cache_supported
+from universal_test_runner.distributed import CoordinatorClient, parse_address
+from universal_test_runner.env_sync import SYNC_SPECS, synced_environment
+from universal_test_runner.failures import (
+    FAILURE_FILTERS,
+    FailureTracker,
+    failure_runs,
+    load_failures,
+    record_failures,
+)
+from universal_test_runner.jobserver import child_fds, find_jobserver, start_jobserver
+from universal_test_runner.limits import (
+    Limits,
+    limits_from_env,
+    preexec,
+    reap,
+    report_limits,
+)
+from universal_test_runner.matrix import MATRIX_KINDS, matrix_jobs, parse_versions
+from universal_test_runner.parallel import (
+    Job,
+    aggregate_returncode,
+    print_summary,
+    run_jobs,
+)
+from universal_test_runner.pytest_server import run_in_server, start_server
+from universal_test_runner.result_cache import (
+    describe_result,
+    lookup_result,
+    result_key,
+    result_store,
+    save_result,
+    tree_fingerprint,
+)
+from universal_test_runner.results import Event, results_plan, run_plan
+from universal_test_runner.settings import env_flag, env_int, env_str
+from universal_test_runner.sharding import parse_shard, shard_units
+from universal_test_runner.slowest import SlowestTests, print_slowest, record_run
+from universal_test_runner.timings import (
+    load_durations,
+    read_timings_file,
+    record_durations,
+)
+from universal_test_runner.tmpfs import ram_scratch, with_basetemp
+from universal_test_runner.units import UNIT_KINDS, unit_jobs, units_returncode
+from universal_test_runner.watch import watch
+from universal_test_runner.watchdog import Watchdog, watchdog_from_env
+from universal_test_runner.workspaces import workspace_jobs
+
+# these run everything in a single process, so they benefit from being split up
+SPLITTABLE_COMMANDS = {*PYTEST_COMMANDS, py, clojure}
+
+
+def _clear_terminal():
+    if env_flag("UTR_CLEAR_PRE_RUN"):
+        # https://github.com/kovidgoyal/kitty/issues/268#issuecomment-419342337
+        # https://apple.stackexchange.com/questions/31872/how-do-i-reset-the-scrollback-in-the-terminal-via-a-shell-command/318217#318217
+        print("\033[2J\033[3J\033[1;1H", end="", flush=True)
+
+
+def _echo(command: list[str], note: str = ""):
+    just_fix_windows_console()
+    print(Style.DIM + "-> " + " ".join(command) + note + Style.RESET_ALL, flush=True)
 
 
 def run_test_command(command: list[str]) -> int:
@@ -13,31 +96,443 @@ def run_test_command(command: list[str]) -> int:
         print("no testing method found!")
         return 1
 
-    if os.environ.get("UTR_CLEAR_PRE_RUN", "0") != "0":
-        # https://github.com/kovidgoyal/kitty/issues/268#issuecomment-419342337
-        # https://apple.stackexchange.com/questions/31872/how-do-i-reset-the-scrollback-in-the-terminal-via-a-shell-command/318217#318217
-        print("\033[2J\033[3J\033[1;1H", end="", flush=True)
+    if isinstance(limits := limits_from_env(), str):
+        print(limits)
+        return 1
+
+    _clear_terminal()
+
+    if not env_flag("UTR_DISABLE_ECHO"):
+        _echo(command)
+    log = env_str("UTR_LOG")
+    lines = max(env_int("UTR_CAPTURE", DEFAULT_LINES if log else 0), 0)
+    timeout = max(env_int("UTR_TIMEOUT", 0), 0)
+    idle_timeout = max(env_int("UTR_IDLE_TIMEOUT", 0), 0)
+    captured = bool(lines or timeout or idle_timeout)
+    if captured and not capture_supported():
+        print(
+            "capturing output and timeouts aren't supported on this platform, running without them"
+        )
+        captured = False
 
-    if os.environ.get("UTR_DISABLE_ECHO", "0") == "0":
-        just_fix_windows_console()
-        print(Style.DIM + "-> " + " ".join(command) + Style.RESET_ALL)
     try:
-        return subprocess.run(command).returncode
+        if captured:
+            watchdog = (
+                Watchdog(timeout, idle_timeout) if timeout or idle_timeout else None
+            )
+            returncode = run_captured(command, lines, log, watchdog, limits)
+        elif limits.max_rss:
+            returncode = _run_measured(command, limits)
+        else:
+            # hand any jobserver down, so `make` (and nested `t` runs) share its job slots
+            returncode = subprocess.run(
+                command, pass_fds=child_fds(), preexec_fn=preexec(limits)
+            ).returncode
     except FileNotFoundError:
         # e.g. if `pytest` is run, but not installed
         # we capture the error so there's not a Python traceback shown
         print(f"command not found: {command[0]}")
         return 1
+    except subprocess.SubprocessError as e:
+        # only raised when the limits couldn't be applied
+        print(f"couldn't apply the resource limits: {e}")
+        return 1
+
+    return returncode
+
+
+def _run_measured(command: list[str], limits: Limits) -> int:
+    """
+    like `subprocess.run`, but explaining a failure that was probably caused by `limits`
+    """
+    with subprocess.Popen(
+        command, pass_fds=child_fds(), preexec_fn=preexec(limits)
+    ) as proc:
+        try:
+            peak = reap(proc)
+        except BaseException:
+            proc.kill()
+            raise
+    report_limits(limits, proc.returncode, peak)
+    return proc.returncode
+
+
+def run_test_commands(jobs: list[Job], limit: Optional[int] = None) -> int:
+    """
+    like `run_test_command`, but runs several commands concurrently and combines their exit codes
+    """
+    if not jobs:
+        print("no testing method found!")
+        return 1
+
+    _clear_terminal()
+
+    echo = not env_flag("UTR_DISABLE_ECHO")
+    if echo:
+        just_fix_windows_console()
+
+    results = run_jobs(jobs, echo=echo, limit=limit)
+    if len(results) > 1:
+        print_summary(results)
+    return aggregate_returncode(results)
+
+
+def run_matched_command(command: Optional[Command], context: Context) -> int:
+    """
+    decide how to run the matched command, based on any `UTR_*` options
+    """
+    if not command:
+        return run_test_command([])
+
+    if (
+        command in JS_COMMANDS
+        and env_flag("UTR_WORKSPACES")
+        and (jobs := workspace_jobs(context, command.test_command[0]))
+    ):
+        return run_test_commands(jobs, limit=env_int("UTR_JOBS", effective_cpus()))
+
+    if versions := env_str("UTR_MATRIX"):
+        return run_matrix(command, context, versions)
+
+    processes = env_int("UTR_PARALLEL", 0) if command in SPLITTABLE_COMMANDS else 0
+    if env_flag("UTR_AUTO_PARALLEL") and processes <= 1:
+        cpus = effective_cpus()
+        context.debug(f"telling {command.name} to use {cpus} CPU(s)")
+        context = replace(context, args=tuple(parallelism_args(command, context, cpus)))
+
+    argv = [*command.test_command, *context.args]
+
+    if shard := env_str("UTR_SHARD"):
+        if not (parsed := parse_shard(shard)):
+            print(f"invalid UTR_SHARD value: {shard!r} (expected something like 1/4)")
+            return 1
+        durations = None
+        if timings := env_str("UTR_SHARD_TIMINGS"):
+            if (durations := read_timings_file(timings)) is None:
+                print(
+                    f"can't read shard timings from {timings} (expected a JSON object of units to seconds)"
+                )
+                return 1
+        if (units := shard_units(command, context, *parsed, durations)) is None:
+            print(f"sharding isn't supported for {command.name}")
+            return 1
+        if not units:
+            print(f"shard {shard} has no tests to run")
+            return 0
+        if processes > 1:
+            return run_units(command, context, units, processes)
+        argv = UNIT_KINDS[command].build(command, context, units)
+
+    elif processes > 1 and (units := UNIT_KINDS[command].find(context)):
+        return run_units(command, context, units, processes)
+
+    elif (ref := env_str("UTR_CHANGED_SINCE")) and (
+        affected := affected_test_command(command, context, ref)
+    ) is not None:
+        if not affected:
+            print(f"no tests are affected by changes since {ref}")
+            return 0
+        argv = affected
+
+    destination = env_str("UTR_RESULTS")
+    slowest = env_int("UTR_SLOWEST", 0)
+
+    rerun_failed = env_flag("UTR_RERUN_FAILED")
+    if rerun_failed or env_flag("UTR_FAILED_FIRST"):
+        if command in PYTEST_COMMANDS:
+            # pytest keeps track of failures itself
+            argv = [*argv, "--lf" if rerun_failed else "--ff"]
+        elif command in FAILURE_FILTERS:
+            if failures := load_failures(command, context):
+                runs = failure_runs(command, context, failures, argv, rerun_failed)
+            else:
+                print(
+                    Style.DIM
+                    + f"-> no failed tests have been recorded for {command.name} yet, running everything"
+                    + Style.RESET_ALL
+                )
+                runs = [argv]
+            return run_with_results(command, context, runs, destination, slowest)
+        else:
+            print(
+                f"failed tests can't be picked out for {command.name}, running everything"
+            )
+
+    if destination or slowest > 0:
+        return run_with_results(command, context, [argv], destination, slowest)
+
+    if env_flag("UTR_RESULT_CACHE"):
+        return run_with_result_cache(command, context, argv)
+
+    return run_argv(command, context, argv)
+
+
+def run_argv(command: Command, context: Context, argv: list[str]) -> int:
+    """
+    run the final argv for `command`, through a warm pytest server if one was asked for (and with pytest's temporary files in RAM, if those were)
+    """
+    argv = with_basetemp(command, argv)
+    if env_flag("UTR_PYTEST_SERVER") and command in PYTEST_COMMANDS:
+        if not watchdog_from_env():
+            return run_with_pytest_server(command, context, argv)
+        # a fork of the server isn't a child of `t`, so it can't be stopped like one
+        print(
+            "UTR_TIMEOUT and UTR_IDLE_TIMEOUT can't be enforced on a warm pytest server, running without it"
+        )
+    return run_test_command(argv)
+
+
+def run_with_pytest_server(command: Command, context: Context, argv: list[str]) -> int:
+    """
+    run pytest in a fork of a server that has everything imported already (see `pytest_server.py`). If none is ready, run normally and start one for next time
+    """
+    _clear_terminal()
+
+    def _on_start():
+        if not env_flag("UTR_DISABLE_ECHO"):
+            _echo(argv, " (warm)")
+
+    args = argv[len(command.test_command) :]
+    if (returncode := run_in_server(command, context, args, _on_start)) is not None:
+        return returncode
+
+    context.debug("no up-to-date pytest server, starting one for next time")
+    start_server(command, context)
+    return run_test_command(argv)
+
+
+def run_matrix(command: Command, context: Context, value: str) -> int:
+    """
+    run the tests with each version in `value` at the same time, streaming their output (see `matrix.py`)
+    """
+    if command not in MATRIX_KINDS:
+        print(f"UTR_MATRIX isn't supported for {command.name}")
+        return 1
+    if not (versions := parse_versions(value)):
+        print(f"invalid UTR_MATRIX value: {value!r} (expected something like 3.9,3.10)")
+        return 1
+
+    _clear_terminal()
+    echo = not env_flag("UTR_DISABLE_ECHO")
+    if echo:
+        just_fix_windows_console()
+
+    results = run_jobs(
+        matrix_jobs(command, context, versions),
+        echo=echo,
+        limit=env_int("UTR_JOBS", 0) or None,
+        stream=True,
+    )
+    print_summary(results)
+    return aggregate_returncode(results)
+
+
+def run_units(
+    command: Command, context: Context, units: list[str], processes: int
+) -> int:
+    """
+    run each unit in its own process, at most `processes` at a time, and remember how long each one took
+    """
+    jobs = unit_jobs(command, context, units, load_durations(command, context))
+    context.debug(f"running {len(jobs)} units across {processes} processes")
+
+    _clear_terminal()
+    echo = not env_flag("UTR_DISABLE_ECHO")
+    if echo:
+        just_fix_windows_console()
+
+    results = run_jobs(jobs, echo=echo, limit=processes)
+    print_summary(results)
+    record_durations(
+        command, context, {r.job.label: round(r.duration, 3) for r in results}
+    )
+    return units_returncode(command, results)
+
+
+def run_with_results(
+    command: Command,
+    context: Context,
+    argvs: list[list[str]],
+    destination: Optional[str],
+    slowest: int,
+) -> int:
+    """
+    run each argv in turn with the runner's machine-readable output turned on (see `results.py`), and remember which tests failed. Each test's events are written to `destination` (if given), and the `slowest` tests are printed afterwards (if positive). Every argv runs, and the first failing exit code is returned
+    """
+    with tempfile.TemporaryDirectory(prefix="utr-results-") as scratch:
+        plans = []
+        for i, argv in enumerate(argvs):
+            (plan_dir := Path(scratch, str(i))).mkdir()
+            argv = with_basetemp(command, argv)
+            if not (plan := results_plan(command, context, argv, plan_dir)):
+                print(
+                    f"per-test results aren't supported for {command.name}, running without them"
+                )
+                returncode = 0
+                for unplanned in argvs:
+                    # like below, every argv runs even once one fails
+                    argv_returncode = run_argv(command, context, unplanned)
+                    returncode = returncode or argv_returncode
+                return returncode
+            plans.append(plan)
+
+        tracker = FailureTracker(load_failures(command, context))
+        handlers: list[Callable[[Event], object]] = [tracker.add]
+        collector = SlowestTests(slowest) if slowest > 0 else None
+        if collector:
+            handlers.append(collector.add)
+
+        returncode = 0
+        with ExitStack() as stack:
+            if destination:
+                try:
+                    results = stack.enter_context(
+                        open(destination, "w", encoding="utf-8")
+                    )
+                except OSError as e:
+                    print(f"can't write results to {destination}: {e}")
+                    return 1
+                handlers.append(lambda event: results.write(json.dumps(event) + "\n"))
+
+            def _on_event(event: Event):
+                for handle in handlers:
+                    handle(event)
+
+            _clear_terminal()
+            for plan in plans:
+                if not env_flag("UTR_DISABLE_ECHO"):
+                    _echo(plan.argv)
+                try:
+                    # every plan runs, even once one fails, so failed-first still gets to the rest of the suite
+                    plan_returncode = run_plan(plan, _on_event)
+                except FileNotFoundError:
+                    print(f"command not found: {plan.argv[0]}")
+                    return 1
+                returncode = returncode or plan_returncode
+
+    record_failures(command, context, tracker)
+    if collector:
+        print_slowest(collector, slowest)
+        record_run(command, context, collector)
+    return returncode
+
+
+def run_with_result_cache(command: Command, context: Context, argv: list[str]) -> int:
+    """
+    replay the result of the last passing run if nothing has changed since, otherwise run (and remember a pass)
+    """
+    # fingerprint before running, in case the tests themselves write files
+    if (fingerprint := tree_fingerprint(context.cwd)) is None:
+        context.debug("not in a git repo, skipping the result cache")
+        return run_test_command(argv)
+
+    store = result_store()
+    key = result_key(command, argv, fingerprint)
+    if (result := lookup_result(store, key)) is not None:
+        print(Style.DIM + "-> " + describe_result(result) + Style.RESET_ALL)
+        return result.get("returncode", 0)
+
+    start = time.monotonic()
+    returncode = run_argv(command, context, argv)
+    if returncode == 0:
+        save_result(store, key, argv, returncode, time.monotonic() - start)
+    return returncode
+
+
+def run_as_worker(address: str, context: Context) -> int:
+    """
+    run units handed out by a coordinator (see `distributed.py`) until there are none left
+    """
+    if not (parsed := parse_address(address)):
+        print(
+            f"invalid UTR_WORKER value: {address!r} (expected something like localhost:8000)"
+        )
+        return 1
+
+    returncode = 0
+    try:
+        with CoordinatorClient(parsed) as client:
+            result = None
+            while assignment := client.next_unit(result):
+                command, unit = assignment
+                start = time.monotonic()
+                unit_returncode = run_test_command(
+                    UNIT_KINDS[command].build(command, context, [unit])
+                )
+                result = {
+                    "unit": unit,
+                    "returncode": unit_returncode,
+                    "duration": round(time.monotonic() - start, 3),
+                }
+                returncode = returncode or unit_returncode
+    except (OSError, ValueError) as e:
+        print(f"lost the coordinator at {address}: {e}")
+        return 1
+    return returncode
+
+
+def chosen_command(context: Context) -> Optional[Command]:
+    """
+    the command named by `UTR_COMMAND` (which skips detection), otherwise the first match
+    """
+    if name := env_str("UTR_COMMAND"):
+        if command := COMMANDS_BY_NAME.get(name):
+            return command
+        print(f"unknown UTR_COMMAND value: {name!r}, detecting one instead")
+    return find_command(context)
 
 
 # not a click handler, since this is just a passthrough for the underlying test runner
+def dispatch(context: Context) -> int:
+    """
+    run the tests in whichever mode the `UTR_*` options ask for
+    """
+    if worker := env_str("UTR_WORKER"):
+        return run_as_worker(worker, context)
+    if env_flag("UTR_POLYGLOT"):
+        jobs = [
+            Job(c.name, [*c.test_command, *context.args])
+            for c in find_all_commands(context)
+        ]
+        return run_test_commands(jobs)
+
+    command = chosen_command(context)
+    with ExitStack() as stack:
+        if command and env_flag("UTR_CI_CACHE"):
+            if not ci_cache_supported():
+                print(
+                    "the CI cache isn't supported on this platform, running without it"
+                )
+            else:
+                stack.enter_context(dependency_cache(command, context))
+        if command in SYNC_SPECS and env_flag("UTR_SYNC_ONCE"):
+            # inside the CI cache, so the sync fills it
+            if returncode := stack.enter_context(synced_environment(command, context)):
+                return returncode
+        return run_matched_command(command, context)
+
+
 def run():
     """
     the "main" functionality of the `t` command
     """
     context = Context.from_invocation()
-    command = find_test_command(context)
-    sys.exit(run_test_command(command))
+
+    if (slots := env_int("UTR_JOBSERVER", 0)) > 0 and not find_jobserver():
+        start_jobserver(slots)
+
+    if env_flag("UTR_WATCH"):
+        # each run is its own `t`, which sets up its own scratch directory
+        exit_code = watch(context)
+    elif env_flag("UTR_TMPFS"):
+        with ram_scratch() as scratch:
+            exit_code = dispatch(context) if scratch else 1
+            if scratch and scratch.exceeded:
+                exit_code = exit_code or 1
+    else:
+        exit_code = dispatch(context)
+
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
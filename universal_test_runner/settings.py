@@ -0,0 +1,83 @@
+"""
+`t` passes every CLI argument through to the underlying test runner, so its own options are read from `UTR_*` environment variables instead.
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+def env_flag(name: str) -> bool:
+    """
+    a flag is "on" if it's set to anything besides `0`
+    """
+    return os.environ.get(name, "0") != "0"
+
+
+def env_str(name: str) -> Optional[str]:
+    """
+    the stripped value of a variable, or `None` if it's unset or blank
+    """
+    return os.environ.get(name, "").strip() or None
+
+
+@contextmanager
+def patched_environ(variables: dict[str, str]) -> Iterator[None]:
+    """
+    set `variables` for as long as this is open, then put back whatever was there before
+    """
+    previous = {name: os.environ.get(name) for name in variables}
+    try:
+        os.environ.update(variables)
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def env_int(name: str, default: int) -> int:
+    """
+    the value of a variable as an integer, falling back to `default` if it's unset or unparseable
+    """
+    try:
+        return int(os.environ.get(name, ""))
+    except ValueError:
+        return default
+
+
+SIZE_SUFFIXES = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(value: str) -> Optional[int]:
+    """
+    a human-friendly byte count like `4G`, `512M`, or `1024` as an integer
+    """
+    value = value.strip().upper().removesuffix("B").removesuffix("I")
+    unit = value[-1:] if value[-1:] in SIZE_SUFFIXES else ""
+    try:
+        return int(float(value[: len(value) - len(unit)]) * SIZE_SUFFIXES[unit])
+    except ValueError:
+        return None
+
+
+def env_size(name: str, default: int) -> int:
+    """
+    the value of a variable as a byte count (see `parse_size`), falling back to `default` if it's unset or unparseable
+    """
+    if (value := env_str(name)) and (size := parse_size(value)) is not None:
+        return size
+    return default
+
+
+def format_size(size: float) -> str:
+    """
+    a byte count in the same style that `parse_size` reads, like `1.5G`
+    """
+    units = ["", "K", "M", "G", "T"]
+    while size >= 1024 and len(units) > 1:
+        size /= 1024
+        units.pop(0)
+    return f"{size:.1f}".rstrip("0").rstrip(".") + units[0]
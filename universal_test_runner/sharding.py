@@ -0,0 +1,91 @@
+"""
+Deterministically splits a test suite across `N` machines, so each one can run a single slice with `UTR_SHARD=i/N`.
+
+Every machine has to compute the same split, so shards are only balanced by time using durations they all read from the same file (`UTR_SHARD_TIMINGS`). Each machine's own recorded durations depend on its history (and where the project is checked out), so they'd split the suite differently.
+"""
+
+import re
+from typing import Optional
+
+from universal_test_runner.commands import Command
+from universal_test_runner.context import Context
+from universal_test_runner.units import UNIT_KINDS
+
+
+def parse_shard(value: str) -> Optional[tuple[int, int]]:
+    """
+    `"2/4"` -> `(2, 4)`. Shards are 1-indexed, so `i` must be between `1` and `N`
+    """
+    if not (match := re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", value)):
+        return None
+    index, total = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= total:
+        return None
+    return index, total
+
+
+def partition(
+    units: list[str], total: int, durations: Optional[dict[str, float]] = None
+) -> list[list[str]]:
+    """
+    split `units` into `total` groups. Every caller with the same inputs gets the same answer, regardless of input order.
+
+    If any `durations` are known, groups are balanced by time (greedily giving the longest remaining unit to the group with the least work so far), with unknown units assumed to take the average time. Otherwise units are dealt out round-robin.
+    """
+    units = sorted(set(units))
+    shards: list[list[str]] = [[] for _ in range(total)]
+
+    known = [durations[u] for u in units if durations and u in durations]
+    if not known:
+        for i, unit in enumerate(units):
+            shards[i % total].append(unit)
+        return shards
+
+    average = sum(known) / len(known)
+    weights = {u: (durations or {}).get(u, average) for u in units}
+    loads = [0.0] * total
+    for unit in sorted(units, key=lambda u: (-weights[u], u)):
+        # ties go to the lowest-numbered shard, to stay deterministic
+        target = min(range(total), key=lambda i: (loads[i], i))
+        shards[target].append(unit)
+        loads[target] += weights[unit]
+
+    return [sorted(s) for s in shards]
+
+
+def shard_units(
+    command: Command,
+    context: Context,
+    index: int,
+    total: int,
+    durations: Optional[dict[str, float]] = None,
+) -> Optional[list[str]]:
+    """
+    the units (see `units.py`) in shard `index` (of `total`), balanced by `durations` if given. Every shard must be given the same ones.
+
+    `None` means this command can't be sharded, while an empty list means this shard has nothing to run.
+    """
+    if not (kind := UNIT_KINDS.get(command)) or (units := kind.find(context)) is None:
+        return None
+
+    shards = partition(units, total, durations)
+    mine = shards[index - 1]
+    context.debug(
+        f"shard {index}/{total} has {len(mine)} of {len(units)} {kind.name}(s)"
+    )
+    return mine
+
+
+def shard_test_command(
+    command: Command,
+    context: Context,
+    index: int,
+    total: int,
+    durations: Optional[dict[str, float]] = None,
+) -> Optional[list[str]]:
+    """
+    the argv that runs shard `index` (of `total`), with the same `None` and empty-list meanings as `shard_units`
+    """
+    if (units := shard_units(command, context, index, total, durations)) is None:
+        return None
+    return UNIT_KINDS[command].build(command, context, units) if units else []
@@ -0,0 +1,159 @@
+"""
+Finds the slowest tests in a run (from the events described in `results.py`), and keeps a short history of them so that trends show up across runs.
+"""
+
+import heapq
+import statistics
+import time
+from collections import defaultdict
+from typing import Optional
+
+from colorama import Style
+
+from universal_test_runner.cache import read_cache, write_cache
+from universal_test_runner.commands import Command
+from universal_test_runner.context import Context
+from universal_test_runner.results import Event
+
+# how many of the slowest tests (and suites) are remembered from each run, no matter how many are printed
+STORED_TESTS = 50
+# how many runs are remembered
+MAX_RUNS = 20
+# below this many seconds, changes are mostly noise
+NOISE_FLOOR = 0.01
+
+
+class SlowestTests:
+    """
+    Keeps the `limit` slowest tests seen so far, plus the total time spent in each suite. Memory use depends on the number of suites, not tests.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(limit, STORED_TESTS)
+        self.heap: list[tuple[float, int, str]] = []
+        self.seen = 0
+        self.suite_totals: dict[str, float] = defaultdict(float)
+        self.suite_counts: dict[str, int] = defaultdict(int)
+
+    def add(self, event: Event):
+        duration = event.get("duration")
+        if (
+            event.get("event") != "end"
+            or not isinstance(test := event.get("test"), str)
+            or not isinstance(duration, (int, float))
+            or isinstance(duration, bool)
+        ):
+            return
+
+        # the counter breaks ties, so tests themselves are never compared
+        self.seen += 1
+        item = (float(duration), self.seen, test)
+        if len(self.heap) < self.limit:
+            heapq.heappush(self.heap, item)
+        else:
+            heapq.heappushpop(self.heap, item)
+
+        # a subtest's time is already part of its parent's
+        if isinstance(suite := event.get("suite"), str) and not event.get("parent"):
+            self.suite_totals[suite] += duration
+            self.suite_counts[suite] += 1
+
+    def tests(self, n: int) -> list[tuple[str, float]]:
+        return [(test, duration) for duration, _, test in heapq.nlargest(n, self.heap)]
+
+    def suites(self, n: int) -> list[tuple[str, float, int]]:
+        return [
+            (suite, total, self.suite_counts[suite])
+            for suite, total in heapq.nlargest(
+                n, self.suite_totals.items(), key=lambda item: item[1]
+            )
+        ]
+
+
+def print_slowest(slowest: SlowestTests, n: int):
+    if not (tests := slowest.tests(n)):
+        print(Style.DIM + "-> no test durations were reported" + Style.RESET_ALL)
+        return
+
+    print(Style.DIM + f"-> slowest {len(tests)} test(s):" + Style.RESET_ALL)
+    for test, duration in tests:
+        print(f"   {duration:>8.2f}s  {test}")
+
+    if suites := slowest.suites(n):
+        print(Style.DIM + f"-> slowest {len(suites)} suite(s):" + Style.RESET_ALL)
+        for suite, total, count in suites:
+            print(f"   {total:>8.2f}s  {suite} ({count} test(s))")
+
+
+def load_history(command: Command, context: Context) -> list[dict]:
+    """
+    the stored runs for this command, oldest first
+    """
+    runs = read_cache("slowest", context.cwd, command.name)
+    return [r for r in runs if isinstance(r, dict)] if isinstance(runs, list) else []
+
+
+def record_run(command: Command, context: Context, slowest: SlowestTests):
+    if not (tests := slowest.tests(STORED_TESTS)):
+        return
+    run = {
+        "at": int(time.time()),
+        "tests": {test: round(duration, 3) for test, duration in tests},
+        "suites": {
+            suite: round(total, 3) for suite, total, _ in slowest.suites(STORED_TESTS)
+        },
+    }
+    history = [*load_history(command, context), run][-MAX_RUNS:]
+    write_cache("slowest", context.cwd, command.name, history)
+
+
+def _trend(latest: float, earlier: list[float]) -> str:
+    if not earlier:
+        return "new"
+    if max(latest, baseline := statistics.median(earlier)) < NOISE_FLOOR:
+        return "-"
+    if not baseline:
+        return "new"
+    return f"{(latest - baseline) / baseline:+.0%}"
+
+
+def _print_trends(label: str, history: list[dict], field: str, n: int):
+    latest = history[-1].get(field) or {}
+    rows = sorted(latest.items(), key=lambda item: item[1], reverse=True)[:n]
+    if not rows:
+        return
+
+    print(Style.DIM + f"-> {label}:" + Style.RESET_ALL)
+    print(f"   {'latest':>9}  {'median':>9}  {'trend':>6}  name")
+    for name, duration in rows:
+        earlier = [
+            run[field][name]
+            for run in history[:-1]
+            if isinstance(run.get(field), dict) and name in run[field]
+        ]
+        # the baseline the trend is measured against
+        median = f"{statistics.median(earlier):.2f}s" if earlier else "-"
+        print(
+            f"   {duration:>8.2f}s  {median:>9}  {_trend(duration, earlier):>6}  {name}"
+        )
+
+
+def show_trends(command: Optional[Command], context: Context, n: int) -> int:
+    """
+    print the slowest tests and suites from the latest run, compared to the runs before it
+    """
+    if not command or not (history := load_history(command, context)):
+        print(
+            f"no test durations have been recorded for {command.name if command else 'this project'} yet (run `t` with `UTR_SLOWEST` set first)"
+        )
+        return 1
+
+    runs = len(history)
+    print(
+        Style.DIM
+        + f"-> {command.name}, compared to the {runs - 1} run(s) before the latest"
+        + Style.RESET_ALL
+    )
+    _print_trends("slowest tests", history, "tests", n)
+    _print_trends("slowest suites", history, "suites", n)
+    return 0
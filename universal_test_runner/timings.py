@@ -0,0 +1,65 @@
+"""
+Remembers how long each test unit (see `units.py`) took to run, so work can be balanced by time rather than by count.
+"""
+
+import json
+import sys
+from typing import Optional
+
+from universal_test_runner.cache import read_cache, write_cache
+from universal_test_runner.commands import Command
+from universal_test_runner.context import Context
+
+
+def load_durations(command: Command, context: Context) -> dict[str, float]:
+    """
+    the last known duration (in seconds) of each unit for this command
+    """
+    durations = read_cache("durations", context.cwd, command.name)
+    return durations if isinstance(durations, dict) else {}
+
+
+def record_durations(command: Command, context: Context, durations: dict[str, float]):
+    """
+    merge new durations into the stored ones, replacing older measurements of the same unit
+    """
+    if durations:
+        write_cache(
+            "durations",
+            context.cwd,
+            command.name,
+            {**load_durations(command, context), **durations},
+        )
+
+
+def read_timings_file(path: str) -> Optional[dict[str, float]]:
+    """
+    durations from a JSON file (like one written by `universal-test-runner timings`), so that every machine balances by the same numbers. `None` if it can't be read
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            durations = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(durations, dict) or not all(
+        isinstance(d, (int, float)) for d in durations.values()
+    ):
+        return None
+    return {unit: float(d) for unit, d in durations.items()}
+
+
+def export_durations(command: Optional[Command], context: Context) -> int:
+    """
+    print the recorded durations as JSON, to be saved for `UTR_SHARD_TIMINGS`
+    """
+    if not command:
+        print("no testing method found!", file=sys.stderr)
+        return 1
+    if not (durations := load_durations(command, context)):
+        print(
+            f"no durations have been recorded for {command.name} yet (run it with UTR_PARALLEL first)",
+            file=sys.stderr,
+        )
+        return 1
+    print(json.dumps(dict(sorted(durations.items())), indent=2))
+    return 0
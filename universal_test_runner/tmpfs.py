@@ -0,0 +1,224 @@
+"""
+Gives a test run a fresh temporary directory in RAM (`UTR_TMPFS`), for suites that spend much of their time writing fixture files to a slow disk.
+
+Everything that respects `TMPDIR` (and `TMP` / `TEMP`) uses it. A tmpfs can't be mounted without root, so the directory goes on one that already exists (`/dev/shm` by default), and its size is enforced by checking on it from a background thread: if it grows past the limit, the tests are stopped before they fill up the machine's memory. The directory is removed afterwards, even if `t` is interrupted or terminated, and any left behind by a `t` that was killed outright are removed by the next one.
+"""
+
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from colorama import Style
+
+from universal_test_runner.commands import PYTEST_COMMANDS, Command
+from universal_test_runner.cpus import has_flag
+from universal_test_runner.settings import (
+    env_flag,
+    env_size,
+    env_str,
+    format_size,
+    patched_environ,
+)
+
+DEFAULT_ROOT = "/dev/shm"
+# by default, the directory can use this much of the space that's free when the run starts
+DEFAULT_SHARE = 0.5
+PREFIX = "utr-"
+# seconds between checks. Big directories are checked less often, so checking never takes up more than a sliver of the run
+CHECK_INTERVAL = 0.5
+CHECK_OVERHEAD = 0.05
+TEMP_VARIABLES = ("TMPDIR", "TMP", "TEMP")
+
+
+def disk_usage(path: Path) -> int:
+    """
+    the bytes that everything under `path` takes up
+    """
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += disk_usage(Path(entry.path))
+            else:
+                stat = entry.stat(follow_symlinks=False)
+                # files can be sparse, so it's the blocks that count
+                total += getattr(stat, "st_blocks", 0) * 512 or stat.st_size
+        except OSError:
+            # it was deleted while being looked at
+            pass
+    return total
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_abandoned(root: Path):
+    """
+    remove directories left behind by `t` processes that were killed before they could clean up
+    """
+    try:
+        entries = list(root.glob(f"{PREFIX}*"))
+    except OSError:
+        return
+    for entry in entries:
+        pid = entry.name[len(PREFIX) :].split("-")[0]
+        try:
+            if entry.stat().st_uid != os.getuid() or not pid.isdigit():
+                continue
+        except OSError:
+            continue
+        if not _is_running(int(pid)):
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def _child_pids() -> list[int]:
+    """
+    the processes this one started (Linux only)
+    """
+    me = str(os.getpid())
+    pids = []
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        if stat[stat.rindex(")") + 2 :].split()[1] == me:
+            pids.append(int(entry))
+    return pids
+
+
+def stop_children():
+    for pid in _child_pids():
+        try:
+            # children in their own process group (like a run with a timeout) are stopped along with everything they started
+            if os.getpgid(pid) == pid:
+                os.killpg(pid, signal.SIGTERM)
+            else:
+                os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+
+
+class UsageMonitor:
+    """
+    Keeps track of the most space a directory has taken up, and stops the tests if it's ever more than `limit`.
+    """
+
+    def __init__(self, path: Path, limit: int):
+        self.path = path
+        self.limit = limit
+        self.peak = 0
+        self.exceeded = False
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._watch, daemon=True)
+
+    def check(self):
+        self.peak = max(self.peak, usage := disk_usage(self.path))
+        if usage > self.limit and not self.exceeded:
+            self.exceeded = True
+            stop_children()
+
+    def _watch(self):
+        interval = CHECK_INTERVAL
+        while not self.done.wait(interval):
+            started = time.monotonic()
+            self.check()
+            interval = max(
+                CHECK_INTERVAL, (time.monotonic() - started) / CHECK_OVERHEAD
+            )
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+        # catch anything written since the last check
+        self.check()
+
+
+def _raise_exit(signum, _frame):
+    raise SystemExit(128 + signum)
+
+
+@contextmanager
+def ram_scratch() -> Iterator[Optional[UsageMonitor]]:
+    """
+    point the temporary directory variables at a new directory in RAM for as long as this is open, then remove it. Yields `None` (and changes nothing) if there's nowhere to put it
+    """
+    root = Path(env_str("UTR_TMPFS_ROOT") or DEFAULT_ROOT)
+    try:
+        remove_abandoned(root)
+        free = shutil.disk_usage(root).free
+        path = Path(tempfile.mkdtemp(prefix=f"{PREFIX}{os.getpid()}-", dir=root))
+    except OSError as e:
+        print(f"can't create a scratch directory in {root}: {e}")
+        yield None
+        return
+
+    limit = env_size("UTR_TMPFS_SIZE", int(free * DEFAULT_SHARE))
+    monitor = UsageMonitor(path, limit)
+    # `finally` doesn't run when the process is killed by a signal, so those that ask it to stop are turned into exits
+    previous_handlers = {
+        signum: signal.signal(signum, _raise_exit)
+        for signum in (signal.SIGTERM, getattr(signal, "SIGHUP", None))
+        if signum is not None
+    }
+    try:
+        with patched_environ({name: str(path) for name in TEMP_VARIABLES}):
+            tempfile.tempdir = None
+            monitor.start()
+            yield monitor
+    finally:
+        monitor.stop()
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        tempfile.tempdir = None
+        shutil.rmtree(path, ignore_errors=True)
+        print_usage(monitor)
+
+
+def print_usage(monitor: UsageMonitor):
+    if monitor.exceeded:
+        print(
+            f"the tests were stopped because their scratch directory went over its limit of {format_size(monitor.limit)} (set UTR_TMPFS_SIZE to change it)"
+        )
+    else:
+        print(
+            Style.DIM
+            + f"-> the scratch directory used at most {format_size(monitor.peak)} of {format_size(monitor.limit)}"
+            + Style.RESET_ALL
+        )
+
+
+def with_basetemp(command: Command, argv: list[str]) -> list[str]:
+    """
+    `argv` with pytest's temporary files in the scratch directory too (unless they were put somewhere already). Only for a single pytest process, since each one clears out its basetemp when it starts
+    """
+    if (
+        env_flag("UTR_TMPFS")
+        and command in PYTEST_COMMANDS
+        and (tmpdir := os.environ.get("TMPDIR"))
+        and not has_flag(tuple(argv), "--basetemp")
+    ):
+        return [*argv, f"--basetemp={os.path.join(tmpdir, 'pytest')}"]
+    return argv
@@ -0,0 +1,219 @@
+"""
+Splits a test suite into independently runnable "units" (test files, packages, crates, etc), so it can be divided up between processes or machines.
+
+Each supported `Command` has a `UnitKind` that knows how to find its units and how to build an argv that runs just some of them.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from universal_test_runner.affected import (
+    PYTHON_SKIP_DIRS,
+    cargo_crates,
+    go_packages,
+    is_python_test,
+    walk_files,
+)
+from universal_test_runner.commands import (
+    PYTEST_COMMANDS,
+    Command,
+    bun,
+    clojure,
+    django,
+    elixir,
+    go_multi,
+    npm,
+    pnpm,
+    py,
+    rust,
+    with_script_args,
+    yarn,
+)
+from universal_test_runner.context import Context
+from universal_test_runner.parallel import Job, JobResult, aggregate_returncode
+
+
+@dataclass(frozen=True)
+class UnitKind:
+    name: str
+    """
+    a human-readable name for a single unit, like "test file"
+    """
+    find: Callable[[Context], Optional[list[str]]]
+    """
+    every unit in the project, sorted. `None` if they couldn't be determined
+    """
+    build: Callable[[Command, Context, list[str]], list[str]]
+    """
+    the argv that runs only the given units
+    """
+
+
+def _append_units(command: Command, context: Context, units: list[str]) -> list[str]:
+    return [*command.test_command, *context.args, *units]
+
+
+# python
+
+
+def _find_pytest_files(context: Context) -> list[str]:
+    return sorted(
+        Path(p).as_posix()
+        for p in walk_files(context.cwd, (".py",), PYTHON_SKIP_DIRS)
+        if is_python_test(p)
+    )
+
+
+def _find_unittest_files(context: Context) -> list[str]:
+    # unittest's (and django's) default discovery pattern is `test*.py`
+    return sorted(
+        Path(p).as_posix()
+        for p in walk_files(context.cwd, (".py",), PYTHON_SKIP_DIRS)
+        if os.path.basename(p).startswith("test")
+    )
+
+
+def _build_django(command: Command, context: Context, units: list[str]) -> list[str]:
+    # django wants dotted module labels, rather than paths
+    labels = [".".join(Path(u).with_suffix("").parts) for u in units]
+    return [*command.test_command, *context.args, *labels]
+
+
+PYTEST_FILES = UnitKind("test file", _find_pytest_files, _append_units)
+UNITTEST_FILES = UnitKind("test file", _find_unittest_files, _append_units)
+DJANGO_MODULES = UnitKind("test module", _find_unittest_files, _build_django)
+
+
+# go
+
+
+def _find_go_packages(context: Context) -> Optional[list[str]]:
+    if (packages := go_packages(context)) is None:
+        return None
+    return sorted(name for name, p in packages.items() if p["has_tests"])
+
+
+def _build_go(command: Command, context: Context, units: list[str]) -> list[str]:
+    # `go_multi` runs `./...`, which is what's being replaced
+    return ["go", "test", *context.args, *units]
+
+
+GO_PACKAGES = UnitKind("package", _find_go_packages, _build_go)
+
+
+# rust
+
+
+def _find_crates(context: Context) -> Optional[list[str]]:
+    if (crates := cargo_crates(context)) is None:
+        return None
+    return sorted(crates)
+
+
+def _build_cargo(command: Command, context: Context, units: list[str]) -> list[str]:
+    return [
+        *command.test_command,
+        *(arg for crate in units for arg in ("-p", crate)),
+        *context.args,
+    ]
+
+
+CARGO_CRATES = UnitKind("crate", _find_crates, _build_cargo)
+
+
+# js
+
+JS_SPEC_FILE = re.compile(
+    r"(\.(test|spec)\.[cm]?[jt]sx?$)|(^|/)__tests__/.+\.[cm]?[jt]sx?$"
+)
+JS_SKIP_DIRS = {"node_modules", "dist", "build", "coverage"}
+JS_SUFFIXES = (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs", ".mts", ".cts")
+
+
+def _find_spec_files(context: Context) -> list[str]:
+    return sorted(
+        path
+        for p in walk_files(context.cwd, JS_SUFFIXES, JS_SKIP_DIRS)
+        if JS_SPEC_FILE.search(path := Path(p).as_posix())
+    )
+
+
+def _build_js(command: Command, context: Context, units: list[str]) -> list[str]:
+    return with_script_args(command, [*command.test_command, *context.args], *units)
+
+
+JS_SPEC_FILES = UnitKind("spec file", _find_spec_files, _build_js)
+
+
+# elixir
+
+
+def _find_exunit_files(context: Context) -> list[str]:
+    test_dir = os.path.join(context.cwd, "test")
+    return sorted(
+        Path("test", p).as_posix() for p in walk_files(test_dir, ("_test.exs",), set())
+    )
+
+
+EXUNIT_FILES = UnitKind("test file", _find_exunit_files, _append_units)
+
+
+# clojure
+
+
+def _find_clojure_namespaces(context: Context) -> list[str]:
+    # `lein test` takes namespaces, which map to paths with `-` swapped for `_`
+    test_dir = os.path.join(context.cwd, "test")
+    return sorted(
+        ".".join(Path(p).with_suffix("").parts).replace("_", "-")
+        for p in walk_files(test_dir, (".clj", ".cljc"), set())
+    )
+
+
+CLOJURE_NAMESPACES = UnitKind("namespace", _find_clojure_namespaces, _append_units)
+
+
+UNIT_KINDS: dict[Command, UnitKind] = {
+    **{c: PYTEST_FILES for c in PYTEST_COMMANDS},
+    py: UNITTEST_FILES,
+    django: DJANGO_MODULES,
+    go_multi: GO_PACKAGES,
+    rust: CARGO_CRATES,
+    npm: JS_SPEC_FILES,
+    yarn: JS_SPEC_FILES,
+    pnpm: JS_SPEC_FILES,
+    bun: JS_SPEC_FILES,
+    elixir: EXUNIT_FILES,
+    clojure: CLOJURE_NAMESPACES,
+}
+
+
+def unit_jobs(
+    command: Command, context: Context, units: list[str], durations: dict[str, float]
+) -> list[Job]:
+    """
+    a job per unit, longest-first (by past `durations`) so the slowest units don't start last and hold up the whole run. Units without a recorded duration are assumed to be slow, since they're probably new
+    """
+    ordered = sorted(units, key=lambda u: (-durations.get(u, float("inf")), u))
+    return [
+        Job(unit, UNIT_KINDS[command].build(command, context, [unit]))
+        for unit in ordered
+    ]
+
+
+# pytest exits with this when a file has no tests matching the given args (e.g. `-k`)
+PYTEST_NO_TESTS_COLLECTED = 5
+
+
+def units_returncode(command: Command, results: list[JobResult]) -> int:
+    """
+    like `aggregate_returncode`, but a pytest file that collected nothing isn't a failure (unless no file collected anything)
+    """
+    if command in PYTEST_COMMANDS:
+        if results and all(r.returncode == PYTEST_NO_TESTS_COLLECTED for r in results):
+            return PYTEST_NO_TESTS_COLLECTED
+        results = [r for r in results if r.returncode != PYTEST_NO_TESTS_COLLECTED]
+    return aggregate_returncode(results)
@@ -0,0 +1,89 @@
+"""
+Keeps compiled test binaries up to date in the background, so the next `t` only has to run them rather than build them first.
+
+Builds run at the lowest CPU priority, so they don't get in the way of whatever else is happening. If more edits come in while a build is running, it's restarted.
+"""
+
+import os
+import subprocess
+from typing import Optional
+
+from universal_test_runner.commands import Command, go_multi, go_single, rust
+from universal_test_runner.context import Context
+from universal_test_runner.watch import (
+    Change,
+    Inotify,
+    print_status,
+    stop_process_group,
+    wait_for_changes,
+)
+
+# the files that can affect each build
+SOURCES: dict[Command, tuple[str, ...]] = {
+    rust: (".rs", "Cargo.toml", "Cargo.lock", "build.rs"),
+    go_multi: (".go", "go.mod", "go.sum"),
+    go_single: (".go", "go.mod", "go.sum"),
+}
+
+
+def build_command(command: Command, context: Context) -> Optional[list[str]]:
+    """
+    the argv that compiles (but doesn't run) this command's tests, with the same args that `t` would get. `None` if there's nothing to compile
+    """
+    if command == rust:
+        return [*command.test_command, "--no-run", *context.args]
+    if command in (go_multi, go_single):
+        # go can only build multiple test binaries by running them, so it runs them without any tests
+        packages = ["./..."] if command == go_multi else []
+        return ["go", "test", "-run", "^$", *context.args, *packages]
+    return None
+
+
+def _lower_priority():
+    os.nice(19)
+
+
+def _start(argv: list[str], cwd: str) -> subprocess.Popen:
+    print_status("warm", " ".join(argv))
+    return subprocess.Popen(
+        argv,
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        preexec_fn=_lower_priority,
+    )
+
+
+def keep_warm(command: Optional[Command], context: Context) -> int:
+    """
+    build the tests, then rebuild them whenever a source file changes. Runs until interrupted
+    """
+    if not command or not (argv := build_command(command, context)):
+        print(
+            f"there's nothing to precompile for {command.name if command else 'this project'} (only cargo and go tests are supported)"
+        )
+        return 1
+
+    try:
+        inotify = Inotify(context.cwd)
+    except (AttributeError, OSError) as e:
+        print(f"warming needs inotify, which isn't available here: {e}")
+        return 1
+
+    def _is_source(change: Change) -> bool:
+        return change.path.endswith(SOURCES[command])
+
+    proc = _start(argv, context.cwd)
+    try:
+        while True:
+            wait_for_changes(inotify, _is_source, proc, "warm")
+            if proc.poll() is None:
+                print_status("warm", "sources changed, restarting the build")
+                stop_process_group(proc)
+            proc = _start(argv, context.cwd)
+    except KeyboardInterrupt:
+        stop_process_group(proc)
+        return 130
+    finally:
+        inotify.close()
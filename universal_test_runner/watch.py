@@ -0,0 +1,310 @@
+"""
+Re-runs tests whenever files change, using Linux's inotify directly (through `ctypes`), so there's nothing extra to install.
+
+Each run happens in a child `t` process (with `UTR_COMMAND` set, so it skips detection), which is killed if more changes come in before it finishes. Detection is only repeated when one of the files it looked at changes.
+"""
+
+import ctypes
+import os
+import select
+import signal
+import struct
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from colorama import Style
+
+from universal_test_runner.affected import PYTHON_SKIP_DIRS
+from universal_test_runner.commands import (
+    Command,
+    clear_detection_caches,
+    find_command,
+)
+from universal_test_runner.context import Context
+
+# from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+# version control, dependencies, caches, and build outputs. Hidden directories are skipped too
+IGNORED_DIRS = {
+    # the same ones the import graph leaves out, like a `venv` that pip is installing into
+    *PYTHON_SKIP_DIRS,
+    "target",
+    "_build",
+    "deps",
+    "coverage",
+    "htmlcov",
+}
+IGNORED_SUFFIXES = (".pyc", ".swp", ".swx", "~", ".tmp")
+
+# how long (in seconds) things must be quiet before a burst of changes counts as finished
+DEBOUNCE = 0.2
+# how long a cancelled run gets to clean up before it's killed outright
+STOP_TIMEOUT = 5
+
+
+@dataclass(frozen=True)
+class Change:
+    path: str
+    """
+    relative to the watched directory
+    """
+    kind: str
+    """
+    `"created"`, `"deleted"`, or `"modified"`. Renames are a deletion of the old path and a creation of the new one
+    """
+
+    @property
+    def structural(self) -> bool:
+        """
+        whether the set of files changed, rather than just their contents
+        """
+        return self.kind != "modified"
+
+
+def is_ignored(path: str) -> bool:
+    """
+    whether a path is never worth re-running tests for. Top-level hidden files aren't ignored here, since detection might look at them (like `.justfile`)
+    """
+    *dirs, name = path.split("/")
+    if name in IGNORED_DIRS or any(
+        d in IGNORED_DIRS or d.startswith(".") for d in dirs
+    ):
+        return True
+    if dirs and name.startswith("."):
+        return True
+    return name.endswith(IGNORED_SUFFIXES) or name.startswith(".#")
+
+
+class Inotify:
+    """
+    Watches a directory tree, including directories created after it started
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs: dict[int, str] = {}
+        self.add_tree("")
+
+    def close(self):
+        os.close(self.fd)
+
+    def add_tree(self, relative: str):
+        for dirpath, dirnames, _ in os.walk(os.path.join(self.root, relative)):
+            dirnames[:] = [
+                d for d in dirnames if d not in IGNORED_DIRS and not d.startswith(".")
+            ]
+            rel = os.path.relpath(dirpath, self.root)
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(dirpath), ctypes.c_uint32(WATCH_MASK)
+            )
+            # the directory may already be gone, or we're out of watches. Either way, carry on
+            if wd >= 0:
+                self.dirs[wd] = "" if rel == "." else rel.replace(os.sep, "/")
+
+    def read(self, timeout: Optional[float]) -> Optional[list[Change]]:
+        """
+        changes since the last read, waiting up to `timeout` seconds for the first one. `None` means the kernel dropped events, so anything could have changed
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changes = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd not in self.dirs or not name:
+                continue
+
+            path = f"{self.dirs[wd]}/{name}" if self.dirs[wd] else name
+            if is_ignored(path):
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(path)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                kind = "created"
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                kind = "deleted"
+            else:
+                kind = "modified"
+            changes.append(Change(path, kind))
+        return changes
+
+
+def is_relevant(change: Change, context: Context) -> bool:
+    # top-level hidden files are usually tool state (like `.coverage`), unless detection cared about them
+    return not change.path.startswith(".") or change.path in context.consulted
+
+
+def needs_detection(changes: Optional[list[Change]], context: Context) -> bool:
+    """
+    whether the changes could affect which command runs. Detection only looks at the top-level directory: which files exist, and the contents of some
+    """
+    if changes is None:
+        return True
+    return any(
+        "/" not in c.path and (c.structural or c.path in context.consulted)
+        for c in changes
+    )
+
+
+def _detect(context: Context, previous: Optional[Command] = None) -> Optional[Command]:
+    clear_detection_caches()
+    command = find_command(context)
+    if not command:
+        print("no testing method found! Waiting for changes...", flush=True)
+    elif command != previous:
+        print_status("watch", f"using {command.name}")
+    return command
+
+
+def only_tool_state(changes: Optional[list[Change]]) -> bool:
+    """
+    whether every change was to a top-level hidden file. Runners create those themselves (like `.pytest_cache`), so they're only worth a re-run if they change which command runs
+    """
+    return bool(changes) and all(c.path.startswith(".") for c in changes or [])
+
+
+def print_status(label: str, message: str):
+    print(Style.DIM + f"-> [{label}] {message}" + Style.RESET_ALL, flush=True)
+
+
+def _start(command: Command, context: Context) -> subprocess.Popen:
+    env = {**os.environ, "UTR_COMMAND": command.name}
+    env.pop("UTR_WATCH", None)
+    # in its own process group, so the whole tree can be stopped
+    return subprocess.Popen(
+        [sys.executable, "-m", "universal_test_runner.runner", *context.args],
+        cwd=context.cwd,
+        env=env,
+        start_new_session=True,
+    )
+
+
+def stop_process_group(proc: subprocess.Popen):
+    """
+    stop a process started with `start_new_session`, along with everything it started
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+    except ProcessLookupError:
+        pass
+
+
+def wait_for_changes(
+    inotify: Inotify,
+    keep: Callable[[Change], bool],
+    proc: Optional[subprocess.Popen],
+    label: str,
+) -> Optional[list[Change]]:
+    """
+    block until something worth `keep`ing changes, then keep collecting until things have been quiet for a moment. `None` means anything could have changed. Reports when `proc` finishes in the meantime
+    """
+    changes: list[Change] = []
+    overflowed = False
+
+    def _collect(timeout: Optional[float]) -> bool:
+        nonlocal overflowed
+        if (batch := inotify.read(timeout)) is None:
+            overflowed = True
+            return True
+        kept = [c for c in batch if keep(c)]
+        changes.extend(kept)
+        return bool(kept)
+
+    while not changes and not overflowed:
+        _collect(0.1)
+        if proc and proc.poll() is not None:
+            print_status(
+                label, f"finished with exit code {proc.returncode}, waiting for changes"
+            )
+            proc = None
+
+    deadline = time.monotonic() + DEBOUNCE
+    while (remaining := deadline - time.monotonic()) > 0:
+        if _collect(remaining):
+            deadline = time.monotonic() + DEBOUNCE
+
+    return None if overflowed else _without_temporary_files(changes, inotify.root)
+
+
+def _without_temporary_files(changes: list[Change], root: str) -> list[Change]:
+    # tools often write to a temp file and rename it into place, which isn't worth reacting to
+    first_seen: dict[str, Change] = {}
+    for c in changes:
+        first_seen.setdefault(c.path, c)
+    return [
+        c
+        for c in changes
+        if first_seen[c.path].kind != "created"
+        or os.path.lexists(os.path.join(root, c.path))
+    ]
+
+
+def watch(context: Context) -> int:
+    """
+    run the tests, then run them again whenever a file changes. Runs until interrupted
+    """
+    try:
+        inotify = Inotify(context.cwd)
+    except (AttributeError, OSError) as e:
+        print(f"watch mode needs inotify, which isn't available here: {e}")
+        return 1
+
+    command = _detect(context)
+    proc = _start(command, context) if command else None
+    try:
+        while True:
+            changes = wait_for_changes(
+                inotify, lambda c: is_relevant(c, context), proc, "watch"
+            )
+
+            previous = command
+            if needs_detection(changes, context):
+                context = Context.build(context.cwd, list(context.args))
+                command = _detect(context, previous)
+            if command == previous and only_tool_state(changes):
+                continue
+
+            if proc and proc.poll() is None:
+                print_status("watch", "files changed, restarting")
+                stop_process_group(proc)
+            proc = _start(command, context) if command else None
+    except KeyboardInterrupt:
+        if proc and proc.poll() is None:
+            stop_process_group(proc)
+        return 130
+    finally:
+        inotify.close()
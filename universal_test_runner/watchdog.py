@@ -0,0 +1,219 @@
+"""
+Stops a test run that's taking too long (`UTR_TIMEOUT`) or hasn't printed anything in a while (`UTR_IDLE_TIMEOUT`), which usually means something is hung.
+
+Every way of running tests uses it (besides the warm pytest server, which is skipped while a limit is set): the single command, each job of a parallel run, and each run that reports per-test results. The command runs in its own session, so everything it starts (like go test binaries or node workers) can be stopped together, even the processes that outlived their parents. They get `SIGTERM` first, to clean up after themselves, then `SIGKILL` if they're still around a little later. Just before that, a snapshot of the processes is taken from `/proc` (so on Linux only) to show what was stuck.
+"""
+
+import os
+import signal
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+
+from colorama import Style
+
+from universal_test_runner.settings import env_int
+
+# seconds between asking processes to stop and making them
+KILL_GRACE = 10
+# the exit code for a stopped run, same as coreutils' `timeout`
+TIMED_OUT = 124
+# seconds between checks, for commands whose output isn't being read in a loop that can do them
+CHECK_INTERVAL = 0.1
+
+STATES = {
+    "R": "running",
+    "S": "sleeping",
+    "D": "disk wait",
+    "Z": "zombie",
+    "T": "stopped",
+    "t": "traced",
+    "I": "idle",
+}
+
+
+@dataclass(frozen=True)
+class ProcessInfo:
+    pid: int
+    ppid: int
+    state: str
+    cpu_seconds: float
+    waiting_on: str
+    command: str
+
+
+def _read_process(pid: int, session: int) -> Optional[ProcessInfo]:
+    proc = f"/proc/{pid}"
+    try:
+        with open(f"{proc}/stat") as f:
+            stat = f.read()
+        # the command name is in parens and may contain spaces (or parens)
+        start, end = stat.index("("), stat.rindex(")")
+        name, fields = stat[start + 1 : end], stat[end + 2 :].split()
+        if int(fields[3]) != session:
+            return None
+        with open(f"{proc}/cmdline", "rb") as f:
+            command = f.read().replace(b"\0", b" ").decode(errors="replace").strip()
+        try:
+            with open(f"{proc}/wchan") as f:
+                waiting_on = f.read().strip()
+        except OSError:
+            waiting_on = ""
+    except (OSError, ValueError, IndexError):
+        # it exited while being read
+        return None
+
+    return ProcessInfo(
+        pid=pid,
+        ppid=int(fields[1]),
+        state=STATES.get(fields[0], fields[0]),
+        cpu_seconds=(int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK"),
+        waiting_on="" if waiting_on == "0" else waiting_on,
+        command=command or f"[{name}]",
+    )
+
+
+def snapshot(session: int) -> list[ProcessInfo]:
+    """
+    every process in `session`, parents before their children. Empty where there's no `/proc`
+    """
+    try:
+        pids = [int(entry) for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return []
+
+    processes = {
+        info.pid: info for pid in pids if (info := _read_process(pid, session))
+    }
+    ordered: list[ProcessInfo] = []
+
+    def _visit(info: ProcessInfo):
+        ordered.append(info)
+        for child in processes.values():
+            if child.ppid == info.pid:
+                _visit(child)
+
+    # orphans were adopted by a process outside the session, so they're roots too
+    for info in processes.values():
+        if info.ppid not in processes:
+            _visit(info)
+    return ordered
+
+
+def _depths(processes: list[ProcessInfo]) -> dict[int, int]:
+    depths: dict[int, int] = {}
+    for info in processes:
+        depths[info.pid] = depths.get(info.ppid, -1) + 1
+    return depths
+
+
+def signal_session(session: int, signum: int):
+    # the session leader's pid is also its process group's id
+    try:
+        os.killpg(session, signum)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+@dataclass
+class Watchdog:
+    """
+    Keeps track of a run's limits (in seconds, where 0 means no limit), and stops it once one is hit.
+    """
+
+    timeout: int
+    idle_timeout: int
+    started: float = field(default_factory=time.monotonic)
+    last_output: float = field(default_factory=time.monotonic)
+    reason: Optional[str] = None
+    processes: list[ProcessInfo] = field(default_factory=list)
+    stopped_at: Optional[float] = None
+    killed: bool = False
+
+    def output(self, now: float):
+        self.last_output = now
+
+    def _limit_hit(self, now: float) -> Optional[str]:
+        if self.timeout and now - self.started >= self.timeout:
+            return f"it took longer than {self.timeout}s"
+        if self.idle_timeout and now - self.last_output >= self.idle_timeout:
+            return f"it printed nothing for {self.idle_timeout}s"
+        return None
+
+    def check(self, session: int, now: float):
+        """
+        stop the processes in `session` if a limit was just hit, or force them if they had their chance
+        """
+        if self.stopped_at is None:
+            if reason := self._limit_hit(now):
+                self.reason = reason
+                self.processes = snapshot(session)
+                signal_session(session, signal.SIGTERM)
+                self.stopped_at = now
+        elif not self.killed and now - self.stopped_at >= KILL_GRACE:
+            signal_session(session, signal.SIGKILL)
+            self.killed = True
+
+    def finish(self, session: int):
+        """
+        once the command itself has exited (and been waited on), make sure nothing it started outlives it, whether or not the run was stopped
+        """
+        signal_session(session, signal.SIGKILL)
+
+
+def is_supported() -> bool:
+    return hasattr(os, "killpg")
+
+
+def watchdog_from_env() -> Optional[Watchdog]:
+    """
+    a new watchdog for the limits in `UTR_TIMEOUT` and `UTR_IDLE_TIMEOUT`, or `None` if neither is set (or processes can't be stopped as a group here)
+    """
+    timeout = max(env_int("UTR_TIMEOUT", 0), 0)
+    idle_timeout = max(env_int("UTR_IDLE_TIMEOUT", 0), 0)
+    if not (timeout or idle_timeout) or not is_supported():
+        return None
+    return Watchdog(timeout, idle_timeout)
+
+
+@contextmanager
+def guarding(watchdog: Watchdog, session: int) -> Iterator[None]:
+    """
+    check `watchdog` on a background thread for as long as this is open. Close it only once the command has been waited on, since that's when whatever it left behind in `session` is stopped
+    """
+    done = threading.Event()
+
+    def _check():
+        while not done.wait(CHECK_INTERVAL):
+            watchdog.check(session, time.monotonic())
+
+    thread = threading.Thread(target=_check, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+        watchdog.finish(session)
+
+
+def print_report(watchdog: Watchdog):
+    print(
+        Style.DIM
+        + f"-> the tests were stopped because {watchdog.reason}"
+        + Style.RESET_ALL,
+        flush=True,
+    )
+    if not watchdog.processes:
+        return
+
+    depths = _depths(watchdog.processes)
+    print(Style.DIM + "-> processes at the time:" + Style.RESET_ALL)
+    print(f"   {'pid':>7}  {'state':<9}  {'cpu':>8}  {'waiting on':<18}  command")
+    for info in watchdog.processes:
+        print(
+            f"   {info.pid:>7}  {info.state:<9}  {info.cpu_seconds:>7.2f}s  {info.waiting_on or '-':<18}  {'  ' * depths[info.pid]}{info.command}"
+        )
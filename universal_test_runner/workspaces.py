@@ -0,0 +1,217 @@
+"""
+Support for running the tests of each package in a JS monorepo (npm/yarn `workspaces` or `pnpm-workspace.yaml`).
+"""
+
+import json
+import re
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from universal_test_runner.cache import mtime_key, read_cache, write_cache
+from universal_test_runner.context import Context
+from universal_test_runner.parallel import Job
+
+PNPM_WORKSPACE = "pnpm-workspace.yaml"
+# a change to any of these can add or remove workspace members
+ROOT_MANIFESTS = (
+    "package.json",
+    PNPM_WORKSPACE,
+    "package-lock.json",
+    "yarn.lock",
+    "pnpm-lock.yaml",
+)
+DEPENDENCY_KEYS = (
+    "dependencies",
+    "devDependencies",
+    "peerDependencies",
+    "optionalDependencies",
+)
+
+
+@dataclass(frozen=True)
+class Workspace:
+    name: str
+    path: str
+    """
+    relative to the workspace root
+    """
+    has_test: bool
+    dependencies: tuple[str, ...]
+    """
+    names of the other workspace members this one depends on
+    """
+
+
+def _pnpm_patterns(lines: list[str]) -> list[str]:
+    """
+    a deliberately small reader for the `packages:` list in `pnpm-workspace.yaml`, so we don't need a YAML parser
+    """
+    patterns: list[str] = []
+    in_packages = False
+    for line in lines:
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+
+        if not line[0].isspace():
+            in_packages = line.startswith("packages:")
+            continue
+
+        if in_packages and (match := re.match(r"\s*-\s*(.+?)\s*(#.*)?$", line)):
+            patterns.append(match.group(1).strip("'\""))
+
+    return patterns
+
+
+def workspace_patterns(context: Context) -> list[str]:
+    if patterns := _pnpm_patterns(context.read_file(PNPM_WORKSPACE)):
+        return patterns
+
+    workspaces = context.read_json("package.json").get("workspaces", [])
+    # yarn classic also allows `{"packages": [...], "nohoist": [...]}`
+    if isinstance(workspaces, dict):
+        workspaces = workspaces.get("packages", [])
+    if not isinstance(workspaces, list):
+        return []
+    return [w for w in workspaces if isinstance(w, str)]
+
+
+def _member_paths(cwd: str, patterns: list[str]) -> list[str]:
+    root = Path(cwd)
+    included: set[Path] = set()
+    excluded: set[Path] = set()
+    for pattern in patterns:
+        target = excluded if pattern.startswith("!") else included
+        for p in root.glob(pattern.lstrip("!").rstrip("/")):
+            if "node_modules" not in p.parts and (p / "package.json").is_file():
+                target.add(p)
+
+    return sorted(p.relative_to(root).as_posix() for p in included - excluded)
+
+
+def _read_manifest(cwd: str, path: str) -> dict:
+    try:
+        manifest = json.loads(Path(cwd, path, "package.json").read_text("utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def _build_workspaces(cwd: str, paths: list[str]) -> list[Workspace]:
+    manifests = {path: _read_manifest(cwd, path) for path in paths}
+    names = {path: m.get("name") or path for path, m in manifests.items()}
+    member_names = set(names.values())
+
+    workspaces = []
+    for path, manifest in manifests.items():
+        deps: set[str] = set()
+        for key in DEPENDENCY_KEYS:
+            if isinstance(section := manifest.get(key), dict):
+                deps.update(section)
+
+        scripts = manifest.get("scripts")
+        workspaces.append(
+            Workspace(
+                names[path],
+                path,
+                has_test=isinstance(scripts, dict) and bool(scripts.get("test")),
+                dependencies=tuple(sorted((deps & member_names) - {names[path]})),
+            )
+        )
+    return workspaces
+
+
+def find_workspaces(context: Context) -> list[Workspace]:
+    """
+    every member of the workspace, plus the names of the other members it depends on.
+
+    The graph is cached between runs and is only rebuilt when a manifest changes or a member is added or removed.
+    """
+    # globbing is cheap next to reading every manifest, and catches new members that match an existing pattern
+    paths = _member_paths(context.cwd, workspace_patterns(context))
+    root_key = mtime_key(context.cwd, ROOT_MANIFESTS)
+    # keyed by each member's path too, so this changes when the set of members does
+    members_key = mtime_key(context.cwd, [f"{p}/package.json" for p in paths])
+    cached = read_cache("js-workspaces", context.cwd, root_key)
+    if isinstance(cached, dict) and cached.get("members_key") == members_key:
+        try:
+            workspaces = [
+                Workspace(**{**w, "dependencies": tuple(w["dependencies"])})
+                for w in cached["workspaces"]
+            ]
+        except (KeyError, TypeError):
+            # written by another version, so it's rebuilt like any other miss
+            context.debug("ignoring an unreadable cached workspace graph")
+        else:
+            context.debug("using cached workspace graph")
+            return workspaces
+
+    context.debug("building workspace graph")
+    workspaces = _build_workspaces(context.cwd, paths)
+    write_cache(
+        "js-workspaces",
+        context.cwd,
+        root_key,
+        {
+            "members_key": members_key,
+            "workspaces": [asdict(w) for w in workspaces],
+        },
+    )
+    return workspaces
+
+
+def _without_cycles(workspaces: list[Workspace]) -> list[Workspace]:
+    """
+    workspaces whose dependencies form a cycle can't be ordered, so they lose their ordering constraints rather than waiting on each other forever
+    """
+    remaining = {w.name: set(w.dependencies) for w in workspaces}
+    while ready := [name for name, deps in remaining.items() if not deps]:
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+
+    # anything left over is in (or waiting on) a cycle
+    return [
+        Workspace(w.name, w.path, w.has_test, ()) if w.name in remaining else w
+        for w in workspaces
+    ]
+
+
+def workspace_jobs(context: Context, package_manager: str) -> Optional[list[Job]]:
+    """
+    a job for every workspace member with a `test` script, run from that member's directory.
+
+    Returns `None` if this isn't a workspace (or no member has tests), so the caller can run the root's tests instead.
+    """
+    if not workspace_patterns(context):
+        return None
+
+    workspaces = _without_cycles(find_workspaces(context))
+    by_name = {w.name: w for w in workspaces}
+
+    def _tested_dependencies(w: Workspace) -> set[str]:
+        # members without tests don't get a job, so wait on whatever _they_ depend on instead
+        found: set[str] = set()
+        stack, seen = list(w.dependencies), set()
+        while stack:
+            if (name := stack.pop()) in seen or name not in by_name:
+                continue
+            seen.add(name)
+            if by_name[name].has_test:
+                found.add(name)
+            else:
+                stack.extend(by_name[name].dependencies)
+        return found
+
+    jobs = [
+        Job(
+            w.name,
+            [package_manager, "test", *context.args],
+            cwd=str(Path(context.cwd, w.path)),
+            dependencies=tuple(sorted(_tested_dependencies(w))),
+        )
+        for w in workspaces
+        if w.has_test
+    ]
+    return jobs or None